@@ -0,0 +1,168 @@
+"""
+Cache of model answers, keyed by document fingerprint and normalized question.
+
+Lookups try an exact match on the normalized question first. They then try a
+near-duplicate match: a cached question of the same document whose token set is
+similar enough and that has the same numbers, question words and negations. Entries expire after a TTL,
+and the least recently used ones are evicted once the cache exceeds its size in bytes.
+"""
+import collections
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from retrieval import tokenize
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_APOSTROPHE = re.compile(r"'\w*")
+_NEGATED = [(re.compile(r"\bcan't\b"), "cannot"), (re.compile(r"\bwon't\b"), "will not"), (re.compile(r"n't\b"), " not")]
+
+# Words that change how a question is phrased but not what it asks
+QUESTION_FILLER = frozenset("""
+about can could do does explain give help know me please say tell us want would
+""".split())
+# Words that change what a question asks; "Why did Rome fall?" and "When did Rome fall?" differ only here
+QUESTION_WORDS = frozenset("how why what when where which who whom whose".split())
+NEGATIONS = frozenset("not no never nor cannot without".split())
+_KEY_WORDS = QUESTION_WORDS | NEGATIONS
+
+
+def normalize_question(question):
+    """Lowercase, spell out negations, drop punctuation and collapse whitespace."""
+    question = question.lower().replace("\u2019", "'")
+    for pattern, replacement in _NEGATED:
+        question = pattern.sub(replacement, question)
+    question = _APOSTROPHE.sub("", question)
+    return " ".join(_PUNCTUATION.sub(" ", question).split())
+
+
+def _similarity(tokens_a, tokens_b):
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+class AnswerCache:
+    def __init__(self, max_bytes=1000000, ttl=24 * 3600, similarity=0.8, path=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.similarity = similarity
+        self.path = path
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def get(self, fingerprint, question):
+        """Return a cached answer for the question, or None."""
+        normalized = normalize_question(question)
+        with self._lock:
+            self._expire()
+            key = (fingerprint, normalized)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]["answer"]
+            key = self._find_near_duplicate(fingerprint, normalized)
+            if key is not None:
+                self._entries.move_to_end(key)
+                self.near_hits += 1
+                return self._entries[key]["answer"]
+            self.misses += 1
+            return None
+
+    def put(self, fingerprint, question, answer):
+        normalized = normalize_question(question)
+        entry = {"answer": answer, "created": time.time(), "size": len(normalized.encode()) + len(answer.encode())}
+        with self._lock:
+            key = (fingerprint, normalized)
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)["size"]
+            self._entries[key] = entry
+            self._bytes += entry["size"]
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["size"]
+                self.evictions += 1
+        if self.path:
+            self.save()
+
+    def invalidate(self, keep_fingerprint=None):
+        """Drop every entry, or every entry not belonging to `keep_fingerprint`."""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] != keep_fingerprint:
+                    self._bytes -= self._entries.pop(key)["size"]
+        if self.path:
+            self.save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+    def save(self):
+        """Write the cache to `path` atomically."""
+        with self._lock:
+            records = [[fingerprint, question, entry] for (fingerprint, question), entry in self._entries.items()]
+        # A temp file of its own, so concurrent saves never rename each other's
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(records, f)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[DEBUG] Ignoring unreadable answer cache {self.path}: {e}")
+            return
+        for fingerprint, question, entry in records:
+            self._entries[(fingerprint, question)] = entry
+            self._bytes += entry["size"]
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for key in [key for key, entry in self._entries.items() if entry["created"] < cutoff]:
+            self._bytes -= self._entries.pop(key)["size"]
+
+    def _find_near_duplicate(self, fingerprint, normalized):
+        tokens = set(tokenize(normalized)) - QUESTION_FILLER
+        numbers = {token for token in tokens if token.isdigit()}
+        # tokenize() drops question words as stopwords; they must match exactly, like numbers
+        key_words = _KEY_WORDS.intersection(normalized.split())
+        best_key, best_score = None, self.similarity
+        for key in self._entries:
+            if key[0] != fingerprint:
+                continue
+            cached_tokens = set(tokenize(key[1])) - QUESTION_FILLER
+            # "question 4" and "question 5" must never share an answer
+            if {token for token in cached_tokens if token.isdigit()} != numbers:
+                continue
+            if _KEY_WORDS.intersection(key[1].split()) != key_words:
+                continue
+            score = _similarity(tokens, cached_tokens)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
@@ -0,0 +1,24 @@
+import audioop
+import wave
+
+# Sample rate the recognizers are given
+PCM_RATE = 16000
+
+
+def read_wav(path, rate=PCM_RATE):
+    """Return mono 16-bit PCM at `rate` for a WAV file, converting if needed."""
+    with wave.open(path, 'rb') as wf:
+        channels = wf.getnchannels()
+        width = wf.getsampwidth()
+        source_rate = wf.getframerate()
+        data = wf.readframes(wf.getnframes())
+    if width != 2:
+        data = audioop.lin2lin(data, width, 2)
+    if channels == 2:
+        data = audioop.tomono(data, 2, 0.5, 0.5)
+    elif channels != 1:
+        raise ValueError(f"{path}: unsupported channel count {channels}")
+    if source_rate != rate:
+        data, _ = audioop.ratecv(data, 2, 1, source_rate, rate, None)
+    return data
+
@@ -1,22 +1,48 @@
 import os
 import queue
-import pyaudio
 import audioop
-import wave
 import threading
 import time
-from google.cloud import speech
+from capture import DEFAULT_PROFILE, StreamEncoder, encode_audio, get_profile
+from clients import default_registry
+from recognizers import DEFAULT_RECOGNIZER, google_transcripts, make_recognizer
+from tracing import default_tracer
+from vad import UtteranceSegmenter
 
-# Audio recording parameters
-RATE = 16000
-CHUNK = int(RATE / 10)  # 100ms
-RECORD_SECONDS = 5  # Record in 5-second chunks for transcription
+try:
+    import pyaudio
+    PYAUDIO_AVAILABLE = True
+except ImportError:
+    # Headless servers receive audio over the network and need no audio devices
+    PYAUDIO_AVAILABLE = False
+
+# Rate, chunk size, device format and upload codec come from a CaptureProfile (capture.py)
+STREAMING_LIMIT = 290  # Reopen streams before Google's ~305 second per-stream cap
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
 
 class ContinuousRecorder:
-    """Records audio continuously and processes it in chunks."""
-    def __init__(self, rate, chunk, device_index=None):
-        self._rate = rate
-        self._chunk = chunk
+    """Records audio continuously and processes it one utterance at a time.
+
+    The capture thread reads the microphone, splits the audio into utterances with
+    an energy-based segmenter and queues them as windows; silence is skipped. A pool
+    of worker threads transcribes them. When the queue is full the drop policy decides
+    what happens: "drop_oldest" discards the oldest pending window, "drop_newest"
+    discards the incoming one and "block" makes capture wait for a free slot.
+    Transcripts are always delivered in capture order. Windows are transcribed by
+    `recognizer` (see recognizers.py), Google Cloud Speech by default, and uploaded
+    in the recognizer's encoding.
+
+    The capture `profile` (a CaptureProfile or preset name) sets the device format,
+    the chunk size and the rate the windows are converted to.
+    """
+    def __init__(self, profile=DEFAULT_PROFILE, device_index=None, num_workers=2, max_pending=4,
+                 drop_policy="drop_oldest", segmenter_options=None, registry=None, recognizer=None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self._profile = get_profile(profile)
+        self._rate = self._profile.rate
+        self._chunk = self._profile.chunk
         self._device_index = device_index
         self._audio_interface = None
         self._audio_stream = None
@@ -26,6 +52,22 @@ class ContinuousRecorder:
         self._transcription_callback = None
         self._error_callback = None
         self._recording_thread = None
+        self._num_workers = num_workers
+        self._drop_policy = drop_policy
+        self._segmenter_options = segmenter_options or {}
+        self._recognizer = recognizer or make_recognizer(registry=registry, rate=self._rate,
+                                                         encoding=self._profile.codec)
+        self._windows = queue.Queue(maxsize=max_pending)
+        self._workers = []
+        self._stats_lock = threading.Lock()
+        self._submitted = 0
+        self._in_flight = 0
+        self._dropped = 0
+        self._completed = 0
+        self._order_lock = threading.Lock()
+        self._results = {}
+        self._next_seq = 0
+        self._delivering = False
 
     def start_recording(self, transcription_callback, error_callback, volume_callback):
         """Start continuous recording."""
@@ -33,6 +75,12 @@ class ContinuousRecorder:
         self._error_callback = error_callback
         self._volume_callback = volume_callback
         self._recording = True
+        self._workers = [
+            threading.Thread(target=self._worker_loop, daemon=True)
+            for _ in range(self._num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
         self._recording_thread = threading.Thread(target=self._record_loop)
         self._recording_thread.start()
 
@@ -45,104 +93,168 @@ class ContinuousRecorder:
         if self._audio_interface:
             self._audio_interface.terminate()
 
+    def stats(self):
+        """Return counters for queued, in-flight, dropped and completed windows."""
+        with self._stats_lock:
+            return {
+                "queued": self._windows.qsize(),
+                "in_flight": self._in_flight,
+                "dropped": self._dropped,
+                "submitted": self._submitted,
+                "completed": self._completed,
+            }
+
     def _record_loop(self):
-        """Main recording loop that records in chunks and transcribes."""
+        """Main recording loop that reads the microphone and queues windows for transcription."""
         try:
             self._audio_interface = pyaudio.PyAudio()
             self._audio_stream = self._audio_interface.open(
                 format=pyaudio.paInt16,
-                channels=1,
-                rate=self._rate,
+                channels=self._profile.channels,
+                rate=self._profile.capture_rate,
                 input=True,
                 frames_per_buffer=self._chunk,
                 input_device_index=self._device_index,
             )
+            converter = self._profile.converter()
 
-            chunk_count = 0
-            frames_buffer = []
+            segmenter = UtteranceSegmenter(chunk_seconds=self._profile.chunk_seconds, **self._segmenter_options)
             
             while self._recording:
                 try:
                     data = self._audio_stream.read(self._chunk, exception_on_overflow=False)
-                    frames_buffer.append(data)
+                    if converter is not None:
+                        data = converter.convert(data)
                     
-                    # Calculate volume
+                    # Calculate volume; the same energy drives utterance detection
+                    rms = audioop.rms(data, 2)
                     if self._volume_callback:
-                        rms = audioop.rms(data, 2)
                         self._volume_callback(rms)
                     
-                    chunk_count += 1
-                    
-                    # Process every 5 seconds (50 chunks at 100ms each)
-                    if chunk_count >= 50:  # 5 seconds worth of chunks
-                        if frames_buffer:
-                            # Transcribe the accumulated audio
-                            self._transcribe_chunk(frames_buffer)
-                            frames_buffer = []
-                        chunk_count = 0
+                    # Hand each finished utterance to the transcription workers
+                    default_tracer.count("capture.bytes", len(data))
+                    with default_tracer.span("capture.segment"):
+                        utterance = segmenter.feed(data, rms)
+                    if utterance:
+                        self._submit_window(utterance.frames)
                         
                 except Exception as e:
                     if self._error_callback:
                         self._error_callback(f"Recording error: {e}")
                     break
                     
+            utterance = segmenter.flush()
+            if utterance:
+                self._submit_window(utterance.frames)
+                    
         except Exception as e:
             if self._error_callback:
                 self._error_callback(f"Failed to start recording: {e}")
+        finally:
+            # Let the workers finish pending windows, then exit
+            for _ in self._workers:
+                self._windows.put(None)
+
+    def _submit_window(self, frames):
+        """Queue a window for transcription, applying the drop policy when the queue is full."""
+        with self._stats_lock:
+            seq = self._submitted
+            self._submitted += 1
+        window = (seq, frames, time.perf_counter())
+        while True:
+            try:
+                if self._drop_policy == "block":
+                    self._windows.put(window, timeout=0.1)
+                else:
+                    self._windows.put_nowait(window)
+                return
+            except queue.Full:
+                if self._drop_policy == "block":
+                    if not self._recording:
+                        self._drop_window(seq)
+                        return
+                    continue
+                if self._drop_policy == "drop_newest":
+                    self._drop_window(seq)
+                    return
+                try:
+                    oldest_seq = self._windows.get_nowait()[0]
+                    self._drop_window(oldest_seq)
+                except queue.Empty:
+                    pass
+
+    def _drop_window(self, seq):
+        with self._stats_lock:
+            self._dropped += 1
+        self._deliver(seq, [])
+
+    def _worker_loop(self):
+        """Pull windows off the queue and transcribe them until told to stop."""
+        while True:
+            window = self._windows.get()
+            if window is None:
+                return
+            seq, frames, queued = window
+            # How long the utterance waited for a free worker
+            default_tracer.record("capture.queue_wait", time.perf_counter() - queued)
+            with self._stats_lock:
+                self._in_flight += 1
+            try:
+                transcripts = self._transcribe_chunk(frames)
+            finally:
+                with self._stats_lock:
+                    self._in_flight -= 1
+                    self._completed += 1
+            self._deliver(seq, transcripts)
+
+    def _deliver(self, seq, transcripts):
+        """Hand results to the transcription callback in capture order."""
+        with self._order_lock:
+            self._results[seq] = transcripts
+            if self._delivering:
+                return
+            self._delivering = True
+        while True:
+            with self._order_lock:
+                if self._next_seq not in self._results:
+                    self._delivering = False
+                    return
+                ready = self._results.pop(self._next_seq)
+                self._next_seq += 1
+            for transcript in ready:
+                if self._transcription_callback:
+                    self._transcription_callback(transcript, True)
 
     def _transcribe_chunk(self, frames):
-        """Transcribe a chunk of audio frames."""
+        """Transcribe a chunk of audio frames and return the non-empty transcripts."""
         try:
-            # Save frames to a temporary WAV file
-            temp_filename = "temp_audio_chunk.wav"
+            # Join the frames in memory, one copy; the raw PCM goes straight to the recognizer
+            content = b''.join(frames)
+            if self._recognizer.encoding != "LINEAR16":
+                content = encode_audio(content, self._recognizer.encoding, self._rate)
             
-            # Remove existing temp file if it exists
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
-                
-            with wave.open(temp_filename, 'wb') as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)  # 16-bit
-                wf.setframerate(self._rate)
-                wf.writeframes(b''.join(frames))
-            
-            # Transcribe using Google Cloud Speech-to-Text
-            client = speech.SpeechClient()
-            with open(temp_filename, 'rb') as audio_file:
-                content = audio_file.read()
-            
-            audio = speech.RecognitionAudio(content=content)
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=self._rate,
-                language_code="en-US",
-                model='video',
-                use_enhanced=True,
-            )
-            
-            response = client.recognize(config=config, audio=audio)
-            
-            # Process results
-            for result in response.results:
-                transcript = result.alternatives[0].transcript
-                if transcript.strip():  # Only process non-empty transcripts
-                    if self._transcription_callback:
-                        self._transcription_callback(transcript, True)
-            
-            # Clean up temporary file
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
+            # Collect results; delivery happens in capture order
+            default_tracer.count("stt.bytes_sent", len(content))
+            with default_tracer.span("stt.recognize"):
+                return self._recognizer.recognize(content)
                 
         except Exception as e:
             if self._error_callback:
                 self._error_callback(f"Transcription error: {e}")
+            return []
 
 class MicrophoneStream:
-    """Opens a recording stream as a generator yielding the audio chunks."""
-    def __init__(self, rate, chunk, device_index=None):
-        self._rate = rate
-        self._chunk = chunk
+    """Opens a recording stream as a generator yielding the audio chunks.
+
+    The device is opened as the capture `profile` says; chunks are yielded as mono
+    16-bit PCM at the profile's rate.
+    """
+    def __init__(self, profile=DEFAULT_PROFILE, device_index=None):
+        self._profile = get_profile(profile)
+        self._rate = self._profile.rate
+        self._chunk = self._profile.chunk
         self._device_index = device_index
+        self._converter = None
         self._buff = queue.Queue()
         self.closed = True
         self.volume_callback = None
@@ -151,13 +263,14 @@ class MicrophoneStream:
         self._audio_interface = pyaudio.PyAudio()
         self._audio_stream = self._audio_interface.open(
             format=pyaudio.paInt16,
-            channels=1,
-            rate=self._rate,
+            channels=self._profile.channels,
+            rate=self._profile.capture_rate,
             input=True,
             frames_per_buffer=self._chunk,
             stream_callback=self._fill_buffer,
             input_device_index=self._device_index,
         )
+        self._converter = self._profile.converter()
         self.closed = False
         return self
 
@@ -170,6 +283,8 @@ class MicrophoneStream:
 
     def _fill_buffer(self, in_data, frame_count, time_info, status_flags):
         """Continuously collect data from the audio stream, into the buffer."""
+        if self._converter is not None:
+            in_data = self._converter.convert(in_data)
         self._buff.put(in_data)
         if self.volume_callback:
             rms = audioop.rms(in_data, 2)  # 2 is the width in bytes
@@ -193,29 +308,149 @@ class MicrophoneStream:
                     break
             yield b''.join(data)
 
+class PushAudioStream(MicrophoneStream):
+    """Audio source fed through write(), e.g. PCM received over the network, instead of a microphone."""
+    def __init__(self, profile=DEFAULT_PROFILE):
+        super().__init__(profile)
+
+    def __enter__(self):
+        self.closed = False
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def write(self, data):
+        self._buff.put(data)
+        if self.volume_callback:
+            self.volume_callback(audioop.rms(data, 2))
+
+    def close(self):
+        """End the audio; the recognizer finishes the current stream and stops."""
+        self.closed = True
+        self._buff.put(None)
+
+class StreamingRecognizer:
+    """Feeds microphone audio into a recognizer backend's stream and reports interim and final results."""
+    def __init__(self, recognizer, audio_stream, streaming_limit=STREAMING_LIMIT):
+        self._recognizer = recognizer
+        self._audio_stream = audio_stream
+        self._streaming_limit = streaming_limit
+        self._running = False
+        self._thread = None
+        self._transcription_callback = None
+        self._error_callback = None
+        self.streams_opened = 0
+
+    def start(self, transcription_callback, error_callback, volume_callback=None):
+        """Start streaming recognition on a background thread."""
+        self._transcription_callback = transcription_callback
+        self._error_callback = error_callback
+        self._audio_stream.volume_callback = volume_callback
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop streaming; the current stream ends after the next audio chunk."""
+        self._running = False
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Open one stream after another until stopped, keeping the microphone open in between."""
+        try:
+            with self._audio_stream as stream:
+                while self._running:
+                    self.streams_opened += 1
+                    default_tracer.count("stt.streams")
+                    results = self._recognizer.stream(self._chunks(stream))
+                    deliver_results(results, self._transcription_callback)
+                    if stream.closed:
+                        break
+        except Exception as e:
+            if self._error_callback:
+                self._error_callback(f"Streaming recognition error: {e}")
+        finally:
+            self._running = False
+
+    def _chunks(self, stream):
+        """Yield audio chunks in the recognizer's encoding until stopped or the per-stream
+        duration limit is reached. Each stream is encoded on its own, header included."""
+        started = time.monotonic()
+        encoder = StreamEncoder(self._recognizer.encoding, self._recognizer.rate)
+        for content in stream.generator():
+            content = encoder.encode(content)
+            if content:
+                default_tracer.count("stt.bytes_sent", len(content))
+                yield content
+            if not self._running:
+                break
+            if time.monotonic() - started >= self._streaming_limit:
+                break
+        content = encoder.close()
+        if content:
+            default_tracer.count("stt.bytes_sent", len(content))
+            yield content
+
+def deliver_results(results, callback):
+    """Send every (transcript, is_final) result of a recognizer stream to the callback.
+
+    The time from the first result of an utterance to its final result is recorded
+    as span "stt.utterance".
+    """
+    utterance_started = None
+    for transcript, is_final in results:
+        if utterance_started is None:
+            utterance_started = time.perf_counter()
+        if is_final:
+            default_tracer.record("stt.utterance", time.perf_counter() - utterance_started)
+            utterance_started = None
+            callback(transcript, is_final=True)
+        else:
+            callback(transcript, is_final=False)
+
+def listen_print_loop(responses, callback):
+    """Send the top alternative of every Google streaming response to the callback."""
+    deliver_results(google_transcripts(responses), callback)
+
 class SpeechToTextConverter:
-    def __init__(self, language_code="en-US"):
+    """Records from a microphone and transcribes with the chosen recognizer backend
+    ("google" or the offline "vosk", see recognizers.py)."""
+    def __init__(self, language_code="en-US", streaming=True, num_workers=2, max_pending=4, drop_policy="drop_oldest",
+                 registry=None, recognizer=DEFAULT_RECOGNIZER, profile=DEFAULT_PROFILE):
         # Read credentials path from env for safety. Use masked default in public code.
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv(
             "GOOGLE_APPLICATION_CREDENTIALS",
             "XXXXXXXXXXXX.json"
         )
-        self.client = speech.SpeechClient()
-        self.config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=RATE,
-            language_code=language_code,
-            model='video',
-            use_enhanced=True,
-        )
-        self.streaming_config = speech.StreamingRecognitionConfig(
-            config=self.config,
-            interim_results=True
-        )
+        self.registry = registry or default_registry
+        self.language_code = language_code
+        self.profile = get_profile(profile)
+        # Nothing is imported or connected until the first recognition
+        self.recognizer = make_recognizer(recognizer, self.registry, language_code, self.profile.rate,
+                                          self.profile.codec)
+        self.streaming = streaming
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.drop_policy = drop_policy
         self.stream = None
         self.continuous_recorder = None
 
+    def set_recognizer(self, name):
+        """Use another recognizer backend from the next start_transcription on."""
+        self.recognizer = make_recognizer(name, self.registry, self.language_code, self.profile.rate,
+                                          self.profile.codec)
+
+    def warm_up(self):
+        """Connect to the recognition service or load the local model ahead of the first question."""
+        self.recognizer.warm_up()
+
     def get_audio_devices(self):
+        if not PYAUDIO_AVAILABLE:
+            return []
         p = pyaudio.PyAudio()
         devices = []
         for i in range(p.get_device_count()):
@@ -225,29 +460,42 @@ class SpeechToTextConverter:
         p.terminate()
         return devices
 
-    def start_transcription(self, on_transcript_update, on_error, device_index, volume_callback):
-        """Start continuous recording and transcription."""
+    def start_transcription(self, on_transcript_update, on_error, device_index, volume_callback, streaming=None):
+        """Start continuous recording and transcription.
+
+        Streaming mode sends interim and final results as they arrive; otherwise audio
+        is transcribed in fixed windows.
+        """
+        if streaming is None:
+            streaming = self.streaming
+        if not PYAUDIO_AVAILABLE:
+            on_error("PyAudio is not installed, so there is no microphone to record from.")
+            return
         try:
-            self.continuous_recorder = ContinuousRecorder(RATE, CHUNK, device_index=device_index)
+            if streaming:
+                audio_stream = MicrophoneStream(self.profile, device_index=device_index)
+                self.stream = StreamingRecognizer(self.recognizer, audio_stream)
+                self.stream.start(on_transcript_update, on_error, volume_callback)
+                return
+            self.continuous_recorder = ContinuousRecorder(
+                self.profile, device_index=device_index,
+                num_workers=self.num_workers,
+                max_pending=self.max_pending,
+                drop_policy=self.drop_policy,
+                recognizer=self.recognizer,
+            )
             self.continuous_recorder.start_recording(on_transcript_update, on_error, volume_callback)
         except Exception as e:
             on_error(f"An error occurred: {e}")
 
     def stop_transcription(self):
         """Stop continuous recording."""
+        if self.stream:
+            self.stream.stop()
+            self.stream = None
         if self.continuous_recorder:
             self.continuous_recorder.stop_recording()
             self.continuous_recorder = None
 
     def listen_print_loop(self, responses, callback):
-        for response in responses:
-            if not response.results:
-                continue
-            result = response.results[0]
-            if not result.alternatives:
-                continue
-            transcript = result.alternatives[0].transcript
-            if result.is_final:
-                callback(transcript, is_final=True)
-            else:
-                callback(transcript, is_final=False)
\ No newline at end of file
+        listen_print_loop(responses, callback)
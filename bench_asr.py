@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Word error rate and speed of the speech recognizer backends on WAV fixtures.
+
+Each fixture is a WAV file with its reference transcript next to it in a .txt file
+of the same name. The audio is streamed through every backend in 100 ms chunks,
+exactly as StreamingRecognizer feeds it, and the final transcripts are compared
+with the reference.
+
+Reported per backend: word error rate over all fixtures, realtime factor
+(processing time / audio duration; below 1 is faster than realtime) and, with
+--realtime, how long after the last chunk the final transcript arrived.
+
+    python bench_asr.py fixtures/asr
+    python bench_asr.py --synthesize fixtures/asr      # write fixtures with Cloud Text-to-Speech first
+    python bench_asr.py fixtures/asr --backends vosk --realtime
+"""
+
+import argparse
+import glob
+import os
+import re
+import statistics
+import time
+
+from audio_utils import PCM_RATE, read_wav
+from recognizers import available_recognizers, make_recognizer
+
+CHUNK_BYTES = PCM_RATE // 10 * 2  # 100 ms of LINEAR16
+
+# Questions a student might ask, used for synthesized fixtures
+SENTENCES = [
+    "Can you explain how photosynthesis works in plants?",
+    "Help me with question four from chapter three.",
+    "What is the difference between mitosis and meiosis?",
+    "Why is the mitochondria called the powerhouse of the cell?",
+    "Summarize the main causes of the French Revolution.",
+    "How do I solve a quadratic equation by completing the square?",
+    "What does the author mean by the second paragraph on page twelve?",
+    "Give me an example of Newton's third law of motion.",
+]
+
+
+def normalize(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """Substitutions, deletions and insertions needed to turn the reference into the hypothesis."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def load_fixtures(directory):
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(reference_path):
+            print(f"Skipping {path}: no reference transcript")
+            continue
+        with open(reference_path, encoding="utf-8") as f:
+            fixtures.append((path, f.read().strip(), read_wav(path)))
+    return fixtures
+
+
+def synthesize(directory):
+    """Write one fixture per sentence with Cloud Text-to-Speech (16 kHz LINEAR16)."""
+    from google.cloud import texttospeech
+    from clients import default_registry
+
+    os.makedirs(directory, exist_ok=True)
+    voice = texttospeech.VoiceSelectionParams(language_code="en-US", ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL)
+    audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+                                            sample_rate_hertz=PCM_RATE)
+    for number, sentence in enumerate(SENTENCES):
+        response = default_registry.call("tts", "synthesize_speech", input=texttospeech.SynthesisInput(text=sentence),
+                                         voice=voice, audio_config=audio_config)
+        path = os.path.join(directory, f"question_{number}")
+        # LINEAR16 responses are already WAV files
+        with open(path + ".wav", "wb") as f:
+            f.write(response.audio_content)
+        with open(path + ".txt", "w", encoding="utf-8") as f:
+            f.write(sentence + "\n")
+    print(f"Wrote {len(SENTENCES)} fixtures to {directory}")
+
+
+def transcribe(recognizer, pcm, realtime):
+    """Stream PCM through a backend; returns (final transcript, seconds taken, seconds after the last chunk)."""
+    sent = {}
+
+    def chunks():
+        for offset in range(0, len(pcm), CHUNK_BYTES):
+            if realtime:
+                time.sleep(CHUNK_BYTES / 2 / PCM_RATE)
+            yield pcm[offset:offset + CHUNK_BYTES]
+        sent["last"] = time.perf_counter()
+
+    finals = []
+    started = time.perf_counter()
+    for transcript, is_final in recognizer.stream(chunks()):
+        if is_final:
+            finals.append(transcript)
+    finished = time.perf_counter()
+    return " ".join(finals), finished - started, finished - sent.get("last", finished)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.path.join("fixtures", "asr"))
+    parser.add_argument("--synthesize", metavar="DIR", help="write fixtures to DIR with Cloud Text-to-Speech")
+    parser.add_argument("--backends", nargs="+", default=None, help="default: the installed ones")
+    parser.add_argument("--realtime", action="store_true", help="send audio at realtime pace and report final latency")
+    parser.add_argument("--verbose", action="store_true", help="print every transcript")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize(args.synthesize)
+        args.directory = args.synthesize
+    fixtures = load_fixtures(args.directory)
+    if not fixtures:
+        parser.error(f"no fixtures in {args.directory}; record some or use --synthesize DIR")
+    audio_seconds = sum(len(pcm) / 2 / PCM_RATE for _, _, pcm in fixtures)
+    reference_words = sum(len(normalize(reference)) for _, reference, _ in fixtures)
+    print(f"{len(fixtures)} fixtures, {audio_seconds:.1f}s of audio, {reference_words} words")
+
+    for name in args.backends or available_recognizers():
+        try:
+            recognizer = make_recognizer(name)
+            started = time.perf_counter()
+            recognizer.warm_up()
+            warm_up = time.perf_counter() - started
+            errors, elapsed, latencies = 0, 0.0, []
+            for path, reference, pcm in fixtures:
+                hypothesis, seconds, after_last = transcribe(recognizer, pcm, args.realtime)
+                errors += word_errors(normalize(reference), normalize(hypothesis))
+                elapsed += seconds
+                latencies.append(after_last)
+                if args.verbose:
+                    print(f"  {os.path.basename(path)}: {hypothesis!r}")
+        except Exception as e:
+            print(f"{name:>8}: failed: {e}")
+            continue
+        line = f"{name:>8}: WER {errors / reference_words:6.1%}, "
+        if args.realtime:
+            line += f"final transcript {statistics.median(latencies) * 1000:6.0f} ms after the audio ended (p50)"
+        else:
+            line += f"realtime factor {elapsed / audio_seconds:5.2f}"
+        print(line + f", warm-up {warm_up:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the per-window audio path before and after dropping the temp WAV file.
+
+"before" writes the joined frames to a WAV file, reads it back and deletes it, as
+_transcribe_chunk used to. "after" joins the frames into the bytes handed to
+RecognitionAudio. Reports latency and traced allocations per window.
+
+    python bench_audio_path.py --windows 200 --seconds 5
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import wave
+
+RATE = 16000
+CHUNK = int(RATE / 10)
+
+
+def wav_round_trip(frames, path):
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(b''.join(frames))
+    with open(path, 'rb') as audio_file:
+        content = audio_file.read()
+    os.remove(path)
+    return content
+
+
+def in_memory(frames):
+    return b''.join(frames)
+
+
+def measure(name, run, windows):
+    latencies = []
+    for _ in range(windows):
+        started = time.perf_counter()
+        content = run()
+        latencies.append(time.perf_counter() - started)
+        del content
+    # Allocations are traced in a separate pass so tracing does not skew latency
+    allocated = []
+    for _ in range(windows):
+        tracemalloc.start()
+        content = run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        allocated.append(peak)
+        del content
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:>7}: mean {statistics.mean(latencies) * 1000:7.3f} ms, "
+          f"p95 {p95 * 1000:7.3f} ms, peak allocated {statistics.mean(allocated) / 1024:8.1f} KiB/window")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5.0, help="audio per window")
+    args = parser.parse_args()
+
+    frames = [os.urandom(CHUNK * 2) for _ in range(int(args.seconds * 10))]
+    path = os.path.join(tempfile.mkdtemp(), "temp_audio_chunk.wav")
+
+    print(f"{args.windows} windows of {args.seconds:g}s ({len(frames) * CHUNK * 2 / 1024:.0f} KiB of PCM)")
+    measure("before", lambda: wav_round_trip(frames, path), args.windows)
+    measure("after", lambda: in_memory(frames), args.windows)
+
+
+if __name__ == "__main__":
+    main()
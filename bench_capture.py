@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Upload size and latency of each capture profile on slow and fast links.
+
+Synthetic speech-like audio is read in the profile's chunks at the profile's device
+rate and channel count. Each chunk is downmixed, resampled and encoded as
+StreamingRecognizer would do it; the CPU time is measured. The encoded bytes, plus
+--overhead bytes of framing per streaming request (gRPC, HTTP/2, TLS), then go over a
+simulated uplink of the given bandwidth and one-way delay.
+
+Reported per link and profile:
+- kbit/s: what is uploaded per second of audio
+- latency p50/p95: the time from a chunk's audio being spoken (its midpoint) to the
+  recognizer receiving it. This includes waiting for the chunk to fill, conversion,
+  audio held back by the encoder until it has a full block or page, and queueing and
+  transfer on the link. A link slower than the stream falls further behind the
+  longer the audio runs.
+- cpu: processing time per second of audio
+
+    python bench_capture.py --seconds 30 --uplinks 1000 128 48
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from capture import PROFILES, StreamEncoder, codec_available
+
+
+def speech_like(seconds, rate, channels, seed=0):
+    """Voiced bursts with a moving pitch, separated by pauses, over background noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = sum(np.sin(h * phase) / h for h in (1, 2, 3, 4))
+    # Syllables at about 4 Hz, words separated by pauses
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) * (np.sin(2 * np.pi * 0.3 * t) > -0.3)
+    signal = 6000 * envelope * voice + rng.normal(0, 60, len(t))
+    signal = np.clip(signal, -32768, 32767).astype(np.int16)
+    return np.repeat(signal, channels).tobytes()
+
+
+def run(profile, audio, uplink_bps, delay, overhead):
+    """Returns (bits uploaded, per-chunk latencies, cpu seconds)."""
+    frame_bytes = 2 * profile.channels
+    chunk_bytes = profile.chunk * frame_bytes
+    converter = profile.converter()
+    encoder = StreamEncoder(profile.codec, profile.rate)
+    link_free = 0.0
+    sent_bits = 0
+    cpu = 0.0
+    latencies = []
+    pending = []
+
+    def send(data, ready):
+        nonlocal link_free, sent_bits
+        bits = (len(data) + overhead) * 8
+        link_free = max(link_free, ready) + bits / uplink_bps
+        sent_bits += bits
+        arrived = link_free + delay
+        latencies.extend(arrived - spoken for spoken in pending)
+        pending.clear()
+
+    for number, offset in enumerate(range(0, len(audio) - chunk_bytes + 1, chunk_bytes)):
+        # The chunk is handed over once its last sample has been captured
+        captured = (number + 1) * profile.chunk_seconds
+        pending.append(captured - profile.chunk_seconds / 2)
+        started = time.perf_counter()
+        data = audio[offset:offset + chunk_bytes]
+        if converter is not None:
+            data = converter.convert(data)
+        data = encoder.encode(data)
+        elapsed = time.perf_counter() - started
+        cpu += elapsed
+        if data:
+            send(data, captured + elapsed)
+    data = encoder.close()
+    send(data, captured)
+    return sent_bits, latencies, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--uplinks", type=float, nargs="+", default=[1000, 128, 48], help="uplink bandwidths in kbit/s")
+    parser.add_argument("--delay", type=float, default=0.04, help="one-way network delay in seconds")
+    parser.add_argument("--overhead", type=int, default=45, help="framing bytes per streaming request")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES))
+    args = parser.parse_args()
+
+    profiles = []
+    for name in args.profiles:
+        if codec_available(PROFILES[name].codec):
+            profiles.append(PROFILES[name])
+        else:
+            print(f"Skipping {name}: {PROFILES[name].codec} needs soundfile")
+    for uplink in args.uplinks:
+        print(f"uplink {uplink:g} kbit/s, {args.delay * 1000:g} ms delay")
+        for profile in profiles:
+            audio = speech_like(args.seconds, profile.capture_rate, profile.channels)
+            bits, latencies, cpu = run(profile, audio, uplink * 1000, args.delay, args.overhead)
+            p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+            print(f"  {profile.name:<15} {profile.codec:<9} {bits / args.seconds / 1000:7.1f} kbit/s   "
+                  f"latency p50 {p50:8.0f} ms, p95 {p95:8.0f} ms   cpu {cpu / args.seconds:6.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Prompt size over a long conversation, with bounded memory and with the full history.
+
+A student asks --turns questions about a large synthetic document (see
+bench_retrieval.py); every other question is a follow-up ("And what is its
+melting point?") that only makes sense after the one before it. Gemini is faked
+and records the prompts it gets.
+
+Reported: prompt size at points along the conversation for the bounded memory
+(recent turns plus a rolling summary) and for a memory that keeps every turn, and
+how many follow-ups retrieved the passage of the question they follow, with and
+without the conversation, and how many ordinary standalone questions were taken
+for follow-ups (and so searched together with the question before them).
+
+    python bench_conversation.py --turns 120
+"""
+
+import argparse
+import random
+
+from bench_retrieval import make_document
+from conversation import ConversationMemory, is_follow_up
+from fakes import FakeGenerativeModel, fake_registry
+from qa_engine import QASystem
+
+ANSWER = ("The passage gives the boiling point of that compound in degrees at sea level. "
+          "Boiling points rise with the strength of the forces between molecules, so compounds "
+          "with hydrogen bonds boil at higher temperatures than similar compounds without them. ") * 2
+FOLLOW_UPS = ["And what is its melting point?", "Why is that one so high?", "How was it measured?"]
+# Questions that make sense on their own, several with words that also appear in follow-ups
+STANDALONE = [
+    "Why is the sky blue?", "What is the last step of mitosis?", "Explain photosynthesis in more detail.",
+    "What is this chapter about?", "Is that the same as osmosis?", "Which one is bigger, Mars or Venus?",
+    "Why do cells divide again after meiosis?", "So what is a covalent bond?", "But how do plants make sugar?",
+    "Then what happens to the electrons?", "What is the previous name of Sri Lanka?",
+    "How many more moles of oxygen are needed?", "What does the word their refer to in this sentence?",
+    "What is another word for evaporation?", "Who was the first person on the moon?",
+    "Why does ice float on water?",
+]
+
+
+def converse(qa, genai, questions, turns):
+    """Ask alternating questions and follow-ups; returns prompt sizes and follow-up retrieval hits."""
+    sizes = []
+    found, stateless_found = 0, 0
+    for turn in range(turns):
+        question, answer_text = questions[turn // 2 % len(questions)]
+        compound = answer_text.split(" is ")[0]
+        if turn % 2:
+            question = FOLLOW_UPS[turn // 2 % len(FOLLOW_UPS)]
+            found += compound in qa.retrieve(qa.memory.search_text(question))[0]
+            stateless_found += compound in qa.retrieve(question)[0]
+        qa.answer_question(question)
+        sizes.append(len(genai.prompts[-1]) if genai.prompts else 0)
+    return sizes, found, stateless_found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=120)
+    parser.add_argument("--words", type=int, default=200000, help="size of the synthetic document")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    text, questions = make_document(args.words, args.turns // 2 + 1, random.Random(args.seed))
+    results = {}
+    for name, memory in (("bounded", ConversationMemory()),
+                         ("full", ConversationMemory(max_turns=None, max_answer_chars=10 ** 9))):
+        genai = FakeGenerativeModel(answers=[ANSWER] * args.turns)
+        qa = QASystem(registry=fake_registry(genai=genai), memory=memory)
+        qa.load_context(text)
+        results[name] = converse(qa, genai, questions, args.turns)
+
+    checkpoints = sorted({1, 5, 10, 25, 50, 100, args.turns} & set(range(1, args.turns + 1)))
+    print("prompt chars by turn")
+    print(f"  {'turn':<7}" + "".join(f"{turn:>9}" for turn in checkpoints) + "      max")
+    for name, (sizes, _, _) in results.items():
+        print(f"  {name:<7}" + "".join(f"{sizes[turn - 1]:>9}" for turn in checkpoints) + f"{max(sizes):>9}")
+    _, found, stateless_found = results["bounded"]
+    follow_ups = args.turns // 2
+    print(f"follow-ups that retrieved the passage they refer to: {found}/{follow_ups} with the conversation, "
+          f"{stateless_found}/{follow_ups} without")
+    false_positives = sum(is_follow_up(question) for question in STANDALONE)
+    print(f"standalone questions taken for follow-ups: {false_positives}/{len(STANDALONE)}")
+
+
+if __name__ == "__main__":
+    main()
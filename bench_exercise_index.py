@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Offline accuracy check of the chapter/exercise index on sample textbook layouts.
+
+Each layout is a synthetic textbook with body text (including numbered steps and
+lines that merely mention a chapter) and exercises written in one heading style.
+Every exercise carries a unique marker, so a lookup is correct when the returned
+span contains its own marker and no other. Spoken requests in several phrasings are
+parsed and looked up too. Reports per layout:
+
+- found: exercises indexed / exercises in the book
+- exact: lookups by (chapter, number) that return exactly the right span
+- spoken: spoken requests resolved to the right exercise
+- ordinary questions that were wrongly taken for an exercise reference
+- build time per page and lookup latency
+
+    python bench_exercise_index.py --chapters 12 --questions 8
+"""
+
+import argparse
+import random
+import time
+
+from exercises import ExerciseIndex, parse_reference
+
+LINES_PER_PAGE = 40
+ROMAN = ["", "I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII", "XIII", "XIV", "XV",
+         "XVI", "XVII", "XVIII", "XIX", "XX"]
+WORDS = ("cell membrane energy protein enzyme nucleus osmosis diffusion tissue organ gene "
+         "molecule reaction pressure volume force mass current circuit").split()
+
+
+def marker(chapter, number):
+    return f"MARK{chapter or 0}X{number}"
+
+
+def body(rng, chapter):
+    lines = [" ".join(rng.choice(WORDS) for _ in range(12)) + "." for _ in range(rng.randint(20, 40))]
+    # Distractors: a numbered procedure and a cross-reference to another chapter
+    lines.insert(5, "Procedure:")
+    lines[6:6] = [f"{step}. Heat the {rng.choice(WORDS)} sample for {step} minutes." for step in range(1, 4)]
+    lines.insert(12, f"Chapter {max(chapter - 1, 1)} introduced the {rng.choice(WORDS)} and its role in every cell.")
+    return lines
+
+
+def exercise_lines(rng, first_line):
+    lines = [f"{first_line} Explain the {rng.choice(WORDS)} of the {rng.choice(WORDS)}."]
+    if rng.random() < 0.4:
+        lines += [f"   a) Describe the {rng.choice(WORDS)}.", f"   b) Compare it with the {rng.choice(WORDS)}."]
+    return lines
+
+
+def layout_section(rng, chapters, questions):
+    lines = []
+    for chapter in range(1, chapters + 1):
+        lines += [f"Chapter {chapter}: The {rng.choice(WORDS).title()}"] + body(rng, chapter) + ["Exercises"]
+        for number in range(1, questions + 1):
+            lines += exercise_lines(rng, f"{number}. {marker(chapter, number)}")
+    return lines
+
+
+def layout_roman_review(rng, chapters, questions):
+    lines = []
+    for chapter in range(1, chapters + 1):
+        lines += [f"CHAPTER {ROMAN[chapter]}", f"{rng.choice(WORDS).upper()} AND {rng.choice(WORDS).upper()}"]
+        lines += body(rng, chapter) + ["Review Questions"]
+        for number in range(1, questions + 1):
+            lines += exercise_lines(rng, f"{number}) {marker(chapter, number)}")
+    return lines
+
+
+def layout_decimal_headings(rng, chapters, questions):
+    lines = []
+    for chapter in range(1, chapters + 1):
+        lines += [f"Chapter {chapter}"] + body(rng, chapter)
+        for number in range(1, questions + 1):
+            lines += exercise_lines(rng, f"Exercise {chapter}.{number} {marker(chapter, number)}")
+            lines += body(rng, chapter)[:3]
+    return lines
+
+
+def layout_unit_q(rng, chapters, questions):
+    lines = []
+    for chapter in range(1, chapters + 1):
+        lines += [f"Unit {chapter} - {rng.choice(WORDS).title()}"] + body(rng, chapter)
+        for number in range(1, questions + 1):
+            lines += exercise_lines(rng, f"Q{number}. {marker(chapter, number)}")
+    return lines
+
+
+def layout_problems_decimal(rng, chapters, questions):
+    lines = []
+    for chapter in range(1, chapters + 1):
+        lines += [f"Chapter {chapter}"] + body(rng, chapter) + ["Problems"]
+        for number in range(1, questions + 1):
+            lines += exercise_lines(rng, f"{chapter}.{number} {marker(chapter, number)}")
+    return lines
+
+
+def layout_worksheet(rng, chapters, questions):
+    # No chapters at all: a single worksheet of numbered questions
+    lines = body(rng, 1)
+    for number in range(1, chapters * questions + 1):
+        lines += exercise_lines(rng, f"Question {number}: {marker(None, number)}")
+    return lines
+
+
+LAYOUTS = {
+    "exercises section": layout_section,
+    "roman + review": layout_roman_review,
+    "Exercise 3.4 headings": layout_decimal_headings,
+    "unit + Q4.": layout_unit_q,
+    "problems 3.4": layout_problems_decimal,
+    "worksheet": layout_worksheet,
+}
+
+SPOKEN = [
+    "help me with question {number} from chapter {chapter}",
+    "can you help me with chapter {chapter} question {number}",
+    "what's the answer to exercise {chapter}.{number}",
+    "I'm stuck on problem number {number} in chapter {chapter}",
+]
+SPOKEN_NO_CHAPTER = ["help me with question {number}", "explain question number {number}"]
+# Questions about the content that mention numbers but name no exercise
+ORDINARY = [
+    "How many protons does an element with atomic number 8 have?",
+    "What is the number one cause of rust?",
+    "What is avogadros number 6.02 used for?",
+    "What is the problem with using fossil fuels?",
+    "Why is the answer to this question important?",
+    "What happened in 1914?",
+    "Explain the first law of thermodynamics.",
+    "What is the difference between chapter one and two?",
+    "Which number is bigger, 3.5 or 3.45?",
+    "What does Q stand for in the heat equation?",
+    "Is the number of chromosomes 46 in every cell?",
+    "What problem does photosynthesis solve for the plant?",
+]
+
+
+def paginate(lines):
+    return [(page + 1, "\n".join(lines[start:start + LINES_PER_PAGE]))
+            for page, start in enumerate(range(0, len(lines), LINES_PER_PAGE))]
+
+
+def resolve(index, reference):
+    chapter, number = reference
+    chapters = [chapter] if chapter is not None else index.chapters_with(number)
+    return index.get(chapters[0], number) if len(chapters) == 1 else None
+
+
+def correct(exercise, expected):
+    return exercise is not None and expected in exercise.text and exercise.text.count("MARK") == 1
+
+
+def evaluate(name, layout, chapters, questions, seed):
+    rng = random.Random(seed)
+    pages = paginate(layout(rng, chapters, questions))
+    started = time.perf_counter()
+    index = ExerciseIndex.build(pages)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    worksheet = layout is layout_worksheet
+    expected = ([(None, number) for number in range(1, chapters * questions + 1)] if worksheet else
+                [(chapter, number) for chapter in range(1, chapters + 1) for number in range(1, questions + 1)])
+    exact = sum(correct(index.get(chapter, number), marker(chapter, number)) for chapter, number in expected)
+
+    spoken = total = 0
+    lookups = 0.0
+    for chapter, number in expected:
+        templates = SPOKEN_NO_CHAPTER if worksheet else SPOKEN
+        for template in templates:
+            reference = parse_reference(template.format(chapter=chapter, number=number))
+            started = time.perf_counter()
+            exercise = resolve(index, reference) if reference else None
+            lookups += time.perf_counter() - started
+            spoken += correct(exercise, marker(chapter, number))
+            total += 1
+
+    print(f"{name:>22}: found {len(index):3d}/{len(expected):3d}, exact {exact / len(expected):6.1%}, "
+          f"spoken {spoken / total:6.1%}, build {build_ms / len(pages):5.2f} ms/page, "
+          f"lookup {lookups / total * 1e6:5.1f} us")
+    return exact / len(expected), spoken / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=12)
+    parser.add_argument("--questions", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = [evaluate(name, layout, args.chapters, args.questions, args.seed) for name, layout in LAYOUTS.items()]
+    false_matches = [question for question in ORDINARY if parse_reference(question) is not None]
+    for question in false_matches:
+        print(f"  taken for an exercise: {question!r} -> {parse_reference(question)}")
+    print(f"{'ordinary questions':>22}: {len(false_matches)}/{len(ORDINARY)} taken for an exercise reference")
+    print(f"{'overall':>22}: exact {sum(r[0] for r in results) / len(results):6.1%}, "
+          f"spoken {sum(r[1] for r in results) / len(results):6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark of PDF text extraction on large synthetic PDFs.
+
+Compares the old single-process loop (string concatenation page by page) with
+FileProcessor's parallel page-range extraction, and reports pages/sec, time to the
+first page and peak RSS. Each run happens in a fresh subprocess so RSS is not shared.
+
+    python bench_pdf_extract.py --pages 200 800
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+LINE = "The mitochondria is the powerhouse of the cell, and photosynthesis happens in the chloroplast."
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Chapter {number // 20 + 1}, page {number + 1}", fontsize=14)
+        for line in range(45):
+            page.insert_text((72, 100 + line * 15), f"{line + 1}. {LINE}", fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def run_sequential(path):
+    """The extraction loop as it was before pages were split across processes."""
+    started = time.perf_counter()
+    first_page = None
+    doc = fitz.open(path)
+    text = ""
+    for page_num in range(len(doc)):
+        text += doc.load_page(page_num).get_text()
+        if first_page is None:
+            first_page = time.perf_counter() - started
+    pages = len(doc)
+    doc.close()
+    return pages, first_page, time.perf_counter() - started
+
+
+def run_parallel(path):
+    from clients import ClientRegistry
+    from file_processor import FileProcessor
+    # Text-layer extraction never needs the OCR client
+    registry = ClientRegistry()
+    registry.register("vision", lambda: None)
+    processor = FileProcessor(registry=registry)
+    started = time.perf_counter()
+    first_page = None
+    pages = 0
+    for _ in processor.iter_pages(path):
+        pages += 1
+        if first_page is None:
+            first_page = time.perf_counter() - started
+    return pages, first_page, time.perf_counter() - started
+
+
+def child(mode, path):
+    pages, first_page, elapsed = (run_sequential if mode == "sequential" else run_parallel)(path)
+    # ru_maxrss is in KiB on Linux; count worker processes too
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(f"{mode:>10}: {pages / elapsed:8.1f} pages/s, first page after {first_page * 1000:7.1f} ms, "
+          f"total {elapsed:6.2f}s, peak RSS {peak_kib / 1024:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 800])
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PDF"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    directory = tempfile.mkdtemp()
+    for pages in args.pages:
+        path = os.path.join(directory, f"synthetic_{pages}.pdf")
+        make_pdf(path, pages)
+        print(f"{pages} pages, {os.path.getsize(path) / 1e6:.1f} MB, {os.cpu_count()} CPUs")
+        for mode in ("sequential", "parallel"):
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, path], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Recognition latency with a new client per request versus the shared client registry.
+
+Starts a local gRPC stand-in for the Speech-to-Text service, which answers Recognize
+with a canned transcript, and times back-to-back requests both ways.
+
+    python bench_recognize_latency.py --requests 50 --server-delay-ms 20
+
+The stand-in uses a plaintext channel, so the per-request numbers leave out the TLS
+handshake that a fresh client pays against the real endpoint.
+"""
+
+import argparse
+import statistics
+import time
+from concurrent import futures
+
+import grpc
+from google.cloud import speech
+
+from clients import ClientRegistry
+
+RATE = 16000
+
+
+def start_stand_in(delay_seconds):
+    def recognize(request, context):
+        if delay_seconds:
+            time.sleep(delay_seconds)
+        alternative = speech.SpeechRecognitionAlternative(transcript="canned transcript", confidence=0.9)
+        return speech.RecognizeResponse(results=[speech.SpeechRecognitionResult(alternatives=[alternative])])
+
+    handler = grpc.method_handlers_generic_handler("google.cloud.speech.v1.Speech", {
+        "Recognize": grpc.unary_unary_rpc_method_handler(
+            recognize,
+            request_deserializer=speech.RecognizeRequest.deserialize,
+            response_serializer=speech.RecognizeResponse.serialize,
+        ),
+    })
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, f"127.0.0.1:{port}"
+
+
+def time_requests(get_client, requests, close=None):
+    config = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=RATE,
+        language_code="en-US",
+    )
+    audio = speech.RecognitionAudio(content=bytes(RATE * 2))
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        get_client().recognize(config=config, audio=audio)
+        latencies.append(time.perf_counter() - started)
+        if close:
+            close()
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{name:>18}: mean {statistics.mean(latencies) * 1000:7.2f} ms, "
+          f"median {statistics.median(latencies) * 1000:7.2f} ms, p95 {p95 * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--server-delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, endpoint = start_stand_in(args.server_delay_ms / 1000)
+    try:
+        fresh = ClientRegistry(endpoints={"speech": endpoint})
+        report("client per request", time_requests(
+            lambda: fresh.get("speech"), args.requests, close=lambda: fresh.reset("speech")))
+
+        shared = ClientRegistry(endpoints={"speech": endpoint})
+        shared.warm_up(["speech"], background=False)
+        report("shared client", time_requests(lambda: shared.get("speech"), args.requests))
+        shared.close()
+    finally:
+        server.stop(None)
+
+
+if __name__ == "__main__":
+    main()
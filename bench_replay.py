@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Interaction log writer cost, and logged interactions replayed as a regression run.
+
+Writer: logs N synthetic interactions through InteractionLogger and through the old
+synchronous open-append-close, and reports the time each call holds up the answer
+callback and how many records were dropped.
+
+Replay: asks the questions of a log again and reports how many answers changed and
+the latency of the replayed answers next to the logged ones. By default the questions
+are answered by fakes; with --live they go to Gemini over the documents in the
+document store's corpus, as the app would answer them.
+
+    python bench_replay.py --records 2000
+    python bench_replay.py --log interactions.jsonl --live --doc-id <doc id>
+"""
+
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from fakes import FakeGenerativeModel, fake_registry
+from interaction_logger import InteractionLogger, iter_interactions, replay
+from qa_engine import QASystem
+
+CONTEXT = "The mitochondria is the powerhouse of the cell. Photosynthesis happens in the chloroplast."
+
+
+def log_synchronously(log_file, user_query, ai_response):
+    """The old InteractionLogger.log_interaction."""
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with open(log_file, "a") as f:
+        f.write(f"[{timestamp}] User: {user_query}\n")
+        f.write(f"[{timestamp}] AI: {ai_response}\n\n")
+
+
+def describe(values, scale=1e6, unit="us"):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return (f"p50 {statistics.median(values) * scale:8.1f} {unit}, p95 {p95 * scale:8.1f} {unit}, "
+            f"max {values[-1] * scale:8.1f} {unit}")
+
+
+def bench_writer(directory, records):
+    answer = "The mitochondria makes energy for the cell by breaking down sugar. " * 4
+    calls = []
+    for number in range(records):
+        started = time.perf_counter()
+        log_synchronously(os.path.join(directory, "interaction_log.txt"), f"Why is the sky blue, take {number}?", answer)
+        calls.append(time.perf_counter() - started)
+    print(f"synchronous: {describe(calls)}")
+
+    log_file = os.path.join(directory, "interactions.jsonl")
+    logger = InteractionLogger(log_file, max_bytes=256 * 1024)
+    calls = []
+    for number in range(records):
+        started = time.perf_counter()
+        logger.log_interaction(f"What does the mitochondria do, take {number}?", answer,
+                               latency_ms={"first_token": 410.0, "total": 1200.0}, doc_ids=["synthetic"],
+                               cached=number % 4 == 0, prompt_tokens=350, output_tokens=60)
+        calls.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    logger.close()
+    print(f"queued:      {describe(calls)}")
+    print(f"             writer finished {(time.perf_counter() - started) * 1000:.1f} ms after the last call; "
+          f"{logger.stats()}")
+    return log_file
+
+
+def build_qa(args):
+    if not args.live:
+        qa = QASystem(registry=fake_registry(genai=FakeGenerativeModel(first_token_latency=0.01, chunk_latency=0)))
+        qa.load_context(CONTEXT)
+        return qa
+    from corpus import Corpus
+    from doc_store import DocumentStore
+    corpus = Corpus(manifest_path=os.path.join(DocumentStore().root, "corpus.json"))
+    qa = QASystem(corpus=corpus)
+    if args.doc_id:
+        qa.set_scope(args.doc_id)
+    return qa
+
+
+def bench_replay(args, log_file):
+    records = list(iter_interactions(log_file, doc_id=args.doc_id if args.live else None, cached=False))
+    if args.limit:
+        records = records[-args.limit:]
+    if not records:
+        print("No interactions to replay")
+        return
+    qa = build_qa(args)
+    changed = 0
+    replayed, logged = [], []
+    for record, answer, seconds in replay(records, qa):
+        changed += answer.strip() != record["answer"].strip()
+        replayed.append(seconds)
+        total = record.get("latency_ms", {}).get("total")
+        if total is not None:
+            logged.append(total / 1000)
+    print(f"replayed {len(records)} interactions: {changed} answers changed")
+    print(f"  replayed answer latency: {describe(replayed, 1000, 'ms')}")
+    if logged:
+        print(f"  logged turn latency:     {describe(logged, 1000, 'ms')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000, help="synthetic interactions to log")
+    parser.add_argument("--log", help="replay this log instead of the synthetic one")
+    parser.add_argument("--live", action="store_true", help="answer with Gemini over the stored corpus")
+    parser.add_argument("--doc-id", help="only replay interactions about this document")
+    parser.add_argument("--limit", type=int, default=200, help="replay at most the latest N interactions")
+    args = parser.parse_args()
+
+    log_file = args.log
+    if log_file is None:
+        log_file = bench_writer(tempfile.mkdtemp(), args.records)
+    bench_replay(args, log_file)
+
+
+if __name__ == "__main__":
+    main()
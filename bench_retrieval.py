@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of passage retrieval on large synthetic documents.
+
+Generates filler text with planted facts ("The boiling point of compound 417 is 83
+degrees."), indexes it, asks one question per fact and reports recall@1 and recall@k,
+build time, index size on disk and query latency.
+
+    python bench_retrieval.py --words 200000 1000000 --facts 200
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from qa_engine import TOP_K
+from retrieval import BM25Index, chunk_text
+
+FILLER = """
+photosynthesis energy plant cell membrane river mountain history empire trade
+science number equation triangle angle volume mass force motion gravity planet
+orbit ocean climate weather cloud rain soil farm village market language grammar
+poem story chapter exercise teacher student lesson example answer reason method
+""".split()
+
+
+def make_document(words, facts, rng):
+    """Return (text, questions) where each question names the fact that answers it."""
+    text = []
+    questions = []
+    fact_positions = set(rng.sample(range(words // 20), facts))
+    for sentence in range(words // 20):
+        if sentence in fact_positions:
+            compound = rng.randint(100, 99999)
+            value = rng.randint(10, 400)
+            text.append(f"The boiling point of compound {compound} is {value} degrees.")
+            questions.append((f"What is the boiling point of compound {compound}?", f"compound {compound} is {value}"))
+        else:
+            # Zipf-like filler so common words dominate, as in real text
+            text.append(" ".join(FILLER[min(int(rng.paretovariate(1.2)) - 1, len(FILLER) - 1)] for _ in range(20)) + ".")
+    return " ".join(text), questions
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def run(words, facts, k, seed):
+    rng = random.Random(seed)
+    text, questions = make_document(words, facts, rng)
+
+    started = time.perf_counter()
+    index = BM25Index.build(chunk_text(text))
+    build_seconds = time.perf_counter() - started
+
+    directory = tempfile.mkdtemp()
+    index.save(directory)
+    index = BM25Index.load(directory)
+
+    hits_at_1 = hits_at_k = 0
+    latencies = []
+    for question, evidence in questions:
+        started = time.perf_counter()
+        hits = index.search(question, k)
+        latencies.append(time.perf_counter() - started)
+        passages = [index.chunk(chunk_id) for chunk_id, _ in hits]
+        hits_at_1 += bool(passages) and evidence in passages[0]
+        hits_at_k += any(evidence in passage for passage in passages)
+
+    latencies.sort()
+    print(f"{words:>9,} words, {len(index):>6,} chunks: build {build_seconds:6.2f}s, "
+          f"index {directory_size(directory) / 1e6:6.1f} MB")
+    print(f"    recall@1 {hits_at_1 / len(questions):.1%}, recall@{k} {hits_at_k / len(questions):.1%}, "
+          f"query p50 {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--facts", type=int, default=200)
+    parser.add_argument("-k", type=int, default=TOP_K)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for words in args.words:
+        run(words, args.facts, args.k, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Load test of the headless server with every cloud service faked.
+
+Starts the server in-process on a free port and drives N simulated sessions
+against it. Each session opens, uploads the same PDF (so all but the first hit the
+shared document cache), streams a few seconds of PCM over the WebSocket at
+real-time pace, waits for its answer and first audio clip, then closes. Sessions
+start evenly over --ramp seconds.
+
+Reported: admitted and rejected sessions, upload latency, and the time from the final
+transcript to the answer and to its first audio (p50/p95), plus the server's own
+counters.
+
+    python bench_server.py --sessions 40 --max-sessions 32 --max-answers 8
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+from aiohttp import ClientSession, WSMsgType, web
+
+from doc_store import DocumentStore
+from fakes import FakeGenerativeModel, FakeSpeechClient, FakeTextToSpeechClient, fake_registry
+from server import ServerState, create_app
+from answer_cache import AnswerCache
+from tts_cache import AudioCache
+
+CHUNK_SECONDS = 0.1
+CHUNK_BYTES = 3200  # 100 ms of 16 kHz LINEAR16
+
+
+def make_pdf(path, pages=20):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Chapter {number // 5 + 1}", fontsize=14)
+        for line in range(30):
+            page.insert_text((72, 100 + line * 15), f"Line {line} of page {number + 1}: the mitochondria "
+                                                    f"is the powerhouse of the cell.", fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def percentiles(values):
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return f"p50 {statistics.median(values) * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms"
+
+
+async def run_session(base, pdf, speech_seconds, results):
+    async with ClientSession() as http:
+        async with http.post(f"{base}/sessions") as response:
+            if response.status == 503:
+                results["rejected_sessions"] += 1
+                return
+            session_id = (await response.json())["session_id"]
+        url = f"{base}/sessions/{session_id}"
+        try:
+            started = time.perf_counter()
+            async with http.post(f"{url}/documents?name=textbook.pdf", data=pdf) as response:
+                if response.status != 201:
+                    results["failed_uploads"] += 1
+                    return
+            results["upload"].append(time.perf_counter() - started)
+
+            async with http.ws_connect(f"{url}/stream") as websocket:
+                async def speak():
+                    for _ in range(int(speech_seconds / CHUNK_SECONDS)):
+                        await websocket.send_bytes(bytes(CHUNK_BYTES))
+                        await asyncio.sleep(CHUNK_SECONDS)
+                    await websocket.send_json({"type": "end_audio"})
+
+                speaker = asyncio.get_running_loop().create_task(speak())
+                final = answered = None
+                async for message in websocket:
+                    now = time.perf_counter()
+                    if message.type == WSMsgType.BINARY:
+                        if answered is not None or final is not None:
+                            results["first_audio"].append(now - final)
+                            break
+                        continue
+                    payload = message.json()
+                    if payload["type"] == "transcript" and payload["final"]:
+                        final = now
+                    elif payload["type"] == "answer":
+                        answered = now
+                        results["answer"].append(now - final)
+                    elif payload["type"] == "error":
+                        results["errors"].append(payload["message"])
+                        break
+                await speaker
+            results["completed"] += 1
+        finally:
+            async with http.delete(url):
+                pass
+
+
+async def main_async(args):
+    directory = tempfile.mkdtemp()
+    pdf_path = os.path.join(directory, "textbook.pdf")
+    make_pdf(pdf_path)
+    with open(pdf_path, "rb") as f:
+        pdf = f.read()
+
+    questions = [[(f"Why is the mitochondria called the powerhouse, asks student {i}?", True)] for i in range(args.sessions)]
+    registry = fake_registry(
+        speech=FakeSpeechClient(streams=questions),
+        tts=FakeTextToSpeechClient(latency=args.tts_latency),
+        genai=FakeGenerativeModel(first_token_latency=args.first_token, chunk_latency=0.02),
+    )
+    state = ServerState(registry=registry, store=DocumentStore(os.path.join(directory, "store")),
+                        max_sessions=args.max_sessions, max_active_answers=args.max_answers,
+                        answer_cache=AnswerCache(), audio_cache=AudioCache(directory=None))
+    runner = web.AppRunner(create_app(state))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    base = f"http://127.0.0.1:{port}"
+
+    results = {"rejected_sessions": 0, "failed_uploads": 0, "completed": 0,
+               "upload": [], "answer": [], "first_audio": [], "errors": []}
+    started = time.perf_counter()
+    tasks = []
+    for i in range(args.sessions):
+        tasks.append(asyncio.get_running_loop().create_task(run_session(base, pdf, args.speech_seconds, results)))
+        await asyncio.sleep(args.ramp / args.sessions)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.sessions} sessions in {elapsed:.2f}s: {results['completed']} completed, "
+          f"{results['rejected_sessions']} rejected at admission, {results['failed_uploads']} failed uploads, "
+          f"{len(results['errors'])} errors")
+    print(f"  upload:                   {percentiles(results['upload'])}")
+    print(f"  final transcript->answer: {percentiles(results['answer'])}")
+    print(f"  final transcript->audio:  {percentiles(results['first_audio'])}")
+    for message in sorted(set(results["errors"])):
+        print(f"  error: {message} (x{results['errors'].count(message)})")
+    stats = state.stats()
+    print(f"  server: {stats['documents_indexed']} document(s) indexed, {stats['turns_completed']} turns, "
+          f"{stats['turns_rejected']} turned away as busy, {stats['rejected_sessions']} sessions refused, "
+          f"{stats['documents']} document(s) still held after the sessions closed")
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--max-sessions", type=int, default=32)
+    parser.add_argument("--max-answers", type=int, default=8)
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which sessions start")
+    parser.add_argument("--speech-seconds", type=float, default=2.0)
+    parser.add_argument("--first-token", type=float, default=0.5)
+    parser.add_argument("--tts-latency", type=float, default=0.15)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
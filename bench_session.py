@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Deterministic latency test of a voice session with every cloud service faked.
+
+The user asks a question, listens to the answer, and asks the next question
+`--gap` seconds after the previous one. Speech recognition, Gemini, Text-to-Speech
+and playback are local fakes with fixed latencies, so the numbers only depend on
+how the pipeline is scheduled:
+
+- blocking: the old flow, where the recognizer callback runs the whole turn and
+  recognition of the next question waits until the answer has been queued
+- session: SessionEngine, where turns run as asyncio tasks and overlap
+
+Reported: how late the recognizer picked up questions compared with when they were
+asked, and the time until the last answer finished playing.
+
+    python bench_session.py --questions 5 --gap 1.0
+"""
+
+import argparse
+import threading
+import time
+from types import SimpleNamespace
+
+from fakes import FakeGenerativeModel, FakeSpeechClient, FakeTextToSpeechClient, fake_registry
+from playback import NullSink
+from qa_engine import QASystem
+from session import SessionEngine
+from tts_cache import AudioCache
+from tts_engine import TTSEngine
+
+CONTEXT = "The mitochondria is the powerhouse of the cell. Photosynthesis happens in the chloroplast."
+ANSWER = ("The mitochondria makes energy for the cell. It does this by breaking down sugar. "
+          "That is why it is called the powerhouse of the cell.")
+
+
+def build(args):
+    genai = FakeGenerativeModel(answers=[ANSWER] * args.questions, first_token_latency=args.first_token,
+                                chunk_latency=args.chunk_latency)
+    tts = FakeTextToSpeechClient(latency=args.tts_latency, seconds_per_char=args.seconds_per_char)
+    # One final transcript per spoken question, released by the audio chunk that ends it
+    questions = [f"Question {number} about the cell?" for number in range(args.questions)]
+    speech = FakeSpeechClient(streams=[[(question, True) for question in questions]])
+    registry = fake_registry(speech=speech, tts=tts, genai=genai)
+    qa = QASystem(registry=registry)
+    qa.load_context(CONTEXT)
+    tts_engine = TTSEngine(registry=registry, cache=AudioCache(directory=None), sink=NullSink())
+
+    def recognize(callback):
+        """The recognizer thread: one audio chunk per question, `gap` seconds apart.
+
+        Like StreamingRecognizer, the next chunk is only read once the callback returns.
+        """
+        def requests():
+            for _ in questions:
+                time.sleep(args.gap)
+                yield SimpleNamespace(audio_content=b"\0" * 3200)
+
+        for response in registry.get("speech").streaming_recognize(None, requests()):
+            result = response.results[0]
+            callback(result.alternatives[0].transcript, result.is_final)
+
+    return qa, tts_engine, recognize
+
+
+def run_blocking(args):
+    qa, tts_engine, recognize = build(args)
+    marks = []
+
+    def on_transcript(transcript, is_final):
+        if not is_final:
+            return
+        marks.append(time.perf_counter())
+        tts_engine.speak_stream(qa.answer_question_stream(transcript))
+
+    started = time.perf_counter()
+    recognize(on_transcript)
+    tts_engine.playback.wait()
+    return marks, time.perf_counter() - started
+
+
+def run_session(args):
+    qa, tts_engine, recognize = build(args)
+    marks = []
+    done = threading.Semaphore(0)
+
+    def on_transcript(transcript, is_final):
+        if is_final:
+            marks.append(time.perf_counter())
+
+    def on_answer(question, answer, sources, timings, details):
+        done.release()
+
+    engine = SessionEngine(None, qa, tts_engine, on_transcript=on_transcript, on_answer=on_answer,
+                           on_error=print, max_active_turns=args.max_turns)
+    started = time.perf_counter()
+    recognize(engine.on_transcript)
+    for _ in range(args.questions):
+        done.acquire()
+    tts_engine.playback.wait()
+    elapsed = time.perf_counter() - started
+    engine.close()
+    return marks, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--gap", type=float, default=1.0, help="seconds between the end of one question and the next")
+    parser.add_argument("--first-token", type=float, default=0.6)
+    parser.add_argument("--chunk-latency", type=float, default=0.05)
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--seconds-per-char", type=float, default=0.01)
+    parser.add_argument("--max-turns", type=int, default=2)
+    args = parser.parse_args()
+
+    for name, run in (("blocking", run_blocking), ("session", run_session)):
+        asked, elapsed = run(args)
+        # How late each question was picked up, relative to when it was asked
+        expected = [asked[0] + i * args.gap for i in range(len(asked))]
+        lag = max(actual - due for actual, due in zip(asked, expected)) * 1000
+        print(f"{name:>9}: {len(asked)} questions, recognition lag up to {lag:7.1f} ms, "
+              f"all answers played after {elapsed:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
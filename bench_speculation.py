@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Latency of speculative answering from interim transcripts, with every cloud service faked.
+
+Each question is "spoken" one word every --word-gap seconds as growing interim
+transcripts; the final transcript follows --final-delay seconds after the last
+word, as a recognizer's endpointing does. For a --mismatch fraction of questions
+the final transcript differs from the last interim (the recognizer corrected a
+number), so the speculative work must be thrown away.
+
+The document is a large synthetic one (see bench_retrieval.py), so retrieval takes
+measurable time. Reported per speculation mode: time from the final transcript to
+the first answer token and to the first audio, how often the speculation was used
+and the latency it saved.
+
+    python bench_speculation.py --questions 10 --mismatch 0.2
+"""
+
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from bench_retrieval import make_document
+from fakes import FakeGenerativeModel, FakeTextToSpeechClient, fake_registry
+from playback import NullSink
+from qa_engine import QASystem
+from session import SPECULATION_MODES, SessionEngine
+from tts_cache import AudioCache
+from tts_engine import TTSEngine
+
+ANSWER = "The boiling point is given in the passage about that compound. It is measured at sea level."
+
+
+def misheard(question, rng):
+    """The question with its compound number recognized differently."""
+    words = question.split()
+    words[-1] = f"{rng.randint(100, 99999)}?"
+    return " ".join(words)
+
+
+def run(mode, args, text, questions):
+    rng = random.Random(args.seed)
+    registry = fake_registry(tts=FakeTextToSpeechClient(latency=args.tts_latency),
+                             genai=FakeGenerativeModel(answers=[ANSWER] * (2 * args.questions),
+                                                       first_token_latency=args.first_token,
+                                                       chunk_latency=args.chunk_latency))
+    qa = QASystem(registry=registry)
+    qa.load_context(text)
+    tts = TTSEngine(registry=registry, cache=AudioCache(directory=None), sink=NullSink())
+    answered = threading.Semaphore(0)
+    timings = []
+
+    def on_answer(question, answer, sources, turn_timings, details):
+        timings.append(turn_timings)
+        answered.release()
+
+    engine = SessionEngine(None, qa, tts, on_answer=on_answer, on_error=print, speculate=mode)
+    for question, _ in questions[:args.questions]:
+        words = question.split()
+        for count in range(1, len(words) + 1):
+            engine.on_transcript(" ".join(words[:count]), False)
+            time.sleep(args.word_gap)
+        time.sleep(args.final_delay)
+        final = misheard(question, rng) if rng.random() < args.mismatch else question
+        engine.on_transcript(final, True)
+        answered.acquire()
+        tts.playback.wait()
+    stats = engine.speculation_stats()
+    engine.close()
+    return timings, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--mismatch", type=float, default=0.2, help="fraction of finals that differ from the interim")
+    parser.add_argument("--word-gap", type=float, default=0.12, help="seconds between interim words")
+    parser.add_argument("--final-delay", type=float, default=0.6, help="seconds from the last word to the final")
+    parser.add_argument("--first-token", type=float, default=0.6)
+    parser.add_argument("--chunk-latency", type=float, default=0.05)
+    parser.add_argument("--tts-latency", type=float, default=0.2)
+    parser.add_argument("--words", type=int, default=400000, help="size of the synthetic document")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    text, questions = make_document(args.words, args.questions, random.Random(args.seed))
+    for mode in SPECULATION_MODES:
+        timings, stats = run(mode, args, text, questions)
+        first_token = statistics.median(t["first_token"] for t in timings)
+        first_audio = statistics.median(t["first_audio"] for t in timings if "first_audio" in t)
+        line = f"{str(mode):>9}: final -> first token p50 {first_token:7.1f} ms, first audio p50 {first_audio:7.1f} ms"
+        if mode is not None:
+            line += (f"; {stats['hits']}/{stats['started']} speculations used, "
+                     f"{stats['saved_ms_per_hit']:.0f} ms saved per hit")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Startup cost of the desktop app, measured in fresh interpreters.
+
+- import: the time to import each module on its own, and which heavy SDKs
+  (Google Cloud, Gemini, PyMuPDF, pygame) that import pulled in
+- construct: the time to build each service the window needs
+- first paint: the time from the interpreter being up to the window being drawn; needs a
+  display and is skipped without one
+
+Every measurement runs in a new process in a scratch directory, so nothing is
+cached between them; the median of --repeat runs is reported.
+
+    python bench_startup.py --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+MODULES = ["clients", "tracing", "playback", "retrieval", "doc_store", "ocr", "backend", "file_processor",
+           "qa_engine", "tts_engine", "session", "interaction_logger", "voicetotext"]
+HEAVY = ["google.cloud.speech", "google.cloud.texttospeech", "google.cloud.vision", "google.generativeai",
+         "fitz", "pygame"]
+
+IMPORT = """
+import sys, time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+print(",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+CONSTRUCT = """
+import time
+from backend import SpeechToTextConverter
+from file_processor import FileProcessor
+from qa_engine import QASystem
+from tts_engine import TTSEngine
+for name, build in [("SpeechToTextConverter", SpeechToTextConverter), ("FileProcessor", FileProcessor),
+                    ("QASystem", QASystem), ("TTSEngine", TTSEngine)]:
+    started = time.perf_counter()
+    build()
+    print(name, time.perf_counter() - started)
+"""
+
+FIRST_PAINT = """
+import time
+started = time.perf_counter()
+import tkinter as tk
+root = tk.Tk()
+import voicetotext
+app = voicetotext.Application(master=root)
+while not root.winfo_viewable():
+    root.update()
+root.update_idletasks()
+print(time.perf_counter() - started)
+root.destroy()
+"""
+
+
+def run(code, directory):
+    environment = dict(os.environ, PYTHONPATH=REPO + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, "-c", code], cwd=directory, env=environment,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise Exception(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    # Modules print [DEBUG] lines of their own; the measurements are the other lines
+    return [line for line in result.stdout.splitlines() if not line.startswith(("[DEBUG]", "Warning"))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+
+    print("import (ms)")
+    for module in MODULES:
+        times = []
+        loaded = ""
+        try:
+            for _ in range(args.repeat):
+                seconds, loaded = run(IMPORT.format(module=module, heavy=HEAVY), directory)[-2:]
+                times.append(float(seconds))
+        except Exception as e:
+            print(f"  {module:<20} failed: {e}")
+            continue
+        print(f"  {module:<20} {statistics.median(times) * 1000:8.1f}   {loaded or '-'}")
+
+    print("construct (ms)")
+    try:
+        runs = [run(CONSTRUCT, directory) for _ in range(args.repeat)]
+        for lines in zip(*runs):
+            name = lines[0].split()[0]
+            print(f"  {name:<20} {statistics.median(float(line.split()[1]) for line in lines) * 1000:8.1f}")
+    except Exception as e:
+        print(f"  failed: {e}")
+
+    try:
+        times = [float(run(FIRST_PAINT, directory)[-1]) for _ in range(args.repeat)]
+        print(f"first paint: {statistics.median(times) * 1000:.1f} ms after the interpreter was up")
+    except Exception as e:
+        print(f"first paint: skipped ({e})")
+
+
+if __name__ == "__main__":
+    main()
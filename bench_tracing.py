@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Overhead of the tracing layer, and the metrics it collects for faked voice turns.
+
+First times N empty spans, counters and records against an untraced loop to give
+the cost per call. Then runs a few voice turns through SessionEngine with every
+cloud service faked and prints the span percentiles and counters gathered along
+the way, plus the spans of the last turn under its correlation id.
+
+    python bench_tracing.py --calls 200000 --turns 5
+"""
+
+import argparse
+import time
+
+from fakes import FakeGenerativeModel, FakeTextToSpeechClient, fake_registry
+from playback import NullSink
+from qa_engine import QASystem
+from session import SessionEngine
+from tracing import Tracer, default_tracer
+from tts_cache import AudioCache
+from tts_engine import TTSEngine
+
+CONTEXT = "The mitochondria is the powerhouse of the cell. Photosynthesis happens in the chloroplast."
+
+
+def per_call(function, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - started) / calls
+
+
+def measure_overhead(calls):
+    tracer = Tracer()
+    disabled = Tracer(enabled=False)
+
+    def empty():
+        pass
+
+    def span():
+        with tracer.span("stage"):
+            pass
+
+    def disabled_span():
+        with disabled.span("stage"):
+            pass
+
+    baseline = per_call(empty, calls)
+    for name, function in (("span", span), ("span, tracing off", disabled_span),
+                           ("count", lambda: tracer.count("bytes", 3200)),
+                           ("record", lambda: tracer.record("stage", 0.01))):
+        cost = per_call(function, calls) - baseline
+        print(f"  {name:<18} {cost * 1e6:6.2f} us per call")
+
+
+def run_turns(turns):
+    registry = fake_registry(tts=FakeTextToSpeechClient(latency=0.05),
+                             genai=FakeGenerativeModel(first_token_latency=0.2, chunk_latency=0.02))
+    qa = QASystem(registry=registry)
+    qa.load_context(CONTEXT)
+    tts = TTSEngine(registry=registry, cache=AudioCache(directory=None), sink=NullSink())
+    engine = SessionEngine(None, qa, tts, on_error=print)
+    for number in range(turns):
+        engine.submit(f"What does the mitochondria do, part {number}?").result()
+    tts.playback.wait()
+    engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Overhead over {args.calls} calls:")
+    measure_overhead(args.calls)
+
+    default_tracer.reset()
+    run_turns(args.turns)
+    snapshot = default_tracer.snapshot()
+    print(f"\nSpans over {args.turns} faked turns:")
+    for name, summary in sorted(snapshot["spans"].items()):
+        print(f"  {name:<18} n={summary['count']:<4} p50 {summary['p50'] * 1000:8.1f} ms, "
+              f"p95 {summary['p95'] * 1000:8.1f} ms, p99 {summary['p99'] * 1000:8.1f} ms")
+    print("Counters:")
+    for name, value in sorted(snapshot["counters"].items()):
+        print(f"  {name:<18} {value}")
+    turn_id = default_tracer.recent_turns()[-1]
+    print(f"Last turn ({turn_id}):")
+    for name, milliseconds in default_tracer.turn_spans(turn_id):
+        print(f"  {name:<18} {milliseconds:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
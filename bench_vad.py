@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Offline harness for the utterance segmenter.
+
+Runs WAV fixtures through UtteranceSegmenter and reports segment boundaries, the
+fraction of audio discarded as silence and processing speed as a multiple of realtime.
+
+    python bench_vad.py recording1.wav recording2.wav
+    python bench_vad.py --synthesize fixtures/vad      # write synthetic fixtures first
+"""
+
+import argparse
+import math
+import os
+import random
+import struct
+import time
+import wave
+
+from audio_utils import read_wav
+from vad import UtteranceSegmenter
+
+RATE = 16000
+CHUNK_SECONDS = 0.1
+
+
+def segment(pcm):
+    """Run the segmenter over PCM data; returns (utterances, seconds spent)."""
+    chunk_bytes = int(RATE * CHUNK_SECONDS) * 2
+    segmenter = UtteranceSegmenter(chunk_seconds=CHUNK_SECONDS)
+    utterances = []
+    started = time.perf_counter()
+    for offset in range(0, len(pcm) - chunk_bytes + 1, chunk_bytes):
+        utterance = segmenter.feed(pcm[offset:offset + chunk_bytes])
+        if utterance:
+            utterances.append(utterance)
+    utterance = segmenter.flush()
+    if utterance:
+        utterances.append(utterance)
+    return utterances, time.perf_counter() - started, segmenter
+
+
+def report(path):
+    pcm = read_wav(path)
+    audio_seconds = len(pcm) / 2 / RATE
+    utterances, elapsed, segmenter = segment(pcm)
+    discarded = 1 - segmenter.chunks_emitted / segmenter.chunks_seen if segmenter.chunks_seen else 0.0
+    speed = audio_seconds / elapsed if elapsed else float('inf')
+    print(f"{path}: {audio_seconds:.1f}s audio, {len(utterances)} utterances")
+    for utterance in utterances:
+        print(f"  {utterance.start * CHUNK_SECONDS:7.2f}s - {utterance.end * CHUNK_SECONDS:7.2f}s")
+    print(f"  discarded as silence: {discarded:.1%}")
+    print(f"  processing speed: {speed:,.0f}x realtime")
+
+
+def voice(rng, pitch, seconds, noise):
+    samples = []
+    for i in range(int(RATE * seconds)):
+        # Syllable-rate amplitude modulation on a harmonic-rich tone
+        envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 4 * i / RATE)
+        tone = sum(math.sin(2 * math.pi * pitch * h * i / RATE) / h for h in (1, 2, 3))
+        samples.append(4000 * envelope * tone + rng.gauss(0, noise))
+    return samples
+
+
+def write_wav(path, samples):
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(b''.join(struct.pack('<h', max(-32768, min(32767, int(s)))) for s in samples))
+    return path
+
+
+def synthesize(directory, count=3, seed=0):
+    """Write WAV fixtures of noisy silence with voice-like bursts at random positions, and one
+    where the background noise steps up during speech (e.g. a fan switched on) and stays up."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for n in range(count):
+        samples = []
+        for _ in range(rng.randint(2, 4)):
+            samples += [rng.gauss(0, 60) for _ in range(int(RATE * rng.uniform(1.0, 3.0)))]
+            pitch = rng.uniform(110, 220)
+            samples += voice(rng, pitch, rng.uniform(0.8, 2.5), 60)
+        samples += [rng.gauss(0, 60) for _ in range(RATE)]
+        paths.append(write_wav(os.path.join(directory, f"synthetic_{n}.wav"), samples))
+    # Two questions 30 s apart; the noise rises from RMS 80 to 400 during the first
+    samples = [rng.gauss(0, 80) for _ in range(2 * RATE)] + voice(rng, 150, 2.0, 80)
+    samples += [rng.gauss(0, 400) for _ in range(30 * RATE)] + voice(rng, 150, 2.0, 400)
+    samples += [rng.gauss(0, 400) for _ in range(3 * RATE)]
+    paths.append(write_wav(os.path.join(directory, "noise_step.wav"), samples))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav_files", nargs="*")
+    parser.add_argument("--synthesize", metavar="DIR", help="write synthetic fixtures to DIR and include them")
+    args = parser.parse_args()
+
+    paths = list(args.wav_files)
+    if args.synthesize:
+        paths += synthesize(args.synthesize)
+    if not paths:
+        parser.error("give WAV files or --synthesize DIR")
+    for path in paths:
+        report(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Capture profiles: how microphone audio is recorded and how it is sent for recognition.
+
+A CaptureProfile sets the rate the recognizer is given, the chunk duration, the
+rate and channel count the device is opened with, and the upload codec. Audio
+from a device opened at another rate or in stereo is downmixed and resampled with
+NumPy, one chunk at a time, before anything else sees it.
+
+Codecs are the encodings Cloud Speech-to-Text accepts. LINEAR16 is raw 16-bit PCM.
+FLAC (lossless, about half the bytes) and OGG_OPUS (lossy, about a tenth) need
+the optional soundfile package. Compressed streams cost some latency: the encoder
+holds audio back until it has a full block (FLAC) or page (Ogg), so they suit
+slow links better than fast ones. bench_capture.py measures the trade-off.
+"""
+import io
+
+import numpy as np
+
+from clients import lazy_import
+
+soundfile = lazy_import("soundfile")
+
+# (container, subtype) for soundfile; LINEAR16 is sent as it is
+CODECS = {"LINEAR16": None, "FLAC": ("FLAC", "PCM_16"), "OGG_OPUS": ("OGG", "OPUS")}
+# Sample rates Opus (and Cloud Speech-to-Text with OGG_OPUS) accepts
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def codec_available(codec):
+    return codec == "LINEAR16" or (codec in CODECS and soundfile is not None)
+
+
+class CaptureProfile:
+    """Capture and upload settings.
+
+    rate: samples per second given to the recognizer
+    chunk_seconds: audio per read from the device and per streaming request
+    capture_rate, channels: what the device is opened with; downmixed and resampled to mono at `rate`
+    codec: "LINEAR16", "FLAC" or "OGG_OPUS"
+    """
+    def __init__(self, name="default", rate=16000, chunk_seconds=0.1, capture_rate=None, channels=1,
+                 codec="LINEAR16"):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        if codec == "OGG_OPUS" and rate not in OPUS_RATES:
+            raise ValueError(f"OGG_OPUS needs a rate of {', '.join(str(r) for r in OPUS_RATES)} Hz, not {rate}")
+        self.name = name
+        self.rate = rate
+        self.chunk_seconds = chunk_seconds
+        self.capture_rate = capture_rate or rate
+        self.channels = channels
+        self.codec = codec
+
+    @property
+    def chunk(self):
+        """Frames per device read."""
+        return max(1, int(self.capture_rate * self.chunk_seconds))
+
+    def converter(self):
+        """A new AudioConverter for one capture stream, or None when the device audio needs no conversion."""
+        if self.capture_rate == self.rate and self.channels == 1:
+            return None
+        return AudioConverter(self.channels, self.capture_rate, self.rate)
+
+    def __repr__(self):
+        device = f", device {self.capture_rate} Hz x{self.channels}" if self.converter() else ""
+        return f"<CaptureProfile {self.name}: {self.rate} Hz, {self.chunk_seconds * 1000:g} ms chunks, {self.codec}{device}>"
+
+
+class AudioConverter:
+    """Downmixes interleaved 16-bit audio to mono and resamples it by linear interpolation.
+
+    Keeps the last sample and the resampling phase between chunks, so a stream
+    converted chunk by chunk has no seams. There is no low-pass filter; speech has
+    little energy above 8 kHz, the limit at the usual 16 kHz.
+    """
+    def __init__(self, channels, source_rate, target_rate):
+        self.channels = channels
+        self.step = source_rate / target_rate
+        self._previous = None
+        # Position of the next output sample, counted from the first sample of the next call
+        self._position = 0.0
+
+    def convert(self, data):
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.channels > 1:
+            samples = samples[:len(samples) - len(samples) % self.channels]
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        if self.step == 1.0:
+            return samples.astype(np.int16).tobytes()
+        if self._previous is not None:
+            samples = np.concatenate(([self._previous], samples))
+        if len(samples) < 2:
+            return b""
+        last = len(samples) - 1
+        positions = np.arange(self._position, last, self.step)
+        converted = np.interp(positions, np.arange(len(samples)), samples)
+        self._position = (positions[-1] + self.step if len(positions) else self._position) - last
+        self._previous = samples[-1]
+        return np.round(converted).astype(np.int16).tobytes()
+
+
+class StreamEncoder:
+    """Encodes PCM chunks into one continuous FLAC or Ogg Opus stream, as a streaming recognizer expects.
+
+    encode() returns whatever the encoder has finished so far, which may be nothing;
+    close() returns the rest.
+    """
+    def __init__(self, codec, rate):
+        self.codec = codec
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._buffer = None
+        if codec == "LINEAR16":
+            return
+        if not codec_available(codec):
+            raise Exception(f"The {codec} codec needs soundfile: pip install soundfile")
+        self._buffer = io.BytesIO()
+        container, subtype = CODECS[codec]
+        self._file = soundfile.SoundFile(self._buffer, mode="w", samplerate=rate, channels=1,
+                                         format=container, subtype=subtype)
+        self._sent = 0
+
+    def encode(self, pcm):
+        self.bytes_in += len(pcm)
+        if self._buffer is None:
+            self.bytes_out += len(pcm)
+            return pcm
+        self._file.write(np.frombuffer(pcm, dtype=np.int16))
+        return self._take()
+
+    def close(self):
+        if self._buffer is None:
+            return b""
+        self._file.close()
+        return self._take()
+
+    def _take(self):
+        # The encoder may seek back to fill in its header; only bytes past what was sent are new
+        data = self._buffer.getbuffer()[self._sent:].tobytes()
+        self._sent += len(data)
+        self.bytes_out += len(data)
+        return data
+
+
+def encode_audio(pcm, codec, rate):
+    """Encode one complete utterance of 16-bit mono PCM."""
+    encoder = StreamEncoder(codec, rate)
+    return encoder.encode(pcm) + encoder.close()
+
+
+PROFILES = {
+    "default": CaptureProfile("default"),
+    # 20 ms chunks: audio reaches the recognizer sooner, with five times the requests
+    "low_latency": CaptureProfile("low_latency", chunk_seconds=0.02),
+    "flac": CaptureProfile("flac", codec="FLAC"),
+    "low_bandwidth": CaptureProfile("low_bandwidth", codec="OGG_OPUS"),
+    # Devices that only open at 48 kHz stereo, e.g. some USB headsets
+    "usb_48k_stereo": CaptureProfile("usb_48k_stereo", capture_rate=48000, channels=2),
+}
+DEFAULT_PROFILE = PROFILES["default"]
+
+
+def get_profile(profile):
+    """A CaptureProfile, or the preset with that name."""
+    if isinstance(profile, CaptureProfile):
+        return profile
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown capture profile: {profile}")
+    return PROFILES[profile]
+
+
+if __name__ == '__main__':
+    # Example usage: a second of 48 kHz stereo tone through every preset
+    t = np.arange(48000) / 48000
+    tone = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+    stereo = np.repeat(tone, 2).tobytes()
+    for profile in PROFILES.values():
+        converter = AudioConverter(2, 48000, profile.rate)
+        pcm = converter.convert(stereo)
+        if not codec_available(profile.codec):
+            print(f"[DEBUG] {profile}: {profile.codec} not available")
+            continue
+        print(f"[DEBUG] {profile}: {len(stereo)} bytes -> {len(pcm)} PCM -> "
+              f"{len(encode_audio(pcm, profile.codec, profile.rate))} {profile.codec}")
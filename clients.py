@@ -0,0 +1,217 @@
+"""
+Shared, long-lived Google API clients.
+
+Every component asks the registry for its client instead of building a new one,
+so the gRPC channel and TLS handshake are paid once per process. Channels use
+keepalive pings, can be warmed up at startup and are rebuilt when a call fails
+because the connection went away.
+
+The Google SDKs take about a second to import, so modules import them with
+lazy_import() and components hold proxy() clients: both are only loaded on first
+use, or ahead of time by warm_up() once the app is on screen.
+"""
+import importlib
+import importlib.util
+import os
+import threading
+
+GENAI_MODEL = 'models/gemini-1.5-pro-latest'
+
+# Keep idle channels open and notice dead connections before the next request
+KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+def lazy_import(name):
+    """Return a LazyModule for an installed module, or None if it is not installed.
+
+    Use it for optional dependencies in place of try: import / except ImportError.
+    """
+    try:
+        if importlib.util.find_spec(name) is None:
+            return None
+    except ImportError:
+        return None
+    return LazyModule(name)
+
+
+class LazyClient:
+    """Stands in for a registry client; every attribute is looked up on the registry's current client,
+    so the client is created on first use and a reconnected client is picked up."""
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.get(self._name), attr)
+
+    def __repr__(self):
+        return f"<lazy {self._name} client>"
+
+
+def _is_connection_error(error):
+    """True for errors that mean the channel is unusable rather than the request being bad."""
+    try:
+        from google.api_core import exceptions as core_exceptions
+        if isinstance(error, core_exceptions.ServiceUnavailable):
+            return True
+    except ImportError:
+        pass
+    try:
+        import grpc
+        if isinstance(error, grpc.RpcError) and error.code() == grpc.StatusCode.UNAVAILABLE:
+            return True
+    except ImportError:
+        pass
+    return isinstance(error, ConnectionError)
+
+
+class ClientRegistry:
+    """Creates each service client once and hands out the same instance on every call.
+
+    `endpoints` maps a service name to a "host:port" reached over an insecure channel,
+    which is how a local gRPC stand-in server replaces the real service.
+    """
+    def __init__(self, endpoints=None, channel_options=None):
+        self._endpoints = dict(endpoints or {})
+        self._channel_options = channel_options or KEEPALIVE_OPTIONS
+        self._factories = {
+            "speech": self._make_speech,
+            "tts": self._make_tts,
+            "vision": self._make_vision,
+            "genai": self._make_genai,
+        }
+        self._clients = {}
+        self._channels = {}
+        self._lock = threading.Lock()
+        self.reconnects = 0
+
+    def register(self, name, factory):
+        """Use `factory()` to build the named client, e.g. to install a local fake."""
+        with self._lock:
+            self._factories[name] = factory
+            self._clients.pop(name, None)
+            self._channels.pop(name, None)
+
+    def get(self, name):
+        """Return the shared client for a service, creating it on first use."""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            if name not in self._clients:
+                if name not in self._factories:
+                    raise KeyError(f"Unknown service client: {name}")
+                self._clients[name] = self._factories[name]()
+            return self._clients[name]
+
+    def proxy(self, name):
+        """A LazyClient for the named service; nothing is created until it is used."""
+        if name not in self._factories:
+            raise KeyError(f"Unknown service client: {name}")
+        return LazyClient(self, name)
+
+    def reset(self, name):
+        """Drop a client and close its channel; the next get() reconnects."""
+        with self._lock:
+            self._clients.pop(name, None)
+            channel = self._channels.pop(name, None)
+        if channel is not None:
+            try:
+                channel.close()
+            except Exception:
+                pass
+
+    def call(self, name, method, *args, **kwargs):
+        """Call a client method, reconnecting and retrying once if the channel failed."""
+        try:
+            return getattr(self.get(name), method)(*args, **kwargs)
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            self.reset(name)
+            self.reconnects += 1
+            return getattr(self.get(name), method)(*args, **kwargs)
+
+    def warm_up(self, names=None, timeout=10.0, background=True):
+        """Create clients and wait for their channels to connect, by default on a background thread."""
+        names = list(names or self._factories)
+        if background:
+            thread = threading.Thread(target=self._warm_up, args=(names, timeout), daemon=True)
+            thread.start()
+            return thread
+        self._warm_up(names, timeout)
+        return None
+
+    def _warm_up(self, names, timeout):
+        for name in names:
+            try:
+                self.get(name)
+                channel = self._channels.get(name)
+                if channel is not None:
+                    import grpc
+                    grpc.channel_ready_future(channel).result(timeout=timeout)
+            except Exception as e:
+                print(f"[DEBUG] Warm-up of {name} client failed: {e}")
+
+    def close(self):
+        for name in list(self._clients):
+            self.reset(name)
+
+    def _grpc_client(self, name, client_class):
+        """Build a client on a channel we own, so keepalive options and reconnection apply."""
+        import grpc
+        transport_class = client_class.get_transport_class("grpc")
+        endpoint = self._endpoints.get(name)
+        if endpoint:
+            channel = grpc.insecure_channel(endpoint, options=self._channel_options)
+        else:
+            channel = transport_class.create_channel(options=self._channel_options)
+        self._channels[name] = channel
+        return client_class(transport=transport_class(channel=channel))
+
+    def _make_speech(self):
+        from google.cloud import speech
+        return self._grpc_client("speech", speech.SpeechClient)
+
+    def _make_tts(self):
+        from google.cloud import texttospeech
+        return self._grpc_client("tts", texttospeech.TextToSpeechClient)
+
+    def _make_vision(self):
+        from google.cloud import vision
+        return self._grpc_client("vision", vision.ImageAnnotatorClient)
+
+    def _make_genai(self):
+        import google.generativeai as genai
+        # Configure the API key from environment; masked default for public repos
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY", "XXXXXXXXXXXX"))
+        return genai.GenerativeModel(GENAI_MODEL)
+
+
+default_registry = ClientRegistry()
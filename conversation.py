@@ -0,0 +1,110 @@
+"""
+Bounded memory of a conversation, so follow-up questions can be answered.
+
+The last few turns are kept word for word in a ring buffer; answers are clipped.
+A turn pushed out of the buffer is rolled into a running summary of the question
+and the first sentence of its answer, and the oldest summary lines are dropped
+once the summary is full. The history sent with a question therefore stops
+growing after a few turns, however long the conversation runs.
+"""
+import collections
+import re
+import threading
+
+from answer_cache import normalize_question
+
+MAX_TURNS = 4
+MAX_ANSWER_CHARS = 600
+MAX_SUMMARY_CHARS = 1200
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+# Pronouns that refer back to something said earlier, when they come early in the question
+FOLLOW_UP_PRONOUNS = frozenset("it its they them their those these he she him her".split())
+# A pronoun counts within this many leading words ("where is it found", "what are they made of")
+PRONOUN_WORDS = 3
+FOLLOW_UP_OPENINGS = ("and ", "what about ", "how about ")
+# "that one", "these ones": a choice among things named earlier
+_DEMONSTRATIVE_ONE = re.compile(r"\b(?:that|this|those|these) ones?\b")
+
+
+def is_follow_up(question):
+    """Whether a question only makes sense after the turns before it, e.g. "and the second one?",
+    "where is it found?" or "why is that one so high?". Standalone questions are the norm, so the
+    rule is kept narrow."""
+    normalized = normalize_question(question)
+    if normalized.startswith(FOLLOW_UP_OPENINGS) or _DEMONSTRATIVE_ONE.search(normalized):
+        return True
+    return not FOLLOW_UP_PRONOUNS.isdisjoint(normalized.split()[:PRONOUN_WORDS])
+
+
+def first_sentence(text, limit=200):
+    sentence = _SENTENCE_END.split(text.strip(), 1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rsplit(" ", 1)[0] + "..."
+
+
+class ConversationMemory:
+    def __init__(self, max_turns=MAX_TURNS, max_answer_chars=MAX_ANSWER_CHARS, max_summary_chars=MAX_SUMMARY_CHARS):
+        self.max_answer_chars = max_answer_chars
+        self.max_summary_chars = max_summary_chars
+        self.turns = collections.deque(maxlen=max_turns)
+        self.summary = collections.deque()
+        self._summary_chars = 0
+        self._lock = threading.Lock()
+        self.total_turns = 0
+
+    def __len__(self):
+        return self.total_turns
+
+    def add(self, question, answer):
+        """Remember a delivered turn; the oldest kept turn moves into the summary."""
+        answer = answer.strip()
+        if len(answer) > self.max_answer_chars:
+            answer = answer[:self.max_answer_chars].rsplit(" ", 1)[0] + "..."
+        with self._lock:
+            if len(self.turns) == self.turns.maxlen:
+                self._summarize(*self.turns[0])
+            self.turns.append((question.strip(), answer))
+            self.total_turns += 1
+
+    def _summarize(self, question, answer):
+        line = f"- Asked: {question} Answered: {first_sentence(answer)}"
+        self.summary.append(line)
+        self._summary_chars += len(line) + 1
+        while self._summary_chars > self.max_summary_chars and len(self.summary) > 1:
+            self._summary_chars -= len(self.summary.popleft()) + 1
+
+    def clear(self):
+        with self._lock:
+            self.turns.clear()
+            self.summary.clear()
+            self._summary_chars = 0
+            self.total_turns = 0
+
+    def search_text(self, question):
+        """Text to retrieve passages with: a follow-up is searched together with the question before it."""
+        with self._lock:
+            if not self.turns or not is_follow_up(question):
+                return question
+            return f"{self.turns[-1][0]} {question}"
+
+    def render(self):
+        """The history for a prompt, or "" when nothing has been said yet."""
+        with self._lock:
+            if not self.turns:
+                return ""
+            parts = []
+            if self.summary:
+                parts.append("Earlier in the conversation:\n" + "\n".join(self.summary))
+            parts.append("\n\n".join(f"Student: {question}\nTutor: {answer}" for question, answer in self.turns))
+            return "\n\n".join(parts)
+
+
+if __name__ == '__main__':
+    # Example usage (for testing)
+    memory = ConversationMemory(max_turns=2)
+    memory.add("What does the mitochondria do?", "It makes energy for the cell. It breaks down sugar.")
+    memory.add("What about the chloroplast?", "It carries out photosynthesis.")
+    memory.add("Where is it found?", "In plant cells.")
+    print(memory.render())
+    print(memory.search_text("And the second one?"))
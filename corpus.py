@@ -0,0 +1,143 @@
+"""
+A corpus of many documents that can be searched together or one at a time.
+
+Every document keeps its own BM25 index segment, so adding or removing a document
+never rebuilds the others. A search combines the collection statistics of the
+segments in scope, scores each segment against them and merges the results. Saved
+segments are memory-mapped, so a corpus of thousands of pages mostly stays on disk,
+and a saved segment is loaded once per process however many corpora search it.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+import weakref
+
+from retrieval import BM25Index, tokenize
+
+Hit = collections.namedtuple("Hit", ["doc_id", "name", "page", "text", "score"])
+
+# Segments loaded from disk, by directory, for as long as some corpus uses them
+_loaded = weakref.WeakValueDictionary()
+_loaded_lock = threading.Lock()
+
+
+def load_segment(index_dir):
+    """The segment saved in index_dir, memory-mapped; every caller gets the same instance."""
+    key = os.path.abspath(index_dir)
+    with _loaded_lock:
+        index = _loaded.get(key)
+        if index is None:
+            index = _loaded[key] = BM25Index.load(index_dir)
+    return index
+
+
+class Corpus:
+    def __init__(self, manifest_path=None):
+        self.manifest_path = manifest_path
+        self._documents = collections.OrderedDict()
+        self._segments = {}
+        self._lock = threading.Lock()
+        if manifest_path and os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                for entry in json.load(f):
+                    if os.path.exists(os.path.join(entry["index_dir"], "vocab.json")):
+                        self._documents[entry["doc_id"]] = entry
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._documents
+
+    def documents(self):
+        """(doc_id, name) of every document, in the order they were added."""
+        return [(doc_id, entry["name"]) for doc_id, entry in self._documents.items()]
+
+    def index_dir(self, doc_id):
+        """Directory a document's segment is saved in, or None."""
+        entry = self._documents.get(doc_id)
+        return entry["index_dir"] if entry else None
+
+    def add(self, doc_id, name, index, index_dir=None):
+        """Add or replace a document's index segment; only documents with an index_dir are persisted.
+
+        The index is searched as given, so corpora given the same index share it; pass
+        load_segment(index_dir) for one saved to disk.
+        """
+        entry = {"doc_id": doc_id, "name": name, "index_dir": index_dir, "chunks": len(index), "total_length": index.total_length}
+        with self._lock:
+            self._documents[doc_id] = entry
+            self._segments[doc_id] = index
+        self._save()
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._documents.pop(doc_id, None)
+            self._segments.pop(doc_id, None)
+        self._save()
+
+    def fingerprint(self, doc_ids=None):
+        """Identifies the documents a search would cover, for keying cached answers."""
+        scope = sorted(doc_ids) if doc_ids else sorted(self._documents)
+        return hashlib.sha256("\n".join(scope).encode("utf-8")).hexdigest()
+
+    def search(self, query, k=5, doc_ids=None):
+        """Best k passages across the corpus, or only the given documents, as Hits."""
+        with self._lock:
+            entries = [entry for doc_id, entry in self._documents.items() if not doc_ids or doc_id in doc_ids]
+        if not entries:
+            return []
+        segments = [(entry, self._segment(entry)) for entry in entries]
+
+        num_chunks = sum(entry["chunks"] for entry in entries)
+        if not num_chunks:
+            return []
+        avgdl = sum(entry["total_length"] for entry in entries) / num_chunks
+        tokens = set(tokenize(query))
+        frequencies = {token: sum(index.document_frequency(token) for _, index in segments) for token in tokens}
+        stats = (num_chunks, avgdl, frequencies)
+
+        hits = []
+        for entry, index in segments:
+            for chunk_id, score in index.search(query, k, stats=stats):
+                hits.append(Hit(entry["doc_id"], entry["name"], index.page(chunk_id), index.chunk(chunk_id), score))
+        hits.sort(key=lambda hit: hit.score, reverse=True)
+        return hits[:k]
+
+    def opening(self, k=5, doc_ids=None, max_chars=12000):
+        """The first passages of each document in scope as Hits with score 0, at most k and
+        max_chars in total; the context for questions no passage matches."""
+        with self._lock:
+            entries = [entry for doc_id, entry in self._documents.items() if not doc_ids or doc_id in doc_ids]
+        hits = []
+        budget = max_chars // max(len(entries), 1)
+        for entry in entries[:k]:
+            index = self._segment(entry)
+            used = 0
+            for chunk_id in range(min(len(index), max(k // len(entries), 1))):
+                text = index.chunk(chunk_id)
+                if used and used + len(text) > budget:
+                    break
+                hits.append(Hit(entry["doc_id"], entry["name"], index.page(chunk_id), text[:budget], 0.0))
+                used += len(text)
+        return hits
+
+    def _segment(self, entry):
+        index = self._segments.get(entry["doc_id"])
+        if index is None:
+            index = load_segment(entry["index_dir"])
+            with self._lock:
+                self._segments[entry["doc_id"]] = index
+        return index
+
+    def _save(self):
+        if not self.manifest_path:
+            return
+        with self._lock:
+            persisted = [entry for entry in self._documents.values() if entry["index_dir"]]
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(persisted, f)
+        os.replace(temp_path, self.manifest_path)
@@ -0,0 +1,118 @@
+"""
+Content-addressed store of extracted documents.
+
+Each document lives in a directory named after the SHA-256 of the file plus the
+extractor version. The directory holds the UTF-8 text of all pages, the byte offset
+where each page starts, the page numbers, and any index derived from the text.
+Text and offsets are memory-mapped on load, so reopening a stored textbook reads
+only what is used.
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+HASH_BLOCK = 1024 * 1024
+
+
+def hash_file(file_path):
+    """SHA-256 of a file, read in blocks so large files never sit in memory at once."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StoredDocument:
+    """A document in the store; page text is read from the memory-mapped text file."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.doc_id = os.path.basename(directory)
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.name = meta["name"]
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        self.page_numbers = np.load(os.path.join(directory, "page_numbers.npy"), mmap_mode="r")
+        self._text = None
+
+    @property
+    def page_count(self):
+        return len(self.page_numbers)
+
+    def _mapped_text(self):
+        if self._text is None:
+            if self.offsets[-1] == 0:
+                self._text = b""
+            else:
+                with open(os.path.join(self.directory, "text.txt"), "rb") as f:
+                    self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._text
+
+    def page_text(self, i):
+        """Text of the i-th stored page (0-based position, not page number)."""
+        return self._mapped_text()[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def iter_pages(self, page_type):
+        for i in range(self.page_count):
+            yield page_type(int(self.page_numbers[i]), self.page_text(i))
+
+    @property
+    def text(self):
+        return self._mapped_text()[:].decode("utf-8")
+
+
+class DocumentStore:
+    def __init__(self, root="doc_store"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, file_path, extractor_version):
+        return f"{hash_file(file_path)}-v{extractor_version}"
+
+    def index_dir(self, key):
+        return os.path.join(self.root, key, "index")
+
+    def get(self, key):
+        """Return the stored document for a key, or None."""
+        directory = os.path.join(self.root, key)
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            return None
+        return StoredDocument(directory)
+
+    def write_pages(self, key, name, pages):
+        """Yield pages through unchanged while storing them; the entry is committed once all have been read.
+
+        If the caller stops early or extraction fails, nothing is stored.
+        """
+        staging = tempfile.mkdtemp(prefix=f".{key}-", dir=self.root)
+        committed = False
+        try:
+            offsets = [0]
+            page_numbers = []
+            with open(os.path.join(staging, "text.txt"), "wb") as text_file:
+                for page in pages:
+                    data = page.text.encode("utf-8")
+                    text_file.write(data)
+                    offsets.append(offsets[-1] + len(data))
+                    page_numbers.append(page.number)
+                    yield page
+            np.save(os.path.join(staging, "offsets.npy"), np.array(offsets, dtype=np.int64))
+            np.save(os.path.join(staging, "page_numbers.npy"), np.array(page_numbers, dtype=np.int32))
+            with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"name": name, "pages": len(page_numbers)}, f)
+            target = os.path.join(self.root, key)
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(staging, target)
+            committed = True
+        finally:
+            if not committed:
+                shutil.rmtree(staging, ignore_errors=True)
+
+    def remove(self, key):
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
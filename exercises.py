@@ -0,0 +1,176 @@
+"""
+Index of the chapters and exercises in a textbook.
+
+While a document is loaded its lines are scanned for chapter headings ("Chapter 3",
+"CHAPTER III", "Unit 2"), exercise headings ("Exercise 3.4", "Question 4:", "Q4.",
+"Problem 2") and numbered items under an "Exercises" or "Review Questions" heading.
+Each exercise is stored under (chapter, number) with its text, so a request such as
+"help me with question 4 from chapter 3" is a dictionary lookup.
+"""
+import collections
+import json
+import os
+import re
+
+# Longest span kept for one exercise; the rest of a runaway span is usually body text
+MAX_EXERCISE_CHARS = 3000
+
+Exercise = collections.namedtuple("Exercise", ["chapter", "number", "page", "text"])
+
+_WORD_NUMBERS = {
+    word: value for value, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen "
+        "fifteen sixteen seventeen eighteen nineteen twenty".split())
+}
+_ROMAN = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+_ROMAN_NUMERAL = re.compile(r"^c{0,3}(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$")
+# Chapter headings are short lines; a longer line starting "Chapter 3" is body text
+MAX_HEADING_WORDS = 8
+
+_CHAPTER_HEADING = re.compile(r"^\s*(?:chapter|unit|lesson)\s+([0-9]+|[ivxlc]+|[a-z]+)\b\s*[.:\-]?", re.IGNORECASE)
+# "Question 4 asks..." in body text is not a heading, but "Question 4:" and "Exercise 3.4 Explain..." are
+_EXERCISE_HEADING = re.compile(
+    r"^\s*(?:exercise|question|problem|q)\s*\.?\s*([0-9]+)(?:\.([0-9]+)(?=[\s.):\-]|$)|(?=\s*(?:[.):\-]|$)))", re.IGNORECASE)
+_SECTION_HEADING = re.compile(
+    r"^\s*(?:review|practice|end[- ]of[- ]chapter|chapter|self[- ]check)?\s*(?:exercises|questions|problems)\s*:?\s*$",
+    re.IGNORECASE)
+_NUMBERED_ITEM = re.compile(r"^\s*([0-9]+)(?:\.([0-9]+))?\s*[.)]\s+\S")
+_DECIMAL_ITEM = re.compile(r"^\s*([0-9]+)\.([0-9]+)\s+\S")
+
+_REFERENCE_CHAPTER = re.compile(r"\b(?:chapter|unit|lesson)\s+([0-9]+|[a-z]+)\b", re.IGNORECASE)
+# Only explicit references count: "question 4", "question four", "exercise 3.4", "problem number 2",
+# "help me with number 5". A bare number ("atomic number 8", "the number one cause") is part of
+# an ordinary question. Recognizers often spell small numbers out, so words up to twenty count too.
+_NUMBER = r"([0-9]+|" + "|".join(_WORD_NUMBERS) + r")"
+_REFERENCE_QUESTION = re.compile(
+    r"\b(?:question|exercise|problem)\s*(?:number\s*|no\.?\s*|#\s*)?" + _NUMBER + r"(?:\.([0-9]+))?\b"
+    r"|\bhelp me with (?:number|no\.?|#)\s*" + _NUMBER + r"\b", re.IGNORECASE)
+
+
+def _parse_number(token, roman=True):
+    """Digits, a spelled-out number up to twenty, or a Roman numeral; None otherwise."""
+    token = token.lower()
+    if token.isdigit():
+        return int(token)
+    if token in _WORD_NUMBERS:
+        return _WORD_NUMBERS[token]
+    if roman and token and _ROMAN_NUMERAL.match(token):
+        values = [_ROMAN[char] for char in token]
+        return sum(-value if value < following else value
+                   for value, following in zip(values, values[1:] + [0]))
+    return None
+
+
+def parse_reference(question):
+    """Return (chapter, number) for a spoken reference to an exercise, or None.
+
+    chapter is None when the question does not name one. "Exercise 3.4" means
+    chapter 3, exercise 4.
+    """
+    match = _REFERENCE_QUESTION.search(question)
+    if match is None:
+        return None
+    if match.group(2):
+        return _parse_number(match.group(1), roman=False), int(match.group(2))
+    number = _parse_number(match.group(1) or match.group(3), roman=False)
+    chapter_match = _REFERENCE_CHAPTER.search(question)
+    chapter = _parse_number(chapter_match.group(1), roman=False) if chapter_match else None
+    return chapter, number
+
+
+class ExerciseIndex:
+    """Maps (chapter, number) to an Exercise; chapter is None for exercises before any chapter heading."""
+    def __init__(self, exercises=()):
+        self._exercises = {}
+        self._chapters = collections.defaultdict(list)
+        for exercise in exercises:
+            self._add(exercise)
+
+    def __len__(self):
+        return len(self._exercises)
+
+    def __iter__(self):
+        return iter(self._exercises.values())
+
+    def _add(self, exercise):
+        key = (exercise.chapter, exercise.number)
+        # Keep the first occurrence; a later "Question 4" in the same chapter is usually a cross-reference
+        if key not in self._exercises:
+            self._exercises[key] = exercise
+            self._chapters[exercise.number].append(exercise.chapter)
+
+    def get(self, chapter, number):
+        """Return the exercise, or None."""
+        return self._exercises.get((chapter, number))
+
+    def chapters_with(self, number):
+        """Chapters that have an exercise with this number, in document order."""
+        return list(self._chapters.get(number, []))
+
+    @classmethod
+    def build(cls, pages):
+        """Scan an iterable of (page_number, text) pages for chapters and exercises."""
+        index = cls()
+        chapter = None
+        in_section = False
+        last_item = 0
+        current = None  # [chapter, number, page, lines]
+
+        def finish():
+            if current is not None:
+                text = "\n".join(current[3]).strip()[:MAX_EXERCISE_CHARS]
+                index._add(Exercise(current[0], current[1], current[2], text))
+
+        for page_number, text in pages:
+            for line in text.splitlines():
+                heading = _CHAPTER_HEADING.match(line)
+                number = None
+                if heading and len(line.split()) <= MAX_HEADING_WORDS:
+                    number = _parse_number(heading.group(1))
+                if number is not None:
+                    finish()
+                    chapter, in_section, last_item, current = number, False, 0, None
+                    continue
+                if _SECTION_HEADING.match(line):
+                    finish()
+                    in_section, last_item, current = True, 0, None
+                    continue
+                match = _EXERCISE_HEADING.match(line)
+                if match is None and in_section:
+                    match = _NUMBERED_ITEM.match(line) or _DECIMAL_ITEM.match(line)
+                    # Numbered items must count up, so sub-steps and stray numbers do not start new exercises
+                    if match and int(match.group(2) or match.group(1)) <= last_item:
+                        match = None
+                if match is not None:
+                    finish()
+                    if match.group(2):
+                        item_chapter, item = int(match.group(1)), int(match.group(2))
+                    else:
+                        item_chapter, item = chapter, int(match.group(1))
+                    last_item = item
+                    current = [item_chapter, item, page_number, [line]]
+                elif current is not None:
+                    current[3].append(line)
+        finish()
+        return index
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "exercises.json"), "w", encoding="utf-8") as f:
+            json.dump([list(exercise) for exercise in self], f)
+
+    @classmethod
+    def load(cls, directory):
+        """Load a saved index; returns None if the directory has none."""
+        path = os.path.join(directory, "exercises.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls(Exercise(*record) for record in json.load(f))
+
+
+if __name__ == '__main__':
+    sample = "Chapter 3: Cells\nCells are small.\nExercises\n1. What is a cell?\n2. Name two organelles.\n   a) one\n"
+    exercises = ExerciseIndex.build([(1, sample)])
+    print(exercises.get(3, 2))
+    print(parse_reference("Help me with question 2 from chapter three"))
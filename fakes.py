@@ -0,0 +1,180 @@
+"""
+Local stand-ins for the cloud services, used to exercise the pipeline offline.
+
+fake_registry() returns a ClientRegistry whose speech, tts, vision and genai clients
+are all fakes, so a whole turn runs with fixed, known latencies.
+"""
+import io
+import time
+import wave
+from types import SimpleNamespace
+
+
+def make_streaming_response(transcript, is_final):
+    """Builds an object shaped like a StreamingRecognizeResponse with one result."""
+    alternative = SimpleNamespace(transcript=transcript)
+    result = SimpleNamespace(alternatives=[alternative], is_final=is_final)
+    return SimpleNamespace(results=[result])
+
+
+class FakeSpeechClient:
+    """Replays canned (transcript, is_final) responses for every streaming_recognize call.
+
+    `streams` is a list with one list of responses per stream; once it runs out, further
+    streams produce no results. One canned response is released per audio request
+    received, and any left over are released when the request stream ends.
+    `transcripts` are returned one per batch recognize() call.
+    """
+    def __init__(self, streams=None, latency=0.0, transcripts=None):
+        self._streams = list(streams or [])
+        self._latency = latency
+        self._transcripts = list(transcripts or [])
+        self.streams_opened = 0
+        self.recognize_calls = 0
+        self.requests_received = 0
+        self.bytes_received = 0
+
+    def streaming_recognize(self, config, requests):
+        canned = self._streams.pop(0) if self._streams else []
+        self.streams_opened += 1
+        return self._replay(canned, requests)
+
+    def recognize(self, config, audio):
+        """Returns the next canned transcript as a final batch result."""
+        self.recognize_calls += 1
+        self.bytes_received += len(audio.content)
+        if self._latency:
+            time.sleep(self._latency)
+        if not self._transcripts:
+            return SimpleNamespace(results=[])
+        return make_streaming_response(self._transcripts.pop(0), True)
+
+    def _replay(self, canned, requests):
+        pending = list(canned)
+        for request in requests:
+            self.requests_received += 1
+            self.bytes_received += len(request.audio_content)
+            if pending:
+                if self._latency:
+                    time.sleep(self._latency)
+                yield make_streaming_response(*pending.pop(0))
+        for transcript, is_final in pending:
+            yield make_streaming_response(transcript, is_final)
+
+
+class FakeAudioSource:
+    """Stands in for MicrophoneStream, yielding canned audio chunks instead of mic input."""
+    def __init__(self, chunks, chunk_seconds=0.0):
+        self._chunks = list(chunks)
+        self._chunk_seconds = chunk_seconds
+        self.closed = True
+        self.volume_callback = None
+
+    def __enter__(self):
+        self.closed = False
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.closed = True
+
+    def generator(self):
+        while not self.closed and self._chunks:
+            if self._chunk_seconds:
+                time.sleep(self._chunk_seconds)
+            yield self._chunks.pop(0)
+        self.closed = True
+
+
+def silent_wav(seconds, rate=24000):
+    """Returns a WAV file of silence, usable wherever synthesized audio is expected."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(bytes(int(seconds * rate) * 2))
+    return buffer.getvalue()
+
+
+class FakeTextToSpeechClient:
+    """Answers synthesize_speech with silence whose length follows the text length."""
+    def __init__(self, latency=0.0, seconds_per_char=0.01):
+        self._latency = latency
+        self._seconds_per_char = seconds_per_char
+        self.requests = []
+
+    def synthesize_speech(self, input, voice, audio_config):
+        self.requests.append(input.text)
+        if self._latency:
+            time.sleep(self._latency)
+        return SimpleNamespace(audio_content=silent_wav(len(input.text) * self._seconds_per_char))
+
+
+class FakeVisionClient:
+    """Answers batch_annotate_images with canned text for each image, or "ocr text N" once none is left."""
+    def __init__(self, texts=None, latency=0.0):
+        self._texts = list(texts or [])
+        self._latency = latency
+        self.batches = []
+        self.images = 0
+
+    def batch_annotate_images(self, requests):
+        self.batches.append(len(requests))
+        if self._latency:
+            time.sleep(self._latency)
+        responses = []
+        for _ in requests:
+            self.images += 1
+            text = self._texts.pop(0) if self._texts else f"ocr text {self.images}"
+            responses.append(SimpleNamespace(
+                full_text_annotation=SimpleNamespace(text=text),
+                error=SimpleNamespace(message=""),
+            ))
+        return SimpleNamespace(responses=responses)
+
+
+class FakeGenerativeModel:
+    """Answers generate_content with canned answers, or "Answer N." once none is left.
+
+    Streaming yields the answer a few words at a time: the first piece after
+    `first_token_latency`, every further one after `chunk_latency`.
+    """
+    def __init__(self, answers=None, first_token_latency=0.0, chunk_latency=0.0, words_per_chunk=3):
+        self._answers = list(answers or [])
+        self._first_token_latency = first_token_latency
+        self._chunk_latency = chunk_latency
+        self._words_per_chunk = words_per_chunk
+        self.prompts = []
+
+    def generate_content(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        answer = self._answers.pop(0) if self._answers else f"Answer {len(self.prompts)}."
+        if not stream:
+            if self._first_token_latency:
+                time.sleep(self._first_token_latency)
+            return SimpleNamespace(text=answer)
+        return self._stream(answer)
+
+    def _stream(self, answer):
+        words = answer.split(" ")
+        for start in range(0, len(words), self._words_per_chunk):
+            delay = self._first_token_latency if start == 0 else self._chunk_latency
+            if delay:
+                time.sleep(delay)
+            text = " ".join(words[start:start + self._words_per_chunk])
+            yield SimpleNamespace(text=text if start + self._words_per_chunk >= len(words) else text + " ")
+
+
+def fake_registry(speech=None, tts=None, vision=None, genai=None):
+    """A ClientRegistry serving the given fakes, with default fakes for the rest."""
+    from clients import ClientRegistry
+    registry = ClientRegistry()
+    clients = {
+        "speech": speech or FakeSpeechClient(),
+        "tts": tts or FakeTextToSpeechClient(),
+        "vision": vision or FakeVisionClient(),
+        "genai": genai or FakeGenerativeModel(),
+    }
+    for name, client in clients.items():
+        registry.register(name, lambda client=client: client)
+    return registry
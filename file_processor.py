@@ -1,30 +1,88 @@
-import fitz  # PyMuPDF
-from PIL import Image
+import collections
 import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from clients import default_registry
+from doc_store import DocumentStore
+from tracing import default_tracer
+from ocr import OCR_CONCURRENCY, OCR_DPI, VISION_AVAILABLE, make_ocr_engine, prepare_image_bytes, render_page
 
-# Try to import Google Cloud Vision, but handle gracefully if not available
-try:
-    from google.cloud import vision
-    VISION_AVAILABLE = True
-except ImportError:
-    VISION_AVAILABLE = False
+# Bump whenever extraction output changes, so stored documents are re-extracted
+EXTRACTOR_VERSION = 2
+
+# Pages handed to each extraction process at a time
+PAGES_PER_TASK = 16
+
+Page = collections.namedtuple("Page", ["number", "text"])
+Document = collections.namedtuple("Document", ["doc_id", "name", "index_dir", "pages"])
+
+def _extract_page_range(file_path, start, stop, dpi=OCR_DPI):
+    """
+    Extracts pages [start, stop) of a PDF as (Page, image) pairs. Pages without a
+    text layer are rendered to a JPEG for OCR; for the others image is None.
+    Runs in a worker process for large PDFs.
+    """
+    import fitz  # PyMuPDF
+    doc = fitz.open(file_path)
+    try:
+        extracted = []
+        for page_num in range(start, stop):
+            page = doc.load_page(page_num)
+            text = page.get_text()
+            image = None if text.strip() else render_page(page, dpi)
+            extracted.append((Page(page_num + 1, text), image))
+        return extracted
+    finally:
+        doc.close()
+
+if not VISION_AVAILABLE:
     print("Warning: Google Cloud Vision not available. Image OCR functionality will be limited.")
 
 class FileProcessor:
-    def __init__(self):
-        if VISION_AVAILABLE:
-            self.vision_client = vision.ImageAnnotatorClient()
-        else:
-            self.vision_client = None
+    def __init__(self, registry=None, max_workers=None, store=None, ocr_engine="auto"):
+        self.registry = registry or default_registry
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.store = store or DocumentStore()
+        # "auto" prefers Cloud Vision and falls back to local Tesseract
+        if isinstance(ocr_engine, str):
+            ocr_engine = make_ocr_engine(self.registry, ocr_engine)
+        self.ocr = ocr_engine
 
     def process_file(self, file_path):
         """
         Processes the uploaded file (PDF or JPEG) and extracts text.
+        Files extracted before are read back from the document store.
+        """
+        return "".join(page.text for page in self.load_document(file_path).pages)
+
+    def load_document(self, file_path):
+        """
+        Returns a Document whose pages come from the document store when this exact
+        file was extracted before, and are otherwise extracted and stored on the way
+        through. index_dir is where an index derived from the text belongs.
+        """
+        if not file_path.lower().endswith(('.pdf', '.jpeg', '.jpg')):
+            raise ValueError("Unsupported file type. Please upload a PDF or JPEG file.")
+        key = self.store.key(file_path, EXTRACTOR_VERSION)
+        name = os.path.basename(file_path)
+        stored = self.store.get(key)
+        if stored is not None:
+            print(f"[DEBUG] Loaded {name} from the document store ({stored.page_count} pages)")
+            pages = stored.iter_pages(Page)
+        else:
+            pages = self.store.write_pages(key, name, self.iter_pages(file_path))
+        return Document(key, name, self.store.index_dir(key), pages)
+
+    def iter_pages(self, file_path):
+        """
+        Yields the pages of the uploaded file in order, as Page(number, text).
+        Images count as a single page.
         """
         if file_path.lower().endswith('.pdf'):
-            return self._process_pdf(file_path)
+            return self._iter_pdf_pages(file_path)
         elif file_path.lower().endswith(('.jpeg', '.jpg')):
-            return self._process_image(file_path)
+            return iter([Page(1, self._process_image(file_path))])
         else:
             raise ValueError("Unsupported file type. Please upload a PDF or JPEG file.")
 
@@ -32,38 +90,87 @@ class FileProcessor:
         """
         Extracts text from a PDF file.
         """
+        text = "".join(page.text for page in self._iter_pdf_pages(file_path))
+        print(f"[DEBUG] Extracted PDF text length: {len(text)}")
+        print(f"[DEBUG] Extracted PDF text preview: {text[:200]}")
+        return text
+
+    def _iter_pdf_pages(self, file_path):
+        """
+        Yields PDF pages in order. Pages with a text layer use it; image-only pages
+        are rendered and sent to OCR in batches. Large PDFs are split into page ranges
+        that are extracted in parallel worker processes, with each range's OCR
+        starting as soon as its extraction finishes. A range is yielded once it and
+        every range before it are done.
+        """
+        import fitz  # PyMuPDF
         try:
             doc = fitz.open(file_path)
-            text = ""
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text += page.get_text()
+            page_count = len(doc)
             doc.close()
-            print(f"[DEBUG] Extracted PDF text length: {len(text)}")
-            print(f"[DEBUG] Extracted PDF text preview: {text[:200]}")
-            return text
         except Exception as e:
             raise Exception(f"Error processing PDF file: {e}")
+        ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+
+        if self.max_workers == 1 or len(ranges) <= 1:
+            for start, stop in ranges:
+                try:
+                    extracted = _extract_page_range(file_path, start, stop)
+                except Exception as e:
+                    raise Exception(f"Error processing PDF file: {e}")
+                yield from self._ocr_missing_text(extracted)
+            return
+
+        # Spawned, not forked: by now gRPC clients may have threads running, and a forked
+        # child would inherit their locks in whatever state they were in
+        pool = ProcessPoolExecutor(max_workers=min(self.max_workers, len(ranges)),
+                                   mp_context=multiprocessing.get_context("spawn"))
+        ocr_pool = ThreadPoolExecutor(max_workers=OCR_CONCURRENCY)
+        try:
+            extractions = [pool.submit(_extract_page_range, file_path, start, stop) for start, stop in ranges]
+            finished = [
+                ocr_pool.submit(lambda extraction: self._ocr_missing_text(extraction.result()), extraction)
+                for extraction in extractions
+            ]
+            for future in finished:
+                try:
+                    pages = future.result()
+                except Exception as e:
+                    raise Exception(f"Error processing PDF file: {e}")
+                yield from pages
+        finally:
+            # Don't wait for ranges nobody will read if the caller stopped early
+            pool.shutdown(wait=False, cancel_futures=True)
+            ocr_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _ocr_missing_text(self, extracted):
+        """
+        Fills in the text of rendered image-only pages with one batched OCR call.
+        """
+        images = [image for _, image in extracted if image is not None]
+        if not images:
+            return [page for page, _ in extracted]
+        if self.ocr is None:
+            print(f"[DEBUG] Skipping OCR of {len(images)} scanned pages: no OCR engine available")
+            return [page for page, _ in extracted]
+        default_tracer.count("ocr.pages", len(images))
+        with default_tracer.span("ocr.batch"):
+            texts = iter(self.ocr.recognize(images))
+        return [page if image is None else page._replace(text=next(texts)) for page, image in extracted]
 
     def _process_image(self, file_path):
         """
         Performs OCR on an image file to extract text.
         """
-        if not VISION_AVAILABLE:
-            raise Exception("Google Cloud Vision is not available. Please install google-cloud-vision package for image OCR functionality.")
+        if self.ocr is None:
+            raise Exception("No OCR engine is available. Please install google-cloud-vision (or pytesseract for offline OCR) for image OCR functionality.")
         
         try:
             with io.open(file_path, 'rb') as image_file:
                 content = image_file.read()
 
-            image = vision.Image(content=content)
-            response = self.vision_client.text_detection(image=image)
-            texts = response.text_annotations
-
-            if texts:
-                return texts[0].description
-            else:
-                return ""
+            # Grayscale, downscale and compress before sending
+            return self.ocr.recognize([prepare_image_bytes(content)])[0]
         except Exception as e:
             raise Exception(f"Error processing image file: {e}")
 
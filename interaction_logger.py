@@ -1,21 +1,213 @@
+"""
+Structured log of user-AI interactions.
+
+log_interaction() only puts the record on a bounded queue, so the answer callback
+never waits for the disk. A background thread writes the records as JSON Lines in
+batches, flushes every batch and fsyncs at most every FSYNC_INTERVAL seconds. The
+file rotates when it grows past max_bytes or gets older than rotate_seconds, keeping
+`backups` old files (interactions.jsonl.1 is the newest). When the queue is full the
+record is dropped and counted rather than blocking the caller.
+
+iter_interactions() reads the current and rotated files back, oldest first, and
+replay() asks the logged questions again, so past interactions double as a
+regression and benchmark corpus (see bench_replay.py).
+"""
 import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+from answer_cache import AnswerCache
+
+LOG_FILE = "interactions.jsonl"
+MAX_BYTES = 10 * 1024 * 1024
+ROTATE_SECONDS = 24 * 3600
+BACKUPS = 5
+MAX_PENDING = 1000
+# Records written per batch, and seconds between fsyncs
+BATCH_SIZE = 100
+FSYNC_INTERVAL = 2.0
+
 
 class InteractionLogger:
-    def __init__(self, log_file="interaction_log.txt"):
+    def __init__(self, log_file=LOG_FILE, max_bytes=MAX_BYTES, rotate_seconds=ROTATE_SECONDS, backups=BACKUPS,
+                 max_pending=MAX_PENDING, fsync_interval=FSYNC_INTERVAL):
         self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backups = backups
+        self.fsync_interval = fsync_interval
+        self._records = queue.Queue(maxsize=max_pending)
+        self._file = None
+        self._opened = None
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
 
-    def log_interaction(self, user_query, ai_response):
+    def log_interaction(self, user_query, ai_response, **fields):
         """
-        Logs the user's query and the AI's response to a file.
+        Queues one interaction for writing and returns at once. Extra fields (latencies,
+        document ids, cache hit, token counts, ...) are stored with it.
         """
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(self.log_file, "a") as f:
-            f.write(f"[{timestamp}] User: {user_query}\n")
-            f.write(f"[{timestamp}] AI: {ai_response}\n\n")
+        now = time.time()
+        record = {
+            "time": datetime.datetime.fromtimestamp(now).isoformat(timespec="milliseconds"),
+            "timestamp": now,
+            "question": user_query,
+            "answer": ai_response,
+        }
+        record.update(fields)
+        try:
+            self._records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        return {"queued": self._records.qsize(), "written": self.written, "dropped": self.dropped,
+                "rotations": self.rotations}
+
+    def close(self, timeout=5):
+        """Write everything queued, fsync and stop the writer thread."""
+        self._records.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        last_sync = time.monotonic()
+        unsynced = False
+        while True:
+            try:
+                record = self._records.get(timeout=self.fsync_interval if unsynced else None)
+            except queue.Empty:
+                record = ()
+            batch = [] if record in (None, ()) else [record]
+            stopping = record is None
+            while not stopping and len(batch) < BATCH_SIZE:
+                try:
+                    record = self._records.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                else:
+                    batch.append(record)
+            try:
+                if batch:
+                    self._write(batch)
+                    unsynced = True
+                if unsynced and (stopping or time.monotonic() - last_sync >= self.fsync_interval):
+                    os.fsync(self._file.fileno())
+                    last_sync = time.monotonic()
+                    unsynced = False
+            except Exception as e:
+                print(f"[DEBUG] Could not write the interaction log: {e}")
+            if stopping:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, batch):
+        if self._file is None:
+            self._open()
+        elif self._file.tell() >= self.max_bytes or time.time() - self._opened >= self.rotate_seconds:
+            self._rotate()
+        self._file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+        self._file.flush()
+        self.written += len(batch)
+
+    def _open(self):
+        self._file = open(self.log_file, "a", encoding="utf-8")
+        # A file left by an earlier run keeps its age
+        if self._file.tell() > 0:
+            self._opened = os.path.getmtime(self.log_file)
+        else:
+            self._opened = time.time()
+
+    def _rotate(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        for number in range(self.backups - 1, 0, -1):
+            source = f"{self.log_file}.{number}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.log_file}.{number + 1}")
+        if self.backups > 0:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        else:
+            os.remove(self.log_file)
+        self.rotations += 1
+        self._open()
+
+
+def log_files(log_file=LOG_FILE):
+    """The current and rotated log files that exist, oldest first."""
+    rotated = []
+    directory = os.path.dirname(log_file) or "."
+    prefix = os.path.basename(log_file) + "."
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            rotated.append((int(name[len(prefix):]), os.path.join(directory, name)))
+    files = [path for _, path in sorted(rotated, reverse=True)]
+    if os.path.exists(log_file):
+        files.append(log_file)
+    return files
+
+
+def iter_interactions(log_file=LOG_FILE, since=None, until=None, doc_id=None, cached=None):
+    """
+    Yields logged records, oldest first, optionally only those between the `since`
+    and `until` timestamps, answered from document doc_id, or (not) served from the
+    cache. A line cut short by a crash is skipped.
+    """
+    for path in log_files(log_file):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since is not None and record.get("timestamp", 0) < since:
+                    continue
+                if until is not None and record.get("timestamp", 0) >= until:
+                    continue
+                if doc_id is not None and doc_id not in record.get("doc_ids", []):
+                    continue
+                if cached is not None and record.get("cached") != cached:
+                    continue
+                yield record
+
+
+def replay(records, qa_system):
+    """
+    Asks each record's question again. Yields (record, answer, seconds), so answers can
+    be compared with the logged ones and latencies with the logged latencies.
+    Each question is asked with an empty conversation memory and an empty answer
+    cache, so one record's answer does not depend on the records replayed before it
+    and every latency is the model's. The QA system's own cache is left untouched.
+    """
+    memory = getattr(qa_system, "memory", None)
+    cache = qa_system.cache
+    try:
+        for record in records:
+            if memory is not None:
+                memory.clear()
+            qa_system.cache = AnswerCache()
+            started = time.perf_counter()
+            answer = qa_system.answer_question(record["question"])
+            yield record, answer, time.perf_counter() - started
+    finally:
+        qa_system.cache = cache
+
 
 if __name__ == '__main__':
     # Example usage (for testing)
     logger = InteractionLogger()
     logger.log_interaction("What is the capital of France?", "The capital of France is Paris.")
-    logger.log_interaction("What is 2 + 2?", "2 + 2 is 4.")
-    print(f"Interactions logged to {logger.log_file}")
\ No newline at end of file
+    logger.log_interaction("What is 2 + 2?", "2 + 2 is 4.", latency_ms={"total": 812.4}, cached=False)
+    logger.close()
+    print(f"Interactions logged to {logger.log_file}: {logger.stats()}")
+    for record in iter_interactions(logger.log_file):
+        print(record["time"], record["question"])
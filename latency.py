@@ -0,0 +1,24 @@
+import time
+
+
+class TurnTimer:
+    """Records when milestones of one conversational turn happen, relative to its start.
+
+    With a tracer, each milestone is also recorded as span "turn.<name>" for turn_id.
+    """
+    def __init__(self, tracer=None, turn_id=None):
+        self.started = time.perf_counter()
+        self.marks = {}
+        self.tracer = tracer
+        self.turn_id = turn_id
+
+    def mark(self, name):
+        """Record a milestone; only the first occurrence of each name counts."""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.started
+            if self.tracer is not None:
+                self.tracer.record(f"turn.{name}", self.marks[name], self.turn_id)
+
+    def summary(self):
+        """Milestones in milliseconds, e.g. {'first_token': 412.0, 'first_audio': 980.5, 'total': 5210.3}."""
+        return {name: round(seconds * 1000, 1) for name, seconds in self.marks.items()}
@@ -0,0 +1,105 @@
+"""
+OCR engines and image preparation for scanned pages and photos.
+
+Images are converted to grayscale, downscaled and JPEG-compressed before OCR, which
+keeps request sizes small without hurting recognition of printed text. Google Cloud
+Vision is used when available; Tesseract (via pytesseract) can stand in for it offline.
+"""
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from clients import lazy_import
+
+# Resolution scanned PDF pages are rendered at, and the size limits applied before OCR
+OCR_DPI = 200
+OCR_MAX_SIDE = 2000
+OCR_JPEG_QUALITY = 80
+# Vision accepts at most 16 images per batch request
+VISION_BATCH_SIZE = 16
+OCR_CONCURRENCY = 4
+
+# Imported on first OCR request
+vision = lazy_import("google.cloud.vision")
+VISION_AVAILABLE = vision is not None
+
+try:
+    import pytesseract
+    TESSERACT_AVAILABLE = True
+except ImportError:
+    TESSERACT_AVAILABLE = False
+
+
+def prepare_image(image):
+    """Grayscale, downscale and JPEG-compress a PIL image; returns the JPEG bytes."""
+    image = image.convert("L")
+    image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_image_bytes(content):
+    """prepare_image for raw image file contents."""
+    return prepare_image(Image.open(io.BytesIO(content)))
+
+
+def render_page(page, dpi=OCR_DPI):
+    """Rasterize a PyMuPDF page to prepared JPEG bytes."""
+    import fitz  # PyMuPDF
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+    return prepare_image(image)
+
+
+class VisionOcr:
+    """Batches images into Vision batch_annotate_images requests and sends the batches concurrently."""
+    def __init__(self, registry, batch_size=VISION_BATCH_SIZE, concurrency=OCR_CONCURRENCY):
+        self.registry = registry
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+    def recognize(self, images):
+        """Return the text of each image, in order."""
+        batches = [images[i:i + self.batch_size] for i in range(0, len(images), self.batch_size)]
+        if len(batches) <= 1:
+            return [text for batch in batches for text in self._annotate(batch)]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return [text for texts in pool.map(self._annotate, batches) for text in texts]
+
+    def _annotate(self, batch):
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        requests = [vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature]) for content in batch]
+        response = self.registry.call("vision", "batch_annotate_images", requests=requests)
+        texts = []
+        for result in response.responses:
+            if result.error.message:
+                raise Exception(f"Vision OCR failed: {result.error.message}")
+            texts.append(result.full_text_annotation.text)
+        return texts
+
+
+class TesseractOcr:
+    """Local OCR with Tesseract; runs several tesseract processes at once."""
+    def __init__(self, concurrency=OCR_CONCURRENCY, lang="eng"):
+        self.concurrency = concurrency
+        self.lang = lang
+
+    def recognize(self, images):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return list(pool.map(self._recognize_one, images))
+
+    def _recognize_one(self, content):
+        return pytesseract.image_to_string(Image.open(io.BytesIO(content)), lang=self.lang)
+
+
+def make_ocr_engine(registry, engine="auto"):
+    """Return an OCR engine: "vision", "tesseract", or "auto" for the first available; None if none is."""
+    if engine in ("vision", "auto") and VISION_AVAILABLE:
+        return VisionOcr(registry)
+    if engine in ("tesseract", "auto") and TESSERACT_AVAILABLE:
+        return TesseractOcr()
+    if engine != "auto":
+        raise ValueError(f"OCR engine {engine!r} is not available")
+    return None
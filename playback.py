@@ -0,0 +1,186 @@
+"""
+Queued audio playback on a dedicated thread.
+
+Callers hand clips to PlaybackEngine.play() and return immediately; the playback
+thread plays them back to back through an audio sink. Playback can be cancelled,
+e.g. when the user starts talking over the answer (barge-in).
+"""
+import io
+import queue
+import threading
+import time
+import wave
+
+from tracing import current_turn, default_tracer
+
+
+class PygameSink:
+    """Plays clips on one pygame mixer channel, with one clip queued behind the current one.
+
+    pygame and the mixer are loaded by warm_up() or the first clip, not at construction.
+    """
+    def __init__(self, frequency=None):
+        self._frequency = frequency
+        self._pygame = None
+        self._lock = threading.Lock()
+        self._channel = None
+
+    def warm_up(self):
+        with self._lock:
+            if self._pygame is not None:
+                return
+            import pygame
+            if self._frequency:
+                pygame.mixer.init(frequency=self._frequency, channels=1)
+            else:
+                pygame.mixer.init()
+            self._pygame = pygame
+
+    def play(self, audio):
+        """Start a clip now, or queue it behind the current one; returns False if the queue slot is taken."""
+        self.warm_up()
+        sound = self._pygame.mixer.Sound(file=io.BytesIO(audio))
+        if self._channel is None or not self._channel.get_busy():
+            self._channel = sound.play()
+            return True
+        if self._channel.get_queue() is not None:
+            return False
+        self._channel.queue(sound)
+        return True
+
+    def busy(self):
+        return self._channel is not None and self._channel.get_busy()
+
+    def stop(self):
+        if self._channel is not None:
+            self._channel.stop()
+
+
+class NullSink:
+    """Pretends to play clips, taking as long as their WAV duration (or `clip_seconds`)."""
+    def __init__(self, clip_seconds=0.0):
+        self._clip_seconds = clip_seconds
+        self._ends = []
+        self.played = []
+        self.stopped = 0
+
+    def play(self, audio):
+        now = time.monotonic()
+        self._ends = [end for end in self._ends if end > now]
+        if len(self._ends) >= 2:
+            return False
+        start = self._ends[-1] if self._ends else now
+        self._ends.append(start + self._duration(audio))
+        self.played.append(audio)
+        return True
+
+    def busy(self):
+        return bool(self._ends) and self._ends[-1] > time.monotonic()
+
+    def stop(self):
+        self._ends = []
+        self.stopped += 1
+
+    def _duration(self, audio):
+        try:
+            with wave.open(io.BytesIO(audio), 'rb') as wf:
+                return wf.getnframes() / wf.getframerate()
+        except (wave.Error, EOFError):
+            return self._clip_seconds
+
+
+class PlaybackEngine:
+    def __init__(self, sink, tracer=None):
+        self._sink = sink
+        self._tracer = tracer or default_tracer
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pending = 0
+        self.interruptions = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def generation(self):
+        """Increases on every cancel; clips submitted for an older generation are dropped."""
+        return self._generation
+
+    def play(self, audio, generation=None, on_start=None):
+        """Queue a clip for playback and return immediately."""
+        with self._lock:
+            if generation is None:
+                generation = self._generation
+            if generation != self._generation:
+                return
+            self._pending += 1
+        self._jobs.put((generation, audio, on_start, time.perf_counter(), current_turn()))
+
+    def is_playing(self):
+        return self._pending > 0 or self._sink.busy()
+
+    def wait(self, timeout=None):
+        """Block until everything queued has finished playing; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_playing():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def cancel(self):
+        """Stop the current clip and drop everything queued."""
+        with self._lock:
+            self._generation += 1
+        self._sink.stop()
+
+    def interrupt(self):
+        """Cancel playback because the user started speaking."""
+        if self.is_playing():
+            self.interruptions += 1
+            self._tracer.count("playback.interruptions")
+        self.cancel()
+
+    def close(self):
+        self.cancel()
+        self._jobs.put(None)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            generation, audio, on_start, queued, turn_id = job
+            try:
+                # Wait for the sink's queue slot, giving up if playback was cancelled meanwhile
+                while generation == self._generation and not self._sink.play(audio):
+                    time.sleep(0.01)
+                if generation == self._generation:
+                    # Time from queueing the clip to handing it to the sound card
+                    self._tracer.record("playback.start", time.perf_counter() - queued, turn_id)
+                    if on_start:
+                        on_start()
+            except Exception as e:
+                print(f"[DEBUG] Playback error: {e}")
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+
+class BargeInDetector:
+    """Interrupts playback when the microphone level stays loud for a few chunks."""
+    def __init__(self, playback, threshold=2500, min_chunks=3):
+        self._playback = playback
+        self._threshold = threshold
+        self._min_chunks = min_chunks
+        self._loud_chunks = 0
+
+    def on_volume(self, rms):
+        """Feed the RMS of each recorded chunk (the recorder's volume callback)."""
+        if rms < self._threshold or not self._playback.is_playing():
+            self._loud_chunks = 0
+            return
+        self._loud_chunks += 1
+        if self._loud_chunks >= self._min_chunks:
+            self._loud_chunks = 0
+            self._playback.interrupt()
@@ -1,56 +1,478 @@
+import hashlib
 import os
-import google.generativeai as genai
+import time
+from answer_cache import AnswerCache
+from clients import default_registry
+from conversation import ConversationMemory, is_follow_up
+from corpus import Corpus, load_segment
+from exercises import ExerciseIndex, parse_reference
+from retrieval import BM25Index, chunk_pages, chunk_text
+from tracing import default_tracer
 
-class QASystem:
+# Documents up to this size are sent whole; larger ones are narrowed to the best passages
+FULL_CONTEXT_CHARS = 12000
+TOP_K = 5
+
+NO_CONTEXT_MESSAGE = "I don't have any context to answer questions. Please upload a file first."
+NEED_QUESTION_NUMBER_MESSAGE = "I can help with specific questions, but I need a question number. For example, say 'help me with question 4'."
+# Replies that never change, so their speech can be synthesized ahead of time
+FIXED_RESPONSES = [NO_CONTEXT_MESSAGE, NEED_QUESTION_NUMBER_MESSAGE]
+
+def format_sources(sources):
+    """
+    Formats (document name, page) citations, e.g. "Sources: biology.pdf p. 3, 7; notes.jpg".
+    """
+    pages = {}
+    for name, page in sources:
+        pages.setdefault(name, [])
+        if page and page not in pages[name]:
+            pages[name].append(page)
+    parts = []
+    for name, numbers in pages.items():
+        parts.append(f"{name} p. {', '.join(str(n) for n in sorted(numbers))}" if numbers else name)
+    return "Sources: " + "; ".join(parts) if parts else ""
+
+def load_exercise_index(pages, index_dir=None):
+    """
+    Returns the exercise table saved in index_dir, or builds it from the pages (and saves it there).
+    """
+    exercises = ExerciseIndex.load(index_dir) if index_dir else None
+    if exercises is None:
+        exercises = ExerciseIndex.build(pages)
+        if index_dir:
+            exercises.save(index_dir)
+    return exercises
+
+def small_text(pages, limit=FULL_CONTEXT_CHARS):
+    """
+    The joined text of the pages when it is at most `limit` characters, otherwise "".
+    Stops reading pages as soon as the limit is passed.
+    """
+    parts = []
+    size = 0
+    for page in pages:
+        size += len(page.text)
+        if size > limit:
+            return ""
+        parts.append(page.text)
+    return "".join(parts)
+
+def index_pages(pages, index_dir=None):
+    """
+    Builds the passage index and exercise table for an iterable of pages, indexing
+    pages as they arrive. If index_dir holds a saved index it is loaded instead;
+    otherwise the new one is saved there. A saved index is returned memory-mapped and
+    shared (see corpus.load_segment). Returns (text, index, exercises), where text is
+    the whole document only if it is small enough to be sent whole and "" otherwise;
+    larger documents are answered from passages read from their index.
+    """
+    if index_dir and os.path.exists(os.path.join(index_dir, "vocab.json")):
+        exercises = ExerciseIndex.load(index_dir)
+        if exercises is None:
+            # Indexes saved before exercise tables existed get one built with page numbers
+            pages = list(pages)
+            exercises = load_exercise_index(pages, index_dir)
+        return small_text(pages), load_segment(index_dir), exercises
+    collected = []
+
+    def collect(pages):
+        for page in pages:
+            collected.append(page)
+            yield page
+
+    index = BM25Index.build_from_pages(chunk_pages(collect(pages)))
+    if index_dir:
+        index.save(index_dir)
+        # The copy built in memory can go; searches read the saved one
+        index = load_segment(index_dir)
+    exercises = load_exercise_index(collected, index_dir)
+    return small_text(collected), index, exercises
+
+def _chapter_list(chapters):
+    """Where an exercise number appears, e.g. "before the first chapter and in chapters 2 and 3"."""
+    numbered = [str(chapter) for chapter in chapters if chapter is not None]
+    places = ["before the first chapter"] if None in chapters else []
+    if len(numbered) == 1:
+        places.append(f"in chapter {numbered[0]}")
+    elif numbered:
+        places.append(f"in chapters {', '.join(numbered[:-1])} and {numbered[-1]}")
+    return " and ".join(places)
+
+def _hashed(pages, digest):
+    for page in pages:
+        digest.update(page.text.encode("utf-8"))
+        yield page
+
+class AnswerState:
+    """
+    What one answer used and produced: its sources, whether it came from the cache,
+    the tokens the model reported and the key it is cached under. Each answer gets
+    its own, so an answer still streaming on another thread never touches the next one's.
+    """
     def __init__(self):
-        # Configure the API key from environment; masked default for public repos
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY", "XXXXXXXXXXXX"))
-        self.model = genai.GenerativeModel('models/gemini-1.5-pro-latest')
+        self.sources = []
+        self.cached = False
+        self.usage = None
+        self.cache_key = None
+
+class QASystem:
+    def __init__(self, registry=None, cache=None, corpus=None, shared_cache=False, tracer=None, memory=None):
+        # The shared registry configures the API key from the environment
+        self.registry = registry or default_registry
+        self.tracer = tracer or default_tracer
+        # Gemini is configured on the first question, not when the window opens
+        self.model = self.registry.proxy("genai")
         self.context = ""
+        self.index = None
+        self.doc_id = None
+        self.fingerprint = None
+        self.cache = cache or AnswerCache()
+        # A cache shared with other QASystems is never invalidated by this one; its
+        # entries are keyed by document fingerprint, so stale answers are never served
+        self.shared_cache = shared_cache
+        # Every loaded document stays searchable; scope limits answers to one of them
+        self.corpus = corpus if corpus is not None else Corpus()
+        self.scope = None
+        # Recent turns and a summary of older ones, sent with each question for follow-ups
+        self.memory = memory if memory is not None else ConversationMemory()
+        # The state of the last answer begun; see last_sources, last_cached and last_usage
+        self.last_answer = AnswerState()
+        # Chapter/exercise tables per document, loaded from the index directory on first use
+        self.exercises = {}
+        self._update_fingerprint()
+
+    @property
+    def last_sources(self):
+        return self.last_answer.sources
 
-    def load_context(self, text):
+    @property
+    def last_cached(self):
+        """Whether the last answer came from the cache."""
+        return self.last_answer.cached
+
+    @property
+    def last_usage(self):
+        """(prompt tokens, output tokens) the model reported for the last answer, or None."""
+        return self.last_answer.usage
+
+    def load_context(self, text, index_dir=None, doc_id=None, name="document"):
         """
-        Loads the extracted text as context for answering questions.
+        Loads the extracted text as context and builds the passage index for it.
+        If index_dir holds a saved index it is loaded instead; otherwise the new
+        index is saved there. The document is added to the corpus, replacing any
+        earlier version with the same doc_id.
         """
-        self.context = text
-        print(f"[DEBUG] Context loaded, length: {len(text)}")
+        if index_dir and os.path.exists(os.path.join(index_dir, "vocab.json")):
+            index = load_segment(index_dir)
+        else:
+            index = BM25Index.build(chunk_text(text))
+            if index_dir:
+                index.save(index_dir)
+                index = load_segment(index_dir)
+        exercises = load_exercise_index([(0, text)], index_dir)
+        self.add_document(text, index, exercises, index_dir, doc_id, name)
+        print(f"[DEBUG] Context loaded, length: {len(text)}, chunks: {len(index)}")
         print(f"[DEBUG] Context preview: {text[:200]}")
 
+    def load_pages(self, pages, index_dir=None, doc_id=None, name="document"):
+        """
+        Like load_context, but takes an iterable of pages (e.g. FileProcessor.iter_pages)
+        and indexes them as they arrive, remembering each passage's page number.
+        """
+        pages = iter(pages)
+        digest = hashlib.sha256() if doc_id is None else None
+        if digest is not None:
+            pages = _hashed(pages, digest)
+        text, index, exercises = index_pages(pages, index_dir)
+        if digest is not None:
+            # Without a doc_id the document is named by its text, read through once more if need be
+            for _ in pages:
+                pass
+            doc_id = digest.hexdigest()
+        self.add_document(text, index, exercises, index_dir, doc_id, name)
+        print(f"[DEBUG] Context loaded, {len(exercises)} exercises, chunks: {len(index)}")
+
+    def remove_document(self, doc_id):
+        """
+        Removes a document from the corpus; its index segment is simply dropped.
+        """
+        self.corpus.remove(doc_id)
+        self.exercises.pop(doc_id, None)
+        if self.scope == doc_id:
+            self.scope = None
+        if self.doc_id == doc_id:
+            self.context, self.index, self.doc_id = "", None, None
+        self._update_fingerprint()
+
+    def set_scope(self, doc_id=None):
+        """
+        Restricts answers to one document, or spans the whole corpus when doc_id is None.
+        """
+        self.scope = doc_id if doc_id in self.corpus else None
+        self._update_fingerprint()
+
+    def _exercises_for(self, doc_id):
+        if doc_id not in self.exercises:
+            index_dir = self.corpus.index_dir(doc_id)
+            self.exercises[doc_id] = (index_dir and ExerciseIndex.load(index_dir)) or ExerciseIndex()
+        return self.exercises[doc_id]
+
+    def add_document(self, text, index, exercises, index_dir=None, doc_id=None, name="document"):
+        """
+        Adds an already indexed document (see index_pages); the index objects may be
+        shared with other QASystems. The text is only kept if the document is small
+        enough to be sent whole.
+        """
+        if doc_id is None:
+            doc_id = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if len(text) > FULL_CONTEXT_CHARS:
+            text = ""
+        self.context, self.index, self.doc_id = text, index, doc_id
+        self.exercises[doc_id] = exercises
+        self.corpus.add(doc_id, name, index, index_dir)
+        self._update_fingerprint()
+
+    def _update_fingerprint(self):
+        fingerprint = self.corpus.fingerprint([self.scope] if self.scope else None)
+        if fingerprint != self.fingerprint:
+            # Answers about a different set of documents no longer apply
+            if not self.shared_cache:
+                self.cache.invalidate(keep_fingerprint=fingerprint)
+            self.fingerprint = fingerprint
+
+    def select_context(self, question, k=TOP_K):
+        """
+        Returns the text to send with a question: the whole document when a single
+        small document is in scope, otherwise the k passages across the documents
+        in scope that best match the question. Sets last_sources to the
+        (document name, page) pairs used.
+        """
+        context, self.last_answer.sources = self.retrieve(question, k)
+        return context
+
+    def retrieve(self, question, k=TOP_K):
+        """
+        Like select_context, but returns (context, sources) and changes no state, so it
+        can run ahead of the answer (e.g. on an interim transcript) on another thread.
+        """
+        in_scope = [self.scope] if self.scope else [doc_id for doc_id, _ in self.corpus.documents()]
+        if in_scope == [self.doc_id] and self.context:
+            return self.context, [(name, None) for doc_id, name in self.corpus.documents() if doc_id == self.doc_id]
+        with self.tracer.span("retrieval"):
+            hits = self.corpus.search(question, k, doc_ids=in_scope)
+        if not hits:
+            # Nothing matched ("summarize this"); start from the beginning of the documents in scope
+            hits = self.corpus.opening(k, doc_ids=in_scope, max_chars=FULL_CONTEXT_CHARS)
+        if not hits:
+            return "", []
+        # Keep document and page order so overlapping passages read naturally
+        order = {doc_id: position for position, (doc_id, _) in enumerate(self.corpus.documents())}
+        hits.sort(key=lambda hit: (order[hit.doc_id], hit.page))
+        passages = []
+        for hit in hits:
+            header = f"[{hit.name}, page {hit.page}]" if hit.page else f"[{hit.name}]"
+            passages.append(f"{header}\n{hit.text}")
+        return "\n...\n".join(passages), [(hit.name, hit.page) for hit in hits]
+
     def answer_question(self, question):
         """
-        Answers a question based on the loaded context using a powerful LLM.
+        Answers a question based on the loaded context and the conversation so far
+        using a powerful LLM, and remembers the turn.
         """
-        if not self.context:
-            return "I don't have any context to answer questions. Please upload a file first."
+        state = AnswerState()
+        answer, prompt = self._prepare(question, state=state)
+        if answer is None:
+            try:
+                answer = self._generate(prompt, state)
+                self._cache_answer(answer, state)
+            except Exception as e:
+                return f"An error occurred while generating an answer: {e}"
+        self.remember(question, answer)
+        return answer
 
-        # Handle specific queries
-        if "help me with question" in question.lower():
-            return self.answer_specific_question(question)
+    def remember(self, question, answer):
+        """
+        Adds a delivered turn to the conversation memory. answer_question does this itself;
+        callers of answer_question_stream do it once the answer has reached the user.
+        """
+        self.memory.add(question, answer)
 
-        prompt = f"Based on the following context, please answer the question.\n\nContext:\n{self.context}\n\nQuestion:\n{question}"
+    def answer_question_stream(self, question, retrieved=None, state=None):
+        """
+        Like answer_question, but yields the answer in pieces as the model generates it.
+        Canned and cached answers are yielded in one piece. `retrieved` is a
+        (context, sources) pair from retrieve() made earlier, used instead of searching again.
+        `state` is an AnswerState to record this answer's sources and usage in, for
+        callers that stream answers on several threads.
+        The turn is not remembered; call remember() once the answer was delivered.
+        """
+        state = state if state is not None else AnswerState()
+        answer, prompt = self._prepare(question, retrieved, state)
+        if answer is not None:
+            yield answer
+            return
 
+        parts = []
+        chunk = None
+        self.tracer.count("llm.prompt_chars", len(prompt))
+        started = time.perf_counter()
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            for chunk in self.model.generate_content(prompt, stream=True):
+                if chunk.text:
+                    if not parts:
+                        self.tracer.record("llm.first_token", time.perf_counter() - started)
+                    parts.append(chunk.text)
+                    yield chunk.text
         except Exception as e:
-            return f"An error occurred while generating an answer: {e}"
+            self.tracer.count("llm.errors")
+            yield f"An error occurred while generating an answer: {e}"
+            return
+        self.tracer.record("llm.generate", time.perf_counter() - started)
+        # Streamed responses report the usage of the whole answer on their last chunk
+        self._count_usage(chunk, state)
+        self._cache_answer("".join(parts), state)
 
-    def answer_specific_question(self, question):
+    def _generate(self, prompt, state):
+        """
+        Returns the model's answer to a prompt in one piece.
+        """
+        self.tracer.count("llm.prompt_chars", len(prompt))
+        try:
+            with self.tracer.span("llm.generate"):
+                response = self.model.generate_content(prompt)
+        except Exception:
+            self.tracer.count("llm.errors")
+            raise
+        self._count_usage(response, state)
+        return response.text
+
+    def _count_usage(self, response, state):
+        """
+        Adds the token counts reported with a response, when the model reports them.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        state.usage = (getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0)
+        self.tracer.count("llm.prompt_tokens", state.usage[0])
+        self.tracer.count("llm.output_tokens", state.usage[1])
+        # Prompt tokens the model served from its cache of a repeated prompt prefix
+        self.tracer.count("llm.cached_tokens", getattr(usage, "cached_content_token_count", 0) or 0)
+
+    def _cache_answer(self, answer, state):
+        if state.cache_key is not None:
+            self.cache.put(*state.cache_key, answer)
+
+    def answer_details(self, state=None):
+        """
+        Describes an answer (by default the last one) for logs: documents in scope, document
+        fingerprint, cache hit and reported token counts (None when the model didn't report them).
+        """
+        state = state or self.last_answer
+        in_scope = [self.scope] if self.scope else [doc_id for doc_id, _ in self.corpus.documents()]
+        prompt_tokens, output_tokens = state.usage or (None, None)
+        return {"doc_ids": in_scope, "fingerprint": self.fingerprint, "cached": state.cached,
+                "prompt_tokens": prompt_tokens, "output_tokens": output_tokens}
+
+    def _prepare(self, question, retrieved=None, state=None):
+        """
+        Returns (answer, None) when the question can be answered without the model,
+        otherwise (None, prompt). What the answer uses is recorded in `state`.
         """
-        Parses and answers a specific question (e.g., "help me with question 4 from chapter 3").
-        """
-        # This is a placeholder for a more sophisticated parsing logic.
-        # For now, we'll just extract the numbers and assume they refer to chapters and questions.
-        import re
-        numbers = re.findall(r'\d+', question)
-        if len(numbers) == 2:
-            chapter, q_number = numbers
-            return f"I will help you with question {q_number} from chapter {chapter}. Please provide the question text."
-        elif len(numbers) == 1:
-            q_number = numbers[0]
-            return f"I will help you with question {q_number}. Please provide the question text."
+        state = state if state is not None else AnswerState()
+        self.last_answer = state
+        state.cache_key = (self.fingerprint, question)
+        if not len(self.corpus):
+            return NO_CONTEXT_MESSAGE, None
+
+        # Questions that name an exercise are answered from that exercise alone
+        reference = parse_reference(question)
+        if reference is not None:
+            return self._prepare_exercise(question, *reference, state=state)
+        if "help me with question" in question.lower():
+            return NEED_QUESTION_NUMBER_MESSAGE, None
+
+        # A follow-up's answer depends on the turns before it, so it is neither looked up nor cached
+        history = self.memory.render()
+        if history and is_follow_up(question):
+            state.cache_key = None
         else:
-            return "I can help with specific questions, but I need a question number. For example, say 'help me with question 4'."
+            cached = self.cache.get(*state.cache_key)
+            if cached is not None:
+                self.tracer.count("answer_cache.hits")
+                state.cached = True
+                return cached, None
+
+        if retrieved is None:
+            retrieved = self.retrieve(self.memory.search_text(question))
+        context, state.sources = retrieved[0], list(retrieved[1])
+        # The context goes first, so a model that caches prompt prefixes can reuse it when it
+        # repeats: a small document sent whole, or the same passages retrieved again. Passages
+        # retrieved for a new question usually differ, and then nothing is reused
+        prompt = f"Based on the following context, please answer the question.\n\nContext:\n{context}"
+        if history:
+            prompt += f"\n\nConversation so far:\n{history}"
+        prompt += f"\n\nQuestion:\n{question}"
+        return None, prompt
+
+    def find_exercise(self, chapter, number):
+        """
+        Looks up an exercise in the documents in scope. Returns (document name, Exercise),
+        or (None, chapters) when no chapter was given and several chapters have that number.
+        """
+        in_scope = [self.scope] if self.scope else [doc_id for doc_id, _ in self.corpus.documents()]
+        names = dict(self.corpus.documents())
+        ambiguous = []
+        for doc_id in in_scope:
+            exercises = self._exercises_for(doc_id)
+            chapters = [chapter] if chapter is not None else exercises.chapters_with(number)
+            if len(chapters) > 1:
+                ambiguous.extend(c for c in chapters if c not in ambiguous)
+                continue
+            exercise = exercises.get(chapters[0], number) if chapters else None
+            if exercise is not None:
+                return names[doc_id], exercise
+        return None, ambiguous
+
+    def answer_specific_question(self, question):
+        """
+        Answers a question that names an exercise (e.g., "help me with question 4 from chapter 3").
+        """
+        reference = parse_reference(question)
+        if reference is None:
+            return NEED_QUESTION_NUMBER_MESSAGE
+        state = self.last_answer = AnswerState()
+        answer, prompt = self._prepare_exercise(question, *reference, state=state)
+        if answer is not None:
+            return answer
+        try:
+            answer = self._generate(prompt, state)
+            self._cache_answer(answer, state)
+            return answer
+        except Exception as e:
+            return f"An error occurred while generating an answer: {e}"
+
+    def _prepare_exercise(self, question, chapter, number, state):
+        name, exercise = self.find_exercise(chapter, number)
+        if name is None:
+            if exercise:
+                return f"Question {number} appears {_chapter_list(exercise)}. Which chapter do you mean?", None
+            where = f" in chapter {chapter}" if chapter is not None else ""
+            return f"I couldn't find question {number}{where} in the loaded documents.", None
+
+        state.sources = [(name, exercise.page)]
+        # Every phrasing of a request for the same exercise shares one cached answer; the key is
+        # a digest so exercises with the same numbers in another order never look alike
+        digest = hashlib.sha256(f"{name}\n{exercise.text}".encode("utf-8")).hexdigest()[:16]
+        state.cache_key = (self.fingerprint, f"exercise {digest}")
+        cached = self.cache.get(*state.cache_key)
+        if cached is not None:
+            self.tracer.count("answer_cache.hits")
+            state.cached = True
+            return cached, None
+        prompt = (f"Help the student with the following exercise from their textbook. Explain how to solve it step by step."
+                  f"\n\nExercise:\n{exercise.text}\n\nStudent's request:\n{question}")
+        return None, prompt
 
 if __name__ == '__main__':
     # Example usage (for testing)
@@ -0,0 +1,197 @@
+"""
+Speech recognizer backends.
+
+A backend turns 16 kHz mono audio into text in two ways:
+
+    stream(chunks)      yields (transcript, is_final) while audio chunks are still
+                        arriving; interim results revise the utterance in progress
+                        and a final result ends it
+    recognize(content)  returns the transcripts of one complete utterance
+
+GoogleRecognizer sends the audio to Cloud Speech-to-Text. VoskRecognizer runs a
+small Kaldi model on the CPU: no network round trip and no per-minute cost, at some
+cost in accuracy. StreamingRecognizer and ContinuousRecorder in backend.py work with
+either, so the backend can be chosen per session.
+
+Audio is passed in the backend's `encoding`: raw LINEAR16, or for Google also FLAC
+or OGG_OPUS as produced by capture.StreamEncoder.
+"""
+import json
+import os
+import threading
+
+from clients import default_registry, lazy_import
+
+SAMPLE_RATE = 16000
+DEFAULT_RECOGNIZER = "google"
+
+speech = lazy_import("google.cloud.speech")
+vosk = lazy_import("vosk")
+VOSK_AVAILABLE = vosk is not None
+# Download a model from https://alphacephei.com/vosk/models, e.g. vosk-model-small-en-us-0.15 (40 MB)
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", os.path.join("models", "vosk-model-small-en-us-0.15"))
+
+
+def google_transcripts(responses):
+    """Yield (transcript, is_final) for the top alternative of every streaming response."""
+    for response in responses:
+        if not response.results:
+            continue
+        result = response.results[0]
+        if not result.alternatives:
+            continue
+        yield result.alternatives[0].transcript, result.is_final
+
+
+class GoogleRecognizer:
+    """Cloud Speech-to-Text through the shared client registry."""
+    name = "google"
+    encodings = ("LINEAR16", "FLAC", "OGG_OPUS")
+
+    def __init__(self, registry=None, language_code="en-US", rate=SAMPLE_RATE, model="video", use_enhanced=True,
+                 encoding="LINEAR16"):
+        self.registry = registry or default_registry
+        self.client = self.registry.proxy("speech")
+        self.language_code = language_code
+        self.rate = rate
+        self.encoding = encoding
+        self.model = model
+        self.use_enhanced = use_enhanced
+        self._config = None
+        self._streaming_config = None
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding[self.encoding],
+                sample_rate_hertz=self.rate,
+                language_code=self.language_code,
+                model=self.model,
+                use_enhanced=self.use_enhanced,
+            )
+        return self._config
+
+    @property
+    def streaming_config(self):
+        if self._streaming_config is None:
+            self._streaming_config = speech.StreamingRecognitionConfig(config=self.config, interim_results=True)
+        return self._streaming_config
+
+    def warm_up(self):
+        self.registry.warm_up(["speech"], background=False)
+
+    def stream(self, chunks):
+        requests = (speech.StreamingRecognizeRequest(audio_content=content) for content in chunks)
+        return google_transcripts(self.client.streaming_recognize(self.streaming_config, requests))
+
+    def recognize(self, content):
+        audio = speech.RecognitionAudio(content=content)
+        response = self.registry.call("speech", "recognize", config=self.config, audio=audio)
+        transcripts = []
+        for result in response.results:
+            transcript = result.alternatives[0].transcript
+            if transcript.strip():  # Only process non-empty transcripts
+                transcripts.append(transcript)
+        return transcripts
+
+
+_vosk_models = {}
+_vosk_lock = threading.Lock()
+
+
+def load_vosk_model(path=None):
+    """Load a Vosk model once per process; every session and stream shares it."""
+    path = path or VOSK_MODEL_PATH
+    with _vosk_lock:
+        if path not in _vosk_models:
+            if not os.path.isdir(path):
+                raise Exception(f"Vosk model not found at {path}. Download one from "
+                                f"https://alphacephei.com/vosk/models and set VOSK_MODEL_PATH.")
+            vosk.SetLogLevel(-1)
+            _vosk_models[path] = vosk.Model(path)
+        return _vosk_models[path]
+
+
+class VoskRecognizer:
+    """Offline recognition with a Vosk (Kaldi) model on the CPU.
+
+    The model decides the language; language_code is accepted for a uniform constructor.
+    """
+    name = "vosk"
+    encodings = ("LINEAR16",)
+
+    def __init__(self, registry=None, language_code="en-US", rate=SAMPLE_RATE, model_path=None, encoding="LINEAR16"):
+        if not VOSK_AVAILABLE:
+            raise Exception("The local recognizer needs vosk: pip install vosk")
+        self.language_code = language_code
+        self.rate = rate
+        self.encoding = encoding
+        self.model_path = model_path or VOSK_MODEL_PATH
+
+    def warm_up(self):
+        load_vosk_model(self.model_path)
+
+    def stream(self, chunks):
+        recognizer = vosk.KaldiRecognizer(load_vosk_model(self.model_path), self.rate)
+        partial = ""
+        for content in chunks:
+            if recognizer.AcceptWaveform(content):
+                # The recognizer found the end of an utterance
+                partial = ""
+                text = json.loads(recognizer.Result()).get("text", "")
+                if text:
+                    yield text, True
+                continue
+            text = json.loads(recognizer.PartialResult()).get("partial", "")
+            if text and text != partial:
+                partial = text
+                yield text, False
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        if text:
+            yield text, True
+
+    def recognize(self, content):
+        recognizer = vosk.KaldiRecognizer(load_vosk_model(self.model_path), self.rate)
+        recognizer.AcceptWaveform(content)
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        return [text] if text.strip() else []
+
+
+RECOGNIZERS = {"google": GoogleRecognizer, "vosk": VoskRecognizer}
+
+
+def available_recognizers():
+    """Names of the backends whose libraries are installed."""
+    names = []
+    if speech is not None:
+        names.append("google")
+    if VOSK_AVAILABLE:
+        names.append("vosk")
+    return names
+
+
+def make_recognizer(name=DEFAULT_RECOGNIZER, registry=None, language_code="en-US", rate=SAMPLE_RATE,
+                    encoding="LINEAR16"):
+    """A backend by name. An encoding it can't take (e.g. FLAC for the local model,
+    which needs no upload) falls back to LINEAR16."""
+    if name not in RECOGNIZERS:
+        raise ValueError(f"Unknown recognizer: {name}")
+    backend = RECOGNIZERS[name]
+    if encoding not in backend.encodings:
+        encoding = "LINEAR16"
+    return backend(registry=registry, language_code=language_code, rate=rate, encoding=encoding)
+
+
+if __name__ == '__main__':
+    # Example usage: transcribe a 16 kHz mono WAV file with every installed backend
+    import sys
+    import wave
+
+    with wave.open(sys.argv[1], 'rb') as wf:
+        pcm = wf.readframes(wf.getnframes())
+    for name in available_recognizers():
+        recognizer = make_recognizer(name)
+        chunks = (pcm[offset:offset + 3200] for offset in range(0, len(pcm), 3200))
+        for transcript, is_final in recognizer.stream(chunks):
+            print(f"[DEBUG] {name} {'final' if is_final else 'interim'}: {transcript}")
@@ -0,0 +1,195 @@
+"""
+Local passage retrieval for question answering.
+
+The document is split into overlapping chunks of words and indexed with BM25. The
+index is a set of flat NumPy arrays (CSR-style postings plus the chunk text as one
+UTF-8 blob), so it can be saved to a directory and memory-mapped back in.
+"""
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 50
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i in is it its of on or that the
+their there these this to was were what when where which who why will with you your
+""".split())
+
+_WORD = re.compile(r"\S+")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens with stopwords removed."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Split text into chunks of about `chunk_words` words, each overlapping the previous one.
+
+    Chunks are slices of the original text, so line breaks and punctuation are kept.
+    """
+    if overlap >= chunk_words:
+        raise ValueError("Chunk overlap must be smaller than the chunk size")
+    spans = [match.span() for match in _WORD.finditer(text)]
+    chunks = []
+    step = chunk_words - overlap
+    for first in range(0, len(spans), step):
+        last = min(first + chunk_words, len(spans)) - 1
+        chunks.append(text[spans[first][0]:spans[last][1]])
+        if last == len(spans) - 1:
+            break
+    return chunks
+
+
+def chunk_pages(pages, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Chunk an iterable of pages page by page, yielding (page_number, chunk).
+
+    Pages are consumed lazily, so chunking can start before extraction has finished.
+    """
+    for page in pages:
+        for chunk in chunk_text(page.text, chunk_words, overlap):
+            yield page.number, chunk
+
+
+class BM25Index:
+    """BM25 index over a list of text chunks, each optionally tagged with its page number (0 if unknown)."""
+    K1 = 1.5
+    B = 0.75
+    ARRAYS = ("term_ptr", "postings_doc", "postings_tf", "doc_len", "chunk_offsets", "chunk_blob", "chunk_pages")
+
+    def __init__(self, vocab, term_ptr, postings_doc, postings_tf, doc_len, chunk_offsets, chunk_blob, chunk_pages):
+        self.vocab = vocab
+        self.term_ptr = term_ptr
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+        self.chunk_offsets = chunk_offsets
+        self.chunk_blob = chunk_blob
+        self.chunk_pages = chunk_pages
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, chunks):
+        """Index an iterable of chunk strings."""
+        return cls.build_from_pages((0, chunk) for chunk in chunks)
+
+    @classmethod
+    def build_from_pages(cls, page_chunks):
+        """Index an iterable of (page_number, chunk) pairs, consuming it as it arrives."""
+        vocab = {}
+        postings = []
+        lengths = []
+        pages = []
+        encoded = []
+        for doc_id, (page_number, chunk) in enumerate(page_chunks):
+            pages.append(page_number)
+            encoded.append(chunk.encode("utf-8"))
+            counts = {}
+            for token in tokenize(chunk):
+                counts[token] = counts.get(token, 0) + 1
+            lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                term_id = vocab.setdefault(token, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc_id, tf))
+
+        term_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        term_ptr[1:] = np.cumsum([len(plist) for plist in postings])
+        postings_doc = np.empty(term_ptr[-1], dtype=np.int32)
+        postings_tf = np.empty(term_ptr[-1], dtype=np.int32)
+        for term_id, plist in enumerate(postings):
+            start = term_ptr[term_id]
+            postings_doc[start:start + len(plist)] = [doc_id for doc_id, _ in plist]
+            postings_tf[start:start + len(plist)] = [tf for _, tf in plist]
+
+        doc_len = np.array(lengths, dtype=np.int32)
+        chunk_pages = np.array(pages, dtype=np.int32)
+        chunk_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        chunk_offsets[1:] = np.cumsum([len(data) for data in encoded])
+        chunk_blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(vocab, term_ptr, postings_doc, postings_tf, doc_len, chunk_offsets, chunk_blob, chunk_pages)
+
+    def chunk(self, chunk_id):
+        """Return the text of a chunk."""
+        start, end = self.chunk_offsets[chunk_id], self.chunk_offsets[chunk_id + 1]
+        return bytes(self.chunk_blob[start:end]).decode("utf-8")
+
+    def page(self, chunk_id):
+        """Return the page number a chunk came from, or 0 if unknown."""
+        return int(self.chunk_pages[chunk_id])
+
+    @property
+    def total_length(self):
+        """Sum of chunk lengths in tokens."""
+        return int(self.doc_len.sum())
+
+    def document_frequency(self, token):
+        """Number of chunks containing a token."""
+        term_id = self.vocab.get(token)
+        if term_id is None:
+            return 0
+        return int(self.term_ptr[term_id + 1] - self.term_ptr[term_id])
+
+    def search(self, query, k=5, stats=None):
+        """Return up to k (chunk_id, score) pairs, best first; chunks sharing no terms are left out.
+
+        `stats` = (num_chunks, avgdl, document_frequencies) overrides this index's own
+        collection statistics, so scores from several indexes are comparable.
+        """
+        if not len(self):
+            return []
+        scores = self._scores(query, stats)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(chunk_id), float(scores[chunk_id])) for chunk_id in top if scores[chunk_id] > 0]
+
+    def _scores(self, query, stats=None):
+        scores = np.zeros(len(self), dtype=np.float32)
+        if stats is None:
+            num_docs, avgdl, frequencies = len(self), self.avgdl, None
+        else:
+            num_docs, avgdl, frequencies = stats
+        for token in set(tokenize(query)):
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            docs = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end].astype(np.float32)
+            df = end - start if frequencies is None else frequencies[token]
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            norm = self.K1 * (1 - self.B + self.B * self.doc_len[docs] / avgdl)
+            # A term appears once per chunk in its postings, so plain fancy-index add is safe
+            scores[docs] += idf * tf * (self.K1 + 1) / (tf + norm)
+        return scores
+
+    def save(self, directory):
+        """Write the index to a directory of .npy files plus the vocabulary as JSON."""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved index; with mmap the arrays stay on disk until touched."""
+        mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+            for name in cls.ARRAYS
+        }
+        with open(os.path.join(directory, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+        return cls(vocab, **arrays)
@@ -0,0 +1,510 @@
+"""
+Headless server mode: the voice pipeline behind a local HTTP/WebSocket API.
+
+Every client gets its own session (QASystem, session engine and recognizer), while
+extracted documents, their indexes and the answer and speech caches are shared by all
+sessions. A shared document is kept in memory while some open session uses it; the
+extracted pages stay in the document store, so uploading it again later is cheap. Admission control caps the number of sessions, concurrent uploads and
+answers being generated at once; whatever does not fit is turned away with 503.
+
+    POST   /sessions?recognizer=google|vosk&speculate=retrieval|answer   -> {"session_id": ...}
+    DELETE /sessions/{id}
+    POST   /sessions/{id}/documents?name=X    body: the PDF or JPEG file
+    GET    /sessions/{id}/documents
+    DELETE /sessions/{id}/documents/{doc_id}
+    POST   /sessions/{id}/ask                 {"question": ...} -> {"answer": ..., "sources": [...]}
+    GET    /sessions/{id}/stream              WebSocket, see below
+    GET    /health
+    GET    /metrics                           span percentiles and counters (Prometheus text)
+    GET    /metrics.json                      the same as JSON
+
+On the WebSocket the client sends binary frames of 16 kHz mono LINEAR16 audio and
+JSON messages {"type": "ask", "question": ...}, {"type": "end_audio"} and
+{"type": "cancel"}. The server sends JSON messages of type "transcript", "answer",
+"error" and "stop" (drop queued audio), and binary frames with one WAV clip per
+spoken sentence.
+
+With speculate=retrieval or speculate=answer, a session starts retrieving passages
+or generating the answer once an interim transcript settles, and keeps the work if
+the final transcript matches it (see session.py).
+
+    python server.py --port 8080
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from answer_cache import AnswerCache
+from backend import PushAudioStream, StreamingRecognizer
+from capture import DEFAULT_PROFILE
+from clients import default_registry
+from file_processor import EXTRACTOR_VERSION, FileProcessor
+from qa_engine import QASystem, index_pages
+from recognizers import DEFAULT_RECOGNIZER, available_recognizers, make_recognizer
+from session import SPECULATION_MODES, SessionEngine
+from tracing import default_tracer
+from tts_cache import AudioCache
+from tts_engine import TTSEngine
+
+try:
+    from aiohttp import WSMsgType, web
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+MAX_SESSIONS = 32
+# Answers generated at once across all sessions, and uploads extracted at once
+MAX_ACTIVE_ANSWERS = 8
+MAX_ACTIVE_UPLOADS = 2
+# Seconds a turn or upload waits for a free slot before it is turned away
+ADMISSION_TIMEOUT = 10
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+# Sessions without a WebSocket are closed after this many idle seconds
+SESSION_IDLE_TIMEOUT = 600
+REAP_INTERVAL = 30
+# Messages buffered per client; the oldest are dropped when a client reads too slowly
+OUTBOX_SIZE = 256
+WORKER_THREADS = 32
+
+
+class ClientSink:
+    """Playback sink that sends each clip to the session's client instead of a sound card."""
+    def __init__(self, session):
+        self._session = session
+
+    def play(self, audio):
+        if self._session.websocket is not None:
+            self._session.send_threadsafe(audio)
+        return True
+
+    def busy(self):
+        return False
+
+    def stop(self):
+        self._session.send_threadsafe({"type": "stop"})
+
+
+class SharedDocument:
+    """A document extracted and indexed once, whose index objects every session reuses."""
+    def __init__(self, key, doc_id, name, text, index, exercises, index_dir):
+        self.key = key
+        self.doc_id = doc_id
+        self.name = name
+        self.text = text
+        self.index = index
+        self.exercises = exercises
+        self.index_dir = index_dir
+        # Ids of the sessions using the document
+        self.sessions = set()
+
+
+class ServerSession:
+    """State of one client: its documents and scope, its turns and its audio stream."""
+    def __init__(self, session_id, state, loop, recognizer=DEFAULT_RECOGNIZER, speculate=None):
+        self.session_id = session_id
+        self.state = state
+        self.loop = loop
+        self.outbox = asyncio.Queue(maxsize=OUTBOX_SIZE)
+        self.websocket = None
+        # Task sending the outbox to the attached WebSocket
+        self.sender = None
+        self.dropped = 0
+        self.last_active = time.monotonic()
+        self.qa_system = QASystem(registry=state.registry, cache=state.answer_cache, shared_cache=True)
+        self.tts_engine = TTSEngine(registry=state.registry, cache=state.audio_cache, sink=ClientSink(self),
+                                    low_latency=True)
+        self.engine = SessionEngine(
+            None, self.qa_system, self.tts_engine,
+            on_transcript=self._on_transcript, on_answer=self._on_answer, on_error=self._on_error,
+            loop=loop, executor=state.executor, answer_slots=state.answer_slots,
+            admission_timeout=state.admission_timeout, speculate=speculate,
+        )
+        # Each session picks its speech recognizer; a local model is loaded once and shared
+        self.recognizer = make_recognizer(recognizer, state.registry, rate=DEFAULT_PROFILE.rate)
+        self._audio = None
+        self._recognizer = None
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def send(self, message):
+        """Queue a JSON message or audio clip for the client; runs on the loop."""
+        if self.outbox.full():
+            self.outbox.get_nowait()
+            self.dropped += 1
+        self.outbox.put_nowait(message)
+
+    def send_threadsafe(self, message):
+        self.loop.call_soon_threadsafe(self.send, message)
+
+    def add_document(self, document):
+        self.qa_system.add_document(document.text, document.index, document.exercises,
+                                    document.index_dir, document.doc_id, document.name)
+
+    def feed_audio(self, data):
+        """Pass received PCM to the recognizer, starting a new recognition stream if none is open."""
+        if self._audio is None:
+            self._audio = PushAudioStream()
+            self._recognizer = StreamingRecognizer(self.recognizer, self._audio)
+            self._recognizer.start(self.engine.on_transcript, self.engine.on_error)
+        self._audio.write(data)
+
+    def stop_audio(self):
+        if self._audio is not None:
+            self._recognizer.stop()
+            self._audio.close()
+            self._audio = self._recognizer = None
+
+    async def pump(self, websocket):
+        """Send queued messages and clips to the client until cancelled."""
+        while True:
+            message = await self.outbox.get()
+            if isinstance(message, bytes):
+                default_tracer.count("server.audio_bytes_sent", len(message))
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_json(message)
+
+    def close(self):
+        self.stop_audio()
+        self.engine.close()
+        self.tts_engine.playback.close()
+
+    def _on_transcript(self, transcript, is_final):
+        self.send({"type": "transcript", "text": transcript, "final": is_final})
+
+    def _on_answer(self, question, answer, sources, timings, details):
+        self.send({"type": "answer", "question": question, "answer": answer,
+                   "sources": [[name, page] for name, page in sources], "timings": timings,
+                   "turn_id": details["turn_id"]})
+
+    def _on_error(self, message):
+        self.send({"type": "error", "message": message})
+
+
+class ServerState:
+    """Everything shared between sessions: clients, document store, caches and admission limits."""
+    def __init__(self, registry=None, store=None, max_sessions=MAX_SESSIONS, max_active_answers=MAX_ACTIVE_ANSWERS,
+                 max_active_uploads=MAX_ACTIVE_UPLOADS, admission_timeout=ADMISSION_TIMEOUT,
+                 answer_cache=None, audio_cache=None):
+        self.registry = registry or default_registry
+        self.file_processor = FileProcessor(registry=self.registry, store=store)
+        self.answer_cache = answer_cache or AnswerCache()
+        self.audio_cache = audio_cache or AudioCache()
+        self.executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="server")
+        self.max_sessions = max_sessions
+        self.admission_timeout = admission_timeout
+        self.answer_slots = asyncio.Semaphore(max_active_answers)
+        self.upload_slots = asyncio.Semaphore(max_active_uploads)
+        self.sessions = {}
+        self.documents = {}
+        self._loading = {}
+        self.documents_indexed = 0
+        self.rejected_sessions = 0
+        self.rejected_uploads = 0
+        self._closed_turns = {"completed": 0, "rejected": 0, "timeouts": 0}
+
+    def open_session(self, loop, recognizer=DEFAULT_RECOGNIZER, speculate=None):
+        """Return a new session, or None if the server is full."""
+        if len(self.sessions) >= self.max_sessions:
+            self.rejected_sessions += 1
+            return None
+        session = ServerSession(uuid.uuid4().hex, self, loop, recognizer, speculate)
+        self.sessions[session.session_id] = session
+        return session
+
+    def close_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.release_documents(session_id)
+            self._closed_turns["completed"] += session.engine.turns_completed
+            self._closed_turns["rejected"] += session.engine.rejected
+            self._closed_turns["timeouts"] += session.engine.timeouts
+            session.close()
+
+    def close_idle_sessions(self, idle_timeout=SESSION_IDLE_TIMEOUT):
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if session.websocket is None and now - session.last_active > idle_timeout:
+                print(f"[DEBUG] Closing idle session {session_id}")
+                self.close_session(session_id)
+
+    async def load_document(self, file_path, name):
+        """Extract and index an uploaded file once; concurrent uploads of the same file share the work.
+
+        Returns None if no upload slot became free in time.
+        """
+        loop = asyncio.get_running_loop()
+        key = await loop.run_in_executor(self.executor, self.file_processor.store.key, file_path, EXTRACTOR_VERSION)
+        if key in self.documents:
+            return self.documents[key]
+        if key not in self._loading:
+            self._loading[key] = loop.create_task(self._index_document(file_path, name, key))
+        try:
+            return await asyncio.shield(self._loading[key])
+        finally:
+            if self._loading.get(key) is not None and self._loading[key].done():
+                self._loading.pop(key, None)
+
+    def attach_document(self, session, document):
+        """Add a shared document to a session; it stays shared until its last session lets go."""
+        document.sessions.add(session.session_id)
+        self.documents.setdefault(document.key, document)
+        session.add_document(document)
+
+    def release_documents(self, session_id, doc_id=None):
+        """A session stops using one document, or all of them; unused documents are dropped."""
+        for key, document in list(self.documents.items()):
+            if doc_id is not None and document.doc_id != doc_id:
+                continue
+            document.sessions.discard(session_id)
+            if not document.sessions:
+                del self.documents[key]
+
+    async def _index_document(self, file_path, name, key):
+        try:
+            await asyncio.wait_for(self.upload_slots.acquire(), self.admission_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_uploads += 1
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+            document = await loop.run_in_executor(self.executor, self._index_file, file_path, name, key)
+            self.documents[key] = document
+            self.documents_indexed += 1
+            return document
+        finally:
+            self.upload_slots.release()
+
+    def _index_file(self, file_path, name, key):
+        with default_tracer.span("document.index"):
+            document = self.file_processor.load_document(file_path)
+            text, index, exercises = index_pages(document.pages, document.index_dir)
+        return SharedDocument(key, document.doc_id, name, text, index, exercises, document.index_dir)
+
+    def stats(self):
+        engines = [session.engine for session in self.sessions.values()]
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "documents": len(self.documents),
+            "documents_indexed": self.documents_indexed,
+            "rejected_sessions": self.rejected_sessions,
+            "rejected_uploads": self.rejected_uploads,
+            "turns_completed": self._closed_turns["completed"] + sum(engine.turns_completed for engine in engines),
+            "turns_rejected": self._closed_turns["rejected"] + sum(engine.rejected for engine in engines),
+            "turns_timed_out": self._closed_turns["timeouts"] + sum(engine.timeouts for engine in engines),
+            "dropped_messages": sum(session.dropped for session in self.sessions.values()),
+            "answer_cache": self.answer_cache.stats(),
+            "audio_cache": self.audio_cache.stats(),
+        }
+
+    def close(self):
+        for session_id in list(self.sessions):
+            self.close_session(session_id)
+        self.executor.shutdown(wait=False)
+
+
+def _error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+def _session(request):
+    session = request.app["state"].sessions.get(request.match_info["session_id"])
+    if session is not None:
+        session.touch()
+    return session
+
+
+async def create_session(request):
+    recognizer = request.query.get("recognizer", DEFAULT_RECOGNIZER)
+    if recognizer not in available_recognizers():
+        return _error(400, f"Recognizer {recognizer!r} is not available; choose one of {available_recognizers()}")
+    speculate = request.query.get("speculate")
+    if speculate not in SPECULATION_MODES:
+        return _error(400, f"Unknown speculation mode {speculate!r}; choose retrieval or answer")
+    session = request.app["state"].open_session(asyncio.get_running_loop(), recognizer, speculate)
+    if session is None:
+        return web.json_response({"error": "Too many sessions"}, status=503, headers={"Retry-After": "5"})
+    return web.json_response({"session_id": session.session_id}, status=201)
+
+
+async def delete_session(request):
+    if _session(request) is None:
+        return _error(404, "Unknown session")
+    request.app["state"].close_session(request.match_info["session_id"])
+    return web.json_response({"closed": True})
+
+
+async def upload_document(request):
+    session = _session(request)
+    if session is None:
+        return _error(404, "Unknown session")
+    name = os.path.basename(request.query.get("name", ""))
+    if not name.lower().endswith((".pdf", ".jpeg", ".jpg")):
+        return _error(400, "Unsupported file type. Please upload a PDF or JPEG file.")
+    directory = tempfile.mkdtemp(prefix="upload-")
+    file_path = os.path.join(directory, name)
+    try:
+        size = 0
+        with open(file_path, "wb") as f:
+            async for block in request.content.iter_chunked(1024 * 1024):
+                size += len(block)
+                if size > MAX_UPLOAD_BYTES:
+                    return _error(413, f"Files larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB are not accepted")
+                f.write(block)
+        document = await request.app["state"].load_document(file_path, name)
+    except Exception as e:
+        return _error(422, f"Failed to process file: {e}")
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        os.rmdir(directory)
+    if document is None:
+        return web.json_response({"error": "Too many uploads in progress"}, status=503, headers={"Retry-After": "5"})
+    request.app["state"].attach_document(session, document)
+    return web.json_response({"doc_id": document.doc_id, "name": document.name,
+                              "chunks": len(document.index), "exercises": len(document.exercises)}, status=201)
+
+
+async def list_documents(request):
+    session = _session(request)
+    if session is None:
+        return _error(404, "Unknown session")
+    documents = session.qa_system.corpus.documents()
+    return web.json_response([{"doc_id": doc_id, "name": name} for doc_id, name in documents])
+
+
+async def remove_document(request):
+    session = _session(request)
+    if session is None:
+        return _error(404, "Unknown session")
+    session.qa_system.remove_document(request.match_info["doc_id"])
+    request.app["state"].release_documents(session.session_id, request.match_info["doc_id"])
+    return web.json_response({"removed": True})
+
+
+async def ask(request):
+    session = _session(request)
+    if session is None:
+        return _error(404, "Unknown session")
+    try:
+        question = (await request.json())["question"]
+    except (ValueError, KeyError, TypeError):
+        return _error(400, 'Expected a JSON body {"question": ...}')
+    answer, sources = await session.engine.turn_with_sources(question)
+    if answer is None:
+        return web.json_response({"error": "No answer"}, status=503, headers={"Retry-After": "5"})
+    return web.json_response({"answer": answer, "sources": [[name, page] for name, page in sources]})
+
+
+async def stream(request):
+    session = _session(request)
+    if session is None:
+        return _error(404, "Unknown session")
+    websocket = web.WebSocketResponse(heartbeat=30)
+    await websocket.prepare(request)
+    # A new socket replaces the old one, whose pump would otherwise keep taking messages
+    previous = session.websocket
+    if session.sender is not None:
+        session.sender.cancel()
+    session.websocket = websocket
+    sender = session.sender = asyncio.get_running_loop().create_task(session.pump(websocket))
+    if previous is not None:
+        await previous.close(message=b"Replaced by a new connection")
+    try:
+        async for message in websocket:
+            session.touch()
+            if message.type == WSMsgType.BINARY:
+                session.feed_audio(message.data)
+            elif message.type == WSMsgType.TEXT:
+                try:
+                    command = json.loads(message.data)
+                except ValueError:
+                    session.send({"type": "error", "message": "Messages must be JSON"})
+                    continue
+                kind = command.get("type")
+                if kind == "ask" and command.get("question"):
+                    asyncio.get_running_loop().create_task(session.engine.turn(command["question"]))
+                elif kind == "end_audio":
+                    session.stop_audio()
+                elif kind == "cancel":
+                    session.engine.cancel_turns()
+                else:
+                    session.send({"type": "error", "message": f"Unknown message type: {kind}"})
+    finally:
+        sender.cancel()
+        if session.websocket is websocket:
+            session.stop_audio()
+            session.websocket = session.sender = None
+    return websocket
+
+
+async def health(request):
+    return web.json_response(request.app["state"].stats())
+
+
+async def metrics(request):
+    return web.Response(text=default_tracer.prometheus(), content_type="text/plain")
+
+
+async def metrics_json(request):
+    return web.json_response(default_tracer.snapshot())
+
+
+async def _reap_idle_sessions(app):
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        app["state"].close_idle_sessions()
+
+
+async def _start_background_tasks(app):
+    app["reaper"] = asyncio.get_running_loop().create_task(_reap_idle_sessions(app))
+
+
+async def _cleanup(app):
+    app["reaper"].cancel()
+    app["state"].close()
+
+
+def create_app(state=None):
+    """Build the aiohttp application; `state` defaults to a ServerState using the real services."""
+    if not AIOHTTP_AVAILABLE:
+        raise Exception("Server mode needs aiohttp: pip install aiohttp")
+    app = web.Application(client_max_size=MAX_UPLOAD_BYTES)
+    app["state"] = state or ServerState()
+    app.add_routes([
+        web.post("/sessions", create_session),
+        web.delete("/sessions/{session_id}", delete_session),
+        web.post("/sessions/{session_id}/documents", upload_document),
+        web.get("/sessions/{session_id}/documents", list_documents),
+        web.delete("/sessions/{session_id}/documents/{doc_id}", remove_document),
+        web.post("/sessions/{session_id}/ask", ask),
+        web.get("/sessions/{session_id}/stream", stream),
+        web.get("/health", health),
+        web.get("/metrics", metrics),
+        web.get("/metrics.json", metrics_json),
+    ])
+    app.on_startup.append(_start_background_tasks)
+    app.on_cleanup.append(_cleanup)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the voice QA pipeline over a local HTTP/WebSocket API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    parser.add_argument("--max-answers", type=int, default=MAX_ACTIVE_ANSWERS)
+    args = parser.parse_args()
+    state = ServerState(max_sessions=args.max_sessions, max_active_answers=args.max_answers)
+    web.run_app(create_app(state), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,512 @@
+"""
+Asynchronous core of a voice session.
+
+Question answering and speech synthesis run as asyncio tasks on an event loop in a
+background thread; blocking client calls are handed to a thread pool, so every stage
+can be cancelled or given a timeout. Turns overlap: while one answer is being spoken
+the next question is already recognized and answered, and its speech is queued to
+follow. Capture and recognition keep their own threads (PyAudio and the gRPC stream
+block) and reach the loop through the thread-safe callbacks on_transcript and on_error.
+
+With `speculate`, work on a question starts before the recognizer has finished it.
+Once an interim transcript has stayed the same for `speculate_after` seconds the
+engine retrieves its passages ("retrieval") or generates the whole answer
+("answer") in the background. If the final transcript matches that interim
+within `speculation_similarity`, the turn uses the work already done; otherwise
+it is cancelled and the turn starts from scratch. Speculating on answers costs a
+model call for every miss.
+"""
+import asyncio
+import contextvars
+import difflib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from answer_cache import normalize_question
+from latency import TurnTimer
+from qa_engine import AnswerState
+from tracing import default_tracer, new_turn_id, reset_turn, set_turn
+from tts_engine import SentenceSplitter
+
+# Seconds to wait for the first piece of an answer, for the whole answer, and for each sentence's audio
+FIRST_TOKEN_TIMEOUT = 20
+ANSWER_TIMEOUT = 90
+SYNTHESIS_TIMEOUT = 15
+# Turns in flight at once; later questions wait their turn
+MAX_ACTIVE_TURNS = 2
+# Seconds a turn may wait for a shared answer slot before it is turned away
+ADMISSION_TIMEOUT = 10
+TIMEOUT_MESSAGE = "The answer took too long and was stopped."
+BUSY_MESSAGE = "The server is busy right now. Please ask again in a moment."
+# What to do ahead of the final transcript: nothing, retrieve passages, or generate the answer
+SPECULATION_MODES = (None, "retrieval", "answer")
+# Seconds an interim transcript must stay unchanged before work on it starts
+SPECULATE_AFTER = 0.3
+# Word-level similarity between interim and final transcript needed to keep the work
+SPECULATION_SIMILARITY = 0.9
+# Shorter interims are too unsettled to speculate on
+SPECULATION_MIN_WORDS = 3
+# Seconds after which speculative work no final transcript claimed is discarded
+SPECULATION_TTL = 10
+
+
+def transcript_similarity(a, b):
+    """Similarity (0 to 1) of two transcripts as normalized word sequences."""
+    return difflib.SequenceMatcher(None, normalize_question(a).split(), normalize_question(b).split()).ratio()
+
+
+class AdmissionError(Exception):
+    """No shared answer slot became free in time."""
+
+
+class Speculation:
+    """Work started on an interim transcript: a retrieval future or a generation task."""
+    def __init__(self, question, mode, loop):
+        self.question = question
+        self.mode = mode
+        self.created = time.monotonic()
+        # When the work itself started and finished; saved latency is measured between them
+        self.began = None
+        self.finished = None
+        self.retrieved = None
+        self.task = None
+        # For answers: set once the answer is streaming into `chunks`
+        self.ready = loop.create_future()
+        self.chunks = None
+        self.stop = None
+
+    def saved(self):
+        """Seconds of work done before now, i.e. taken off the turn that uses it."""
+        if self.began is None:
+            return 0.0
+        return max(0.0, min(time.monotonic(), self.finished or time.monotonic()) - self.began)
+
+    def cancel(self):
+        if self.stop is not None:
+            self.stop.set()
+        for future in (self.retrieved, self.task):
+            if future is not None:
+                future.cancel()
+        if not self.ready.done():
+            self.ready.cancel()
+        elif not self.ready.cancelled():
+            self.ready.exception()
+
+
+class SessionEngine:
+    """Runs voice turns (question -> answer -> speech) as cancellable asyncio tasks.
+
+    Callbacks run on the engine's loop thread:
+    on_transcript(transcript, is_final), on_answer(question, answer, sources, timings, details)
+    and on_error(message). details holds the turn id and QASystem.answer_details().
+
+    By default the engine runs its own loop and thread pool. Many sessions can share
+    one `loop` and `executor` instead, and an `answer_slots` semaphore shared between
+    them caps how many answers are generated at once across all sessions.
+
+    `speculate` is one of SPECULATION_MODES; see the module docstring.
+    """
+    def __init__(self, converter, qa_system, tts_engine, on_transcript=None, on_answer=None, on_error=None,
+                 max_active_turns=MAX_ACTIVE_TURNS, first_token_timeout=FIRST_TOKEN_TIMEOUT,
+                 answer_timeout=ANSWER_TIMEOUT, synthesis_timeout=SYNTHESIS_TIMEOUT,
+                 loop=None, executor=None, answer_slots=None, admission_timeout=ADMISSION_TIMEOUT, tracer=None,
+                 speculate=None, speculate_after=SPECULATE_AFTER, speculation_similarity=SPECULATION_SIMILARITY):
+        if speculate not in SPECULATION_MODES:
+            raise ValueError(f"Unknown speculation mode: {speculate}")
+        self.converter = converter
+        self.qa_system = qa_system
+        self.tts_engine = tts_engine
+        self._on_transcript = on_transcript
+        self._on_answer = on_answer
+        self._on_error = on_error
+        self.first_token_timeout = first_token_timeout
+        self.answer_timeout = answer_timeout
+        self.synthesis_timeout = synthesis_timeout
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="session")
+        self._answer_slots = answer_slots
+        self.admission_timeout = admission_timeout
+        self.tracer = tracer or default_tracer
+        self._slots = asyncio.Semaphore(max_active_turns)
+        # One answer is generated at a time; a stopped one may still finish on its thread
+        self._qa_lock = asyncio.Lock()
+        self._turns = set()
+        # Set once the latest turn has queued all of its speech; the next turn speaks after it
+        self._previous_spoken = None
+        self.turns_completed = 0
+        self.turns_cancelled = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.speculate = speculate
+        self.speculate_after = speculate_after
+        self.speculation_similarity = speculation_similarity
+        self._speculation = None
+        self._speculation_timer = None
+        self.speculations = 0
+        self.speculation_hits = 0
+        self.speculation_saved = 0.0
+
+        self._thread = None
+        if loop is not None:
+            self.loop = loop
+            return
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # Thread-safe entry points
+
+    def on_transcript(self, transcript, is_final=False):
+        """Recognizer callback: forwards the transcript and starts a turn for final results."""
+        self.loop.call_soon_threadsafe(self._handle_transcript, transcript, is_final)
+
+    def on_error(self, message):
+        self.loop.call_soon_threadsafe(self._emit, self._on_error, message)
+
+    def submit(self, question):
+        """Start a turn; returns a concurrent.futures.Future of the answer text (None on timeout)."""
+        return asyncio.run_coroutine_threadsafe(self.turn(question), self.loop)
+
+    def start_listening(self, device_index, volume_callback=None):
+        """Start capture and recognition; transcripts arrive through on_transcript."""
+        return asyncio.run_coroutine_threadsafe(self._call(
+            self.converter.start_transcription, self.on_transcript, self.on_error, device_index, volume_callback
+        ), self.loop)
+
+    def stop_listening(self):
+        return asyncio.run_coroutine_threadsafe(self._call(self.converter.stop_transcription), self.loop)
+
+    def cancel_turns(self):
+        """Cancel every turn in flight and stop the speech already queued."""
+        self.loop.call_soon_threadsafe(self._cancel_turns)
+
+    def speculation_stats(self):
+        """How often speculative work was used by the final transcript, and the time it saved."""
+        hits = self.speculation_hits
+        return {"mode": self.speculate, "started": self.speculations, "hits": hits,
+                "hit_rate": hits / self.speculations if self.speculations else 0.0,
+                "saved_ms": round(self.speculation_saved * 1000, 1),
+                "saved_ms_per_hit": round(self.speculation_saved * 1000 / hits, 1) if hits else 0.0}
+
+    def close(self):
+        """Cancel the turns in flight; an engine with its own loop also stops listening and its loop."""
+        self.cancel_turns()
+        if self._thread is None:
+            return
+        if self.converter is not None:
+            try:
+                self.stop_listening().result(timeout=5)
+            except Exception as e:
+                print(f"[DEBUG] Could not stop listening: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
+
+    # Loop side
+
+    async def _call(self, function, *args):
+        return await self._in_executor(function, *args)
+
+    def _in_executor(self, function, *args):
+        # Executor threads don't inherit context variables; copy them so spans keep the turn id
+        return self.loop.run_in_executor(self._executor, contextvars.copy_context().run, function, *args)
+
+    def _emit(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"[DEBUG] Session callback error: {e}")
+
+    def _handle_transcript(self, transcript, is_final):
+        self._emit(self._on_transcript, transcript, is_final)
+        if self.speculate is None:
+            if is_final and transcript.strip():
+                self.loop.create_task(self.turn(transcript))
+            return
+        if not is_final:
+            self._interim(transcript)
+            return
+        speculation = self._claim_speculation(transcript)
+        if transcript.strip():
+            self.loop.create_task(self.turn(transcript, speculation))
+
+    def _interim(self, transcript):
+        """Restart the stability timer; drop speculative work the interim has moved away from."""
+        if self._speculation_timer is not None:
+            self._speculation_timer.cancel()
+            self._speculation_timer = None
+        speculation = self._speculation
+        if speculation is not None and transcript_similarity(speculation.question, transcript) < self.speculation_similarity:
+            self._drop_speculation()
+        if len(normalize_question(transcript).split()) >= SPECULATION_MIN_WORDS:
+            self._speculation_timer = self.loop.call_later(self.speculate_after, self._start_speculation, transcript)
+
+    def _start_speculation(self, transcript):
+        self._speculation_timer = None
+        if self._speculation is not None:
+            if transcript_similarity(self._speculation.question, transcript) >= self.speculation_similarity:
+                return
+            self._drop_speculation()
+        speculation = self._speculation = Speculation(transcript, self.speculate, self.loop)
+        self.speculations += 1
+        self.tracer.count("speculation.started")
+        if speculation.mode == "retrieval":
+            def retrieve():
+                speculation.began = time.monotonic()
+                try:
+                    return self.qa_system.retrieve(self.qa_system.memory.search_text(transcript))
+                finally:
+                    speculation.finished = time.monotonic()
+
+            speculation.retrieved = self._in_executor(retrieve)
+        else:
+            speculation.task = self.loop.create_task(self._speculate_answer(speculation))
+
+    async def _speculate_answer(self, speculation):
+        """Generate the answer into speculation.chunks, holding the QA system until it is complete."""
+        async with self._qa_lock:
+            try:
+                await self._admit()
+            except AdmissionError as e:
+                if not speculation.ready.done():
+                    speculation.ready.set_exception(e)
+                raise
+            try:
+                speculation.chunks, speculation.stop, generated = self._start_answer(speculation.question)
+                speculation.began = time.monotonic()
+                speculation.ready.set_result(None)
+                await generated
+                speculation.finished = time.monotonic()
+            finally:
+                if self._answer_slots is not None:
+                    self._answer_slots.release()
+
+    def _claim_speculation(self, transcript):
+        """Returns the speculative work matching a final transcript, cancelling any that doesn't."""
+        if self._speculation_timer is not None:
+            self._speculation_timer.cancel()
+            self._speculation_timer = None
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return None
+        if (time.monotonic() - speculation.created < SPECULATION_TTL and
+                transcript_similarity(speculation.question, transcript) >= self.speculation_similarity):
+            saved = speculation.saved()
+            self.speculation_hits += 1
+            self.speculation_saved += saved
+            self.tracer.count("speculation.hits")
+            self.tracer.record("speculation.saved", saved)
+            return speculation
+        self.tracer.count("speculation.misses")
+        speculation.cancel()
+        return None
+
+    def _drop_speculation(self):
+        if self._speculation is not None:
+            self._speculation.cancel()
+            self._speculation = None
+
+    def _cancel_turns(self):
+        if self._speculation_timer is not None:
+            self._speculation_timer.cancel()
+            self._speculation_timer = None
+        self._drop_speculation()
+        for task in list(self._turns):
+            task.cancel()
+        self.tts_engine.stop()
+
+    async def turn(self, question, speculation=None):
+        """One turn: stream the answer, synthesize it sentence by sentence and queue the audio
+        after the previous turn's. Returns the answer text, or None if it timed out.
+        A Speculation claimed for the question supplies its passages or its answer.
+
+        Every span recorded while the turn runs carries its turn id (timer.turn_id)."""
+        answer, _ = await self.turn_with_sources(question, speculation)
+        return answer
+
+    async def turn_with_sources(self, question, speculation=None):
+        """Like turn, but returns (answer, sources) with this turn's own sources; (None, []) on failure."""
+        turn_id = new_turn_id()
+        token = set_turn(turn_id)
+        timer = TurnTimer(self.tracer, turn_id)
+        previous, spoken = self._previous_spoken, self.loop.create_future()
+        self._previous_spoken = spoken
+        task = asyncio.current_task()
+        self._turns.add(task)
+        try:
+            async with self._slots:
+                timer.mark("started")
+                answer, sources, details = await self._answer_and_speak(question, timer, previous, spoken,
+                                                                        speculation)
+            timer.mark("total")
+            # Follow-up questions are answered with this turn in mind
+            self.qa_system.remember(question, answer)
+            self.turns_completed += 1
+            self.tracer.count("session.turns_completed")
+            details = dict(details, turn_id=turn_id)
+            if speculation is not None:
+                details["speculation"] = speculation.mode
+            self._emit(self._on_answer, question, answer, sources, timer.summary(), details)
+            return answer, sources
+        except AdmissionError:
+            self.rejected += 1
+            self.tracer.count("session.turns_rejected")
+            self._emit(self._on_error, BUSY_MESSAGE)
+            return None, []
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.tracer.count("session.turn_timeouts")
+            self._emit(self._on_error, TIMEOUT_MESSAGE)
+            return None, []
+        except asyncio.CancelledError:
+            if speculation is not None:
+                speculation.cancel()
+            self.turns_cancelled += 1
+            self.tracer.count("session.turns_cancelled")
+            raise
+        except Exception as e:
+            self._emit(self._on_error, f"An error occurred while answering: {e}")
+            return None, []
+        finally:
+            self._turns.discard(task)
+            if not spoken.done():
+                spoken.set_result(None)
+            reset_turn(token)
+
+    async def _answer_and_speak(self, question, timer, previous, spoken, speculation=None):
+        clips = asyncio.Queue()
+        speaker = self.loop.create_task(self._speak(clips, timer, previous, spoken))
+        try:
+            if speculation is not None and speculation.mode == "answer":
+                # The answer to the interim transcript is already streaming in
+                await speculation.ready
+                try:
+                    answer, sources, details = await self._consume(speculation.chunks, speculation.stop, timer, clips)
+                except BaseException:
+                    # Let go of the QA system at once, e.g. when the answer timed out
+                    speculation.cancel()
+                    raise
+            else:
+                retrieved = None
+                if speculation is not None:
+                    try:
+                        retrieved = await speculation.retrieved
+                    except Exception as e:
+                        print(f"[DEBUG] Speculative retrieval failed: {e}")
+                async with self._qa_lock:
+                    await self._admit()
+                    try:
+                        chunks, stop, _ = self._start_answer(question, retrieved)
+                        answer, sources, details = await self._consume(chunks, stop, timer, clips)
+                    finally:
+                        if self._answer_slots is not None:
+                            self._answer_slots.release()
+        except BaseException:
+            speaker.cancel()
+            raise
+        clips.put_nowait(None)
+        await speaker
+        return answer, sources, details
+
+    async def _admit(self):
+        if self._answer_slots is None:
+            return
+        try:
+            await asyncio.wait_for(self._answer_slots.acquire(), self.admission_timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionError(BUSY_MESSAGE)
+
+    def _start_answer(self, question, retrieved=None):
+        """Stream the answer from the QA system into a queue on the thread pool.
+
+        Returns (chunks, stop, generated): the queue, an event that stops the stream
+        and a future done once the whole answer is in the queue. Call with _qa_lock held
+        until `generated` is done or `stop` is set. A stopped stream only notices at its
+        next chunk, but it records its sources and usage in its own AnswerState, so the
+        next answer can start before it has."""
+        chunks = asyncio.Queue()
+        stop = threading.Event()
+
+        def pump():
+            put = lambda item: self.loop.call_soon_threadsafe(chunks.put_nowait, item)
+            state = AnswerState()
+            try:
+                for chunk in self.qa_system.answer_question_stream(question, retrieved, state):
+                    if stop.is_set():
+                        return
+                    put(("chunk", chunk))
+                put(("done", (list(state.sources), self.qa_system.answer_details(state))))
+            except Exception as e:
+                put(("error", e))
+
+        return chunks, stop, self._in_executor(pump)
+
+    async def _consume(self, chunks, stop, timer, clips):
+        """Collect the streamed answer; each finished sentence starts synthesizing at once."""
+        def synthesize(sentence):
+            clips.put_nowait(self._in_executor(self.tts_engine.synthesize, sentence))
+
+        splitter = SentenceSplitter()
+        parts = []
+        deadline = self.loop.time() + self.answer_timeout
+        try:
+            while True:
+                timeout = self.first_token_timeout if not parts else deadline - self.loop.time()
+                kind, value = await asyncio.wait_for(chunks.get(), max(timeout, 0))
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    for sentence in splitter.flush():
+                        synthesize(sentence)
+                    return ("".join(parts),) + value
+                timer.mark("first_token")
+                parts.append(value)
+                for sentence in splitter.feed(value):
+                    synthesize(sentence)
+        finally:
+            stop.set()
+
+    async def _speak(self, clips, timer, previous, spoken):
+        """Queue this turn's clips for playback, in order, once the previous turn has queued its own."""
+        if previous is not None:
+            await asyncio.shield(previous)
+        playback = self.tts_engine.playback
+        generation = playback.generation
+        while True:
+            clip = await clips.get()
+            if clip is None:
+                break
+            if playback.generation != generation:
+                # Barge-in cancelled this answer; the rest of it is not spoken
+                clip.cancel()
+                continue
+            audio = await asyncio.wait_for(clip, self.synthesis_timeout)
+            playback.play(audio, generation=generation, on_start=lambda: timer.mark("first_audio"))
+        spoken.set_result(None)
+
+
+if __name__ == '__main__':
+    # Example usage with local fakes for every service
+    from fakes import FakeGenerativeModel, fake_registry
+    from playback import NullSink
+    from qa_engine import QASystem
+    from tts_cache import AudioCache
+    from tts_engine import TTSEngine
+
+    registry = fake_registry(genai=FakeGenerativeModel(first_token_latency=0.2))
+    qa = QASystem(registry=registry)
+    qa.load_context("The mitochondria is the powerhouse of the cell.")
+    tts = TTSEngine(registry=registry, cache=AudioCache(directory=None), sink=NullSink())
+    engine = SessionEngine(None, qa, tts, on_answer=lambda *args: print("[DEBUG] Answer:", args))
+    for question in ["What is the mitochondria?", "What is the powerhouse of the cell?"]:
+        engine.submit(question)
+    engine.submit("Anything else?").result()
+    engine.close()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Spoken references to textbook exercises and the replies to ambiguous ones.
+
+    python -m pytest -q test_exercises.py
+"""
+
+from exercises import parse_reference
+from qa_engine import QASystem
+
+TEXTBOOK = """Warm-up
+Question 4: Name the parts of a cell.
+
+Chapter 3
+Cells take in water.
+Question 4: Explain osmosis.
+"""
+
+
+def test_number_before_first_chapter_and_in_one_chapter():
+    qa = QASystem()
+    qa.load_context(TEXTBOOK)
+    assert qa.answer_question("Help me with question 4") == (
+        "Question 4 appears before the first chapter and in chapter 3. Which chapter do you mean?")
+
+
+def test_number_in_several_chapters():
+    qa = QASystem()
+    qa.load_context(TEXTBOOK + "\nChapter 5\nQuestion 4: Define pH.\n")
+    assert qa.answer_question("Help me with question 4") == (
+        "Question 4 appears before the first chapter and in chapters 3 and 5. Which chapter do you mean?")
+
+
+def test_spelled_out_question_number():
+    assert parse_reference("help me with question four from chapter 3") == (3, 4)
+    assert parse_reference("Help me with question twelve from chapter three") == (3, 12)
+    assert parse_reference("help me with number five") == (None, 5)
+    qa = QASystem()
+    qa.load_context(TEXTBOOK)
+    assert qa.find_exercise(*parse_reference("help me with question four from chapter 3"))[1].text.endswith(
+        "Explain osmosis.")
+
+
+if __name__ == "__main__":
+    test_number_before_first_chapter_and_in_one_chapter()
+    test_number_in_several_chapters()
+    test_spelled_out_question_number()
+    print("ok")
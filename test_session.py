@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Timeouts and cancellation of SessionEngine turns against a slow fake model.
+
+A turn must give up when its timeout fires or it is cancelled, not when the model
+call it was waiting on returns, and must not hold up the turns after it.
+
+    python -m pytest -q test_session.py
+"""
+
+import concurrent.futures
+import time
+
+from fakes import FakeGenerativeModel, fake_registry
+from playback import NullSink
+from qa_engine import QASystem
+from session import SessionEngine
+from tts_cache import AudioCache
+from tts_engine import TTSEngine
+
+MODEL_LATENCY = 5.0
+FIRST_TOKEN_TIMEOUT = 0.5
+# Slack for thread and loop scheduling on a busy machine
+SLACK = 0.5
+
+
+def make_engine(errors):
+    registry = fake_registry(genai=FakeGenerativeModel(first_token_latency=MODEL_LATENCY))
+    qa = QASystem(registry=registry)
+    qa.load_context("The mitochondria is the powerhouse of the cell.")
+    tts = TTSEngine(registry=registry, cache=AudioCache(directory=None), sink=NullSink())
+    return SessionEngine(None, qa, tts, on_error=errors.append, first_token_timeout=FIRST_TOKEN_TIMEOUT)
+
+
+def test_first_token_timeout_returns_on_time():
+    errors = []
+    engine = make_engine(errors)
+    try:
+        started = time.monotonic()
+        assert engine.submit("What is the mitochondria?").result(timeout=MODEL_LATENCY * 2) is None
+        elapsed = time.monotonic() - started
+        assert elapsed < FIRST_TOKEN_TIMEOUT + SLACK, elapsed
+        assert engine.timeouts == 1
+        # The model call is still running; the next turn must not wait for it
+        started = time.monotonic()
+        assert engine.submit("What is the cell?").result(timeout=MODEL_LATENCY * 2) is None
+        elapsed = time.monotonic() - started
+        assert elapsed < FIRST_TOKEN_TIMEOUT + SLACK, elapsed
+        assert engine.timeouts == 2
+    finally:
+        started = time.monotonic()
+        engine.close()
+        assert time.monotonic() - started < SLACK
+
+
+def test_cancel_during_generation_returns_at_once():
+    errors = []
+    engine = make_engine(errors)
+    engine.first_token_timeout = MODEL_LATENCY * 2
+    try:
+        future = engine.submit("What is the mitochondria?")
+        time.sleep(0.2)
+        started = time.monotonic()
+        engine.cancel_turns()
+        try:
+            future.result(timeout=MODEL_LATENCY * 2)
+            raise AssertionError("the turn was not cancelled")
+        except concurrent.futures.CancelledError:
+            pass
+        elapsed = time.monotonic() - started
+        assert elapsed < SLACK, elapsed
+        assert engine.turns_cancelled == 1
+    finally:
+        started = time.monotonic()
+        engine.close()
+        assert time.monotonic() - started < SLACK
+
+
+if __name__ == "__main__":
+    test_first_token_timeout_returns_on_time()
+    test_cancel_during_generation_returns_at_once()
+    print("ok")
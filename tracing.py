@@ -0,0 +1,251 @@
+"""
+Lightweight tracing for the voice pipeline.
+
+Stages of a turn (capture, segmentation, speech recognition, retrieval, the LLM,
+speech synthesis, playback start) are timed as spans. Each span adds its duration
+to a log-bucketed histogram for its name, so memory stays constant however long the
+app runs and p50/p95/p99 can be read at any time. Counters track volumes such as
+audio bytes sent and tokens used. Spans carry the id of the turn they belong to,
+taken from a context variable set by the session, so one turn can be followed from
+question to first audio.
+
+Recording a span takes a couple of microseconds (one perf_counter pair and a short
+locked update), so tracing stays on in normal use.
+
+    with default_tracer.span("llm.generate"):
+        ...
+    default_tracer.count("stt.bytes_sent", len(content))
+    default_tracer.export("metrics.json")
+"""
+import collections
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+# Smallest duration told apart, and the ratio between bucket bounds (about 5% error)
+MIN_SECONDS = 1e-5
+GROWTH = 1.1
+_LOG_GROWTH = math.log(GROWTH)
+QUANTILES = (0.5, 0.95, 0.99)
+# Spans kept for per-turn breakdowns
+RECENT_SPANS = 4096
+EXPORT_INTERVAL = 60
+
+_current_turn = contextvars.ContextVar("turn_id", default=None)
+
+
+def new_turn_id():
+    return uuid.uuid4().hex[:12]
+
+
+def current_turn():
+    """The id of the turn the calling code runs for, or None."""
+    return _current_turn.get()
+
+
+def set_turn(turn_id):
+    """Mark the current context (thread or asyncio task) as working for turn_id; returns a reset token."""
+    return _current_turn.set(turn_id)
+
+
+def reset_turn(token):
+    _current_turn.reset(token)
+
+
+class Histogram:
+    """Counts values in buckets whose bounds grow by GROWTH; percentiles come from the bucket bounds."""
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        if value <= MIN_SECONDS:
+            index = 0
+        else:
+            index = int(math.log(value / MIN_SECONDS) / _LOG_GROWTH) + 1
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th value (never above the largest value seen)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(MIN_SECONDS * GROWTH ** index, self.max)
+        return self.max
+
+    def summary(self):
+        result = {"count": self.count, "mean": self.total / self.count if self.count else 0.0, "max": self.max}
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = self.percentile(q)
+        return result
+
+
+class _Span:
+    __slots__ = ("_tracer", "_name", "_turn_id", "started")
+
+    def __init__(self, tracer, name, turn_id):
+        self._tracer = tracer
+        self._name = name
+        self._turn_id = turn_id
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._tracer.record(self._name, time.perf_counter() - self.started, self._turn_id)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects span durations into histograms and counters; safe to use from any thread."""
+    def __init__(self, enabled=True, recent_spans=RECENT_SPANS):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._recent = collections.deque(maxlen=recent_spans)
+        self._exporter = None
+
+    def span(self, name, turn_id=None):
+        """Context manager timing the block as span `name`, for turn_id or the current turn."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, turn_id)
+
+    def record(self, name, seconds, turn_id=None):
+        """Add a duration measured elsewhere, e.g. from a callback on another thread."""
+        if not self.enabled:
+            return
+        if turn_id is None:
+            turn_id = _current_turn.get()
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(seconds)
+            self._recent.append((turn_id, name, seconds))
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def turn_spans(self, turn_id):
+        """[(name, milliseconds)] of the recent spans recorded for one turn, in recording order."""
+        with self._lock:
+            return [(name, round(seconds * 1000, 1)) for span_turn, name, seconds in self._recent
+                    if span_turn == turn_id]
+
+    def recent_turns(self):
+        """Ids of the turns with recent spans, oldest first."""
+        with self._lock:
+            turns = [turn_id for turn_id, _, _ in self._recent if turn_id is not None]
+        return list(dict.fromkeys(turns))
+
+    def snapshot(self):
+        """{"spans": {name: {count, mean, max, p50, p95, p99}}, "counters": {name: value}}; times in seconds."""
+        with self._lock:
+            spans = {name: histogram.summary() for name, histogram in self._histograms.items()}
+            counters = dict(self._counters)
+        return {"time": time.time(), "spans": spans, "counters": counters}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._recent.clear()
+
+    def prometheus(self):
+        """The snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = ["# TYPE voiceqa_span_seconds summary"]
+        for name, summary in sorted(snapshot["spans"].items()):
+            for q in QUANTILES:
+                lines.append(f'voiceqa_span_seconds{{span="{name}",quantile="{q}"}} '
+                             f'{summary[f"p{round(q * 100)}"]:.6f}')
+            lines.append(f'voiceqa_span_seconds_sum{{span="{name}"}} {summary["mean"] * summary["count"]:.6f}')
+            lines.append(f'voiceqa_span_seconds_count{{span="{name}"}} {summary["count"]}')
+        lines.append("# TYPE voiceqa_total counter")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'voiceqa_total{{counter="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write the snapshot to a JSON file, replacing it atomically."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temp_path, path)
+
+    def start_export(self, path, interval=EXPORT_INTERVAL):
+        """Export to path every `interval` seconds on a background thread until stop_export()."""
+        self.stop_export()
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.export(path)
+                except Exception as e:
+                    print(f"[DEBUG] Metrics export failed: {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._exporter = (stop, path)
+
+    def stop_export(self):
+        """Stop the periodic export, writing the metrics one last time."""
+        if self._exporter is None:
+            return
+        stop, path = self._exporter
+        self._exporter = None
+        stop.set()
+        try:
+            self.export(path)
+        except Exception as e:
+            print(f"[DEBUG] Metrics export failed: {e}")
+
+
+# Shared by every module, like default_registry
+default_tracer = Tracer()
+
+
+if __name__ == '__main__':
+    # Example usage: time a few fake stages and print the metrics
+    import random
+
+    for _ in range(200):
+        token = set_turn(new_turn_id())
+        with default_tracer.span("retrieval"):
+            time.sleep(random.uniform(0.0005, 0.002))
+        default_tracer.record("llm.first_token", random.uniform(0.3, 0.9))
+        default_tracer.count("llm.output_tokens", random.randint(40, 120))
+        reset_turn(token)
+    print(default_tracer.prometheus())
@@ -0,0 +1,129 @@
+"""
+Content-addressed cache of synthesized speech.
+
+Clips are keyed by a hash of the text and the voice/audio settings. Recently used
+clips are kept in memory, and every clip is also written to a directory so it
+survives restarts. Both tiers evict least recently used clips once they exceed
+their size limit.
+"""
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+
+def audio_key(text, settings):
+    """Key for a clip: hash of the settings fingerprint and the exact text."""
+    return hashlib.sha256(f"{settings}\n{text}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    def __init__(self, directory="tts_cache", max_disk_bytes=50 * 1024 * 1024, max_memory_bytes=8 * 1024 * 1024):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._disk = collections.OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan_disk()
+
+    def get(self, key):
+        """Return the cached clip for a key, or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            on_disk = key in self._disk
+        if not on_disk:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            path = self._path(key)
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._forget_disk(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self._disk.move_to_end(key)
+            self._remember(key, data)
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+        if not self.directory:
+            return
+        path = self._path(key)
+        # A temp file of its own, so writers of the same clip never rename each other's
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        with self._lock:
+            self._forget_disk(key)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                evicted = next(iter(self._disk))
+                self._forget_disk(evicted)
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_clips": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_clips": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _remember(self, key, data):
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _forget_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _scan_disk(self):
+        """Index clips already on disk, oldest use first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".audio"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name[:-len(".audio")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
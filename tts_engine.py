@@ -1,55 +1,193 @@
-from google.cloud import texttospeech
-import pygame
-import time
+import re
+import threading
 import os
+from clients import default_registry, lazy_import
+from playback import PlaybackEngine, PygameSink
+from tracing import default_tracer
+from tts_cache import AudioCache, audio_key
+
+# End of a sentence: terminal punctuation, optional closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+_ABBREVIATIONS = {"e.g.", "i.e.", "mr.", "mrs.", "ms.", "dr.", "vs.", "fig.", "no.", "ch.", "eq.", "p."}
+
+class SentenceSplitter:
+    """Collects streamed text and hands back complete sentences as soon as they end."""
+    def __init__(self, min_chars=20):
+        self._min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        """Add text; returns the sentences completed by it."""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            # Very short fragments ("e.g. ", "1. ") are merged into the next sentence
+            if match.end() - start < self._min_chars:
+                continue
+            last_word = self._buffer[start:match.start() + 1].split()[-1].lower()
+            if last_word in _ABBREVIATIONS or re.fullmatch(r"\w\.", last_word):
+                continue
+            sentences.append(self._buffer[start:match.end()].strip())
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Returns whatever text is left once the stream has ended."""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return [rest] if rest else []
+
+# Sample rate of the uncompressed output path
+LINEAR16_RATE = 24000
+
+# Imported on first synthesis
+texttospeech = lazy_import("google.cloud.texttospeech")
 
 class TTSEngine:
-    def __init__(self):
+    def __init__(self, registry=None, cache=None, sink=None, low_latency=False, tracer=None):
         # Ensure Google credentials come from env; default masked placeholder
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv(
             "GOOGLE_APPLICATION_CREDENTIALS",
             "XXXXXXXXXXXX.json"
         )
-        self.client = texttospeech.TextToSpeechClient()
-        self.voice = texttospeech.VoiceSelectionParams(
+        self.registry = registry or default_registry
+        self.tracer = tracer or default_tracer
+        # The client, voice and audio settings are created on first synthesis
+        self.client = self.registry.proxy("tts")
+        self.low_latency = low_latency
+        self._voice = None
+        self.cache = cache or AudioCache()
+        if sink is None:
+            sink = PygameSink(frequency=LINEAR16_RATE if low_latency else None)
+        self._sink = sink
+        self.playback = PlaybackEngine(sink, tracer=self.tracer)
+
+    def _load_settings(self):
+        voice = texttospeech.VoiceSelectionParams(
             language_code="en-US",
             ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
         )
-        self.audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
+        if self.low_latency:
+            # Uncompressed WAV plays without an MP3 decode step
+            audio_config = texttospeech.AudioConfig(
+                audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+                sample_rate_hertz=LINEAR16_RATE
+            )
+        else:
+            audio_config = texttospeech.AudioConfig(
+                audio_encoding=texttospeech.AudioEncoding.MP3
+            )
+        # Clips are only interchangeable when voice and audio settings match
+        self._settings = (
+            texttospeech.VoiceSelectionParams.to_json(voice, indent=None)
+            + texttospeech.AudioConfig.to_json(audio_config, indent=None)
         )
-        pygame.mixer.init()
+        self.audio_config = audio_config
+        self._voice = voice
 
-    def speak(self, text):
+    @property
+    def voice(self):
+        if self._voice is None:
+            self._load_settings()
+        return self._voice
+
+    def synthesize(self, text):
         """
-        Synthesizes speech from the input string of text.
+        Returns the synthesized audio for the text as bytes, from the cache when possible.
         """
+        voice = self.voice
+        key = audio_key(text, self._settings)
+        audio_content = self.cache.get(key)
+        if audio_content is not None:
+            self.tracer.count("tts.cache_hits")
+            return audio_content
+
         synthesis_input = texttospeech.SynthesisInput(text=text)
-        response = self.client.synthesize_speech(
-            input=synthesis_input,
-            voice=self.voice,
-            audio_config=self.audio_config
-        )
+        with self.tracer.span("tts.synthesize"):
+            response = self.registry.call(
+                "tts", "synthesize_speech",
+                input=synthesis_input,
+                voice=voice,
+                audio_config=self.audio_config
+            )
+        self.tracer.count("tts.chars", len(text))
+        self.tracer.count("tts.bytes_received", len(response.audio_content))
+        self.cache.put(key, response.audio_content)
+        return response.audio_content
 
-        # Use a unique filename for each output
-        filename = f"output_{int(time.time() * 1000)}.mp3"
-        with open(filename, "wb") as out:
-            out.write(response.audio_content)
-
-        try:
-            pygame.mixer.music.load(filename)
-            pygame.mixer.music.play()
-            # Wait for playback to finish
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(10)
-        finally:
-            # Clean up the file after playback
+    def presynthesize(self, phrases):
+        """
+        Synthesizes fixed phrases into the cache on a background thread.
+        """
+        return self.warm_up(phrases, sink=False)
+
+    def warm_up(self, phrases=(), sink=True):
+        """
+        On a background thread: opens the audio output (unless sink is False), loads
+        the speech settings and synthesizes fixed phrases into the cache.
+        """
+        def run():
+            if sink and hasattr(self._sink, "warm_up"):
+                try:
+                    self._sink.warm_up()
+                except Exception as e:
+                    print(f"[DEBUG] Audio output warm-up failed: {e}")
             try:
-                os.remove(filename)
-            except Exception:
-                pass
+                self.voice
+            except Exception as e:
+                print(f"[DEBUG] Speech settings warm-up failed: {e}")
+                return
+            for phrase in phrases:
+                try:
+                    self.synthesize(phrase)
+                except Exception as e:
+                    print(f"[DEBUG] Pre-synthesis failed for {phrase!r}: {e}")
+                    return
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def speak(self, text, wait=False):
+        """
+        Synthesizes speech from the input string of text and queues it for playback.
+        Returns immediately unless wait is set.
+        """
+        self.playback.play(self.synthesize(text))
+        if wait:
+            self.playback.wait()
+
+    def speak_stream(self, text_chunks, timer=None, wait=False):
+        """
+        Speaks text as it streams in: each finished sentence is synthesized and queued
+        for playback while the rest of the text is still arriving. If playback is
+        cancelled midway (barge-in), the remaining text is consumed but not spoken.
+        """
+        generation = self.playback.generation
+        on_start = (lambda: timer.mark("first_audio")) if timer else None
+        splitter = SentenceSplitter()
+
+        def say(sentence):
+            if self.playback.generation == generation:
+                self.playback.play(self.synthesize(sentence), generation=generation, on_start=on_start)
+
+        for chunk in text_chunks:
+            for sentence in splitter.feed(chunk):
+                say(sentence)
+        for sentence in splitter.flush():
+            say(sentence)
+        if wait:
+            self.playback.wait()
+
+    def stop(self):
+        """
+        Stops the current answer and drops any queued speech.
+        """
+        self.playback.cancel()
 
 if __name__ == '__main__':
     # Example usage (for testing)
     tts = TTSEngine()
-    tts.speak("Hello, this is a test of the text-to-speech engine.")
\ No newline at end of file
+    tts.speak("Hello, this is a test of the text-to-speech engine.", wait=True)
\ No newline at end of file
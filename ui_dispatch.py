@@ -0,0 +1,78 @@
+"""
+Thread-safe hand-off of UI work to the Tk main loop.
+
+Tk widgets may only be touched from the thread running mainloop. Worker threads
+post callables here instead; the main loop drains the queue every REFRESH_MS with
+after(). Updates that only need their latest value (such as the volume meter) are
+coalesced to one per refresh, and batched items (such as chat messages) are handed
+to their handler as one list per refresh.
+"""
+import collections
+import threading
+
+# About one display refresh at 60 Hz
+REFRESH_MS = 16
+
+
+class UiDispatcher:
+    def __init__(self, root, refresh_ms=REFRESH_MS):
+        self._root = root
+        self._refresh_ms = refresh_ms
+        self._lock = threading.Lock()
+        self._calls = collections.deque()
+        self._latest = {}
+        self._batches = collections.OrderedDict()
+        self._batch_handlers = {}
+        self._main_thread = threading.get_ident()
+        self._running = True
+        self.coalesced = 0
+        self._root.after(self._refresh_ms, self._drain)
+
+    def post(self, function, *args):
+        """Run function(*args) on the Tk thread, in posting order."""
+        with self._lock:
+            self._calls.append((function, args))
+
+    def post_latest(self, key, function, *args):
+        """Run function(*args) on the Tk thread; a later post with the same key replaces this one."""
+        with self._lock:
+            if key in self._latest:
+                self.coalesced += 1
+            self._latest[key] = (function, args)
+
+    def register_batch(self, key, handler):
+        """handler(items) receives everything posted under key since the last refresh."""
+        self._batch_handlers[key] = handler
+
+    def post_batched(self, key, item):
+        with self._lock:
+            self._batches.setdefault(key, []).append(item)
+
+    def in_main_thread(self):
+        """Whether the caller runs on the thread that created the dispatcher, i.e. the Tk thread."""
+        return threading.get_ident() == self._main_thread
+
+    def stop(self):
+        self._running = False
+
+    def _drain(self):
+        assert self.in_main_thread(), "UiDispatcher drained off the Tk thread"
+        with self._lock:
+            calls, self._calls = self._calls, collections.deque()
+            latest, self._latest = self._latest, {}
+            batches, self._batches = self._batches, collections.OrderedDict()
+        for function, args in calls:
+            self._run(function, *args)
+        for key, items in batches.items():
+            self._run(self._batch_handlers[key], items)
+        for function, args in latest.values():
+            self._run(function, *args)
+        if self._running:
+            self._root.after(self._refresh_ms, self._drain)
+
+    def _run(self, function, *args):
+        try:
+            function(*args)
+        except Exception as e:
+            # A failing update must not stop the queue from being drained
+            print(f"[DEBUG] UI update failed: {e}")
@@ -0,0 +1,110 @@
+import audioop
+import collections
+
+Utterance = collections.namedtuple("Utterance", ["start", "end", "frames"])
+
+
+class UtteranceSegmenter:
+    """Splits a stream of 16-bit audio chunks into utterances using their RMS energy.
+
+    A chunk counts as speech when its RMS is well above an adaptive noise floor.
+    The floor follows non-speech chunks, and is raised to a low percentile of the
+    recent RMS values when that is higher, so a step up in background noise in
+    the middle of an utterance is recognized as noise within a few seconds.
+    An utterance starts after a few consecutive speech chunks and includes some
+    pre-roll before them. It ends after a hangover period of silence or when it
+    reaches the maximum length. Silence between utterances is never emitted.
+    Utterance start/end are chunk indices, with end exclusive.
+    """
+    def __init__(self, chunk_seconds=0.1, threshold_ratio=3.0, min_threshold=300,
+                 initial_noise_floor=100, noise_adapt=0.05, start_seconds=0.2,
+                 hangover_seconds=0.8, preroll_seconds=0.3, max_utterance_seconds=15.0,
+                 noise_window_seconds=4.0, noise_percentile=0.1):
+        self.chunk_seconds = chunk_seconds
+        self.threshold_ratio = threshold_ratio
+        self.min_threshold = min_threshold
+        self.noise_floor = initial_noise_floor
+        self.noise_adapt = noise_adapt
+        self._start_chunks = max(1, round(start_seconds / chunk_seconds))
+        self._hangover_chunks = max(1, round(hangover_seconds / chunk_seconds))
+        self._preroll_chunks = max(0, round(preroll_seconds / chunk_seconds))
+        self._max_chunks = max(1, round(max_utterance_seconds / chunk_seconds))
+        self.noise_percentile = noise_percentile
+        self._recent = collections.deque(maxlen=max(1, round(noise_window_seconds / chunk_seconds)))
+        self._pending = collections.deque(maxlen=self._preroll_chunks + self._start_chunks)
+        self._frames = []
+        self._start = 0
+        self._index = 0
+        self._speech_run = 0
+        self._silence_run = 0
+        self._in_utterance = False
+        self.chunks_seen = 0
+        self.chunks_emitted = 0
+
+    @property
+    def threshold(self):
+        return max(self.min_threshold, self.noise_floor * self.threshold_ratio)
+
+    def feed(self, data, rms=None):
+        """Add one chunk; returns a finished Utterance or None."""
+        if rms is None:
+            rms = audioop.rms(data, 2)
+        index = self._index
+        self._index += 1
+        self.chunks_seen += 1
+        self._track_recent(rms)
+        is_speech = rms >= self.threshold
+
+        if not self._in_utterance:
+            self._pending.append((index, data))
+            if not is_speech:
+                self._speech_run = 0
+                self._update_noise_floor(rms)
+                return None
+            self._speech_run += 1
+            if self._speech_run >= self._start_chunks:
+                self._in_utterance = True
+                self._start = self._pending[0][0]
+                self._frames = [frame for _, frame in self._pending]
+                self._pending.clear()
+                self._silence_run = 0
+            return None
+
+        self._frames.append(data)
+        if is_speech:
+            self._silence_run = 0
+        else:
+            self._silence_run += 1
+        if self._silence_run >= self._hangover_chunks or len(self._frames) >= self._max_chunks:
+            return self._finish()
+        return None
+
+    def flush(self):
+        """Return the utterance in progress, if any, e.g. when recording stops."""
+        if self._in_utterance and self._frames:
+            return self._finish()
+        return None
+
+    def _finish(self):
+        utterance = Utterance(self._start, self._start + len(self._frames), self._frames)
+        self.chunks_emitted += len(self._frames)
+        self._frames = []
+        self._in_utterance = False
+        self._speech_run = 0
+        self._silence_run = 0
+        return utterance
+
+    def _track_recent(self, rms):
+        # Speech has pauses between words, so the quietest recent chunks are background noise
+        self._recent.append(rms)
+        if len(self._recent) == self._recent.maxlen:
+            quiet = sorted(self._recent)[int(self.noise_percentile * (len(self._recent) - 1))]
+            if quiet > self.noise_floor:
+                self.noise_floor = quiet
+
+    def _update_noise_floor(self, rms):
+        # Follow drops in background noise quickly and rises slowly
+        if rms < self.noise_floor:
+            self.noise_floor = (self.noise_floor + rms) / 2
+        else:
+            self.noise_floor += self.noise_adapt * (rms - self.noise_floor)
@@ -3,10 +3,27 @@ import tkinter as tk
 import os
 from tkinter import scrolledtext, filedialog, messagebox, ttk
 from backend import SpeechToTextConverter
+from recognizers import DEFAULT_RECOGNIZER, available_recognizers
 from file_processor import FileProcessor
-from qa_engine import QASystem
+from qa_engine import QASystem, FIXED_RESPONSES, format_sources
+from corpus import Corpus
 from tts_engine import TTSEngine
 from interaction_logger import InteractionLogger
+from clients import default_registry
+from session import SessionEngine
+from playback import BargeInDetector
+from ui_dispatch import UiDispatcher
+from tracing import default_tracer
+
+ALL_DOCUMENTS = "All documents"
+LOADING_DEVICES = "Looking for devices..."
+NO_DEVICES = "No input devices"
+# Latency percentiles and counters, rewritten every minute while the app runs
+METRICS_PATH = "metrics.json"
+# Start answering before the final transcript: unset, "retrieval" or "answer" (costs a model call per miss)
+SPECULATE = os.getenv("SPECULATE") or None
+# Capture preset from capture.PROFILES, e.g. "low_bandwidth" on a slow connection
+CAPTURE_PROFILE = os.getenv("CAPTURE_PROFILE", "default")
 
 class Application(tk.Frame):
     def __init__(self, master=None):
@@ -17,21 +34,65 @@ class Application(tk.Frame):
         self.pack(fill="both", expand=True)
         self.master.grid_rowconfigure(0, weight=1)
         self.master.grid_columnconfigure(0, weight=1)
+        # Worker threads never touch widgets; they post their updates here
+        self.ui = UiDispatcher(self.master)
+        self.ui.register_batch("chat", self._append_chat)
 
-        self.converter = SpeechToTextConverter()
+        self.converter = SpeechToTextConverter(profile=CAPTURE_PROFILE)
         self.file_processor = FileProcessor()
-        self.qa_system = QASystem()
+        # Uploaded documents stay in the corpus across sessions
+        corpus = Corpus(manifest_path=os.path.join(self.file_processor.store.root, "corpus.json"))
+        self.qa_system = QASystem(corpus=corpus)
         self.tts_engine = TTSEngine()
         self.logger = InteractionLogger()
+        # Talking over the answer stops it
+        self.barge_in = BargeInDetector(self.tts_engine.playback)
+        # Answers are generated and spoken on the session's event loop; the next question
+        # is recognized and answered while the previous answer is still playing
+        self.session = SessionEngine(
+            self.converter, self.qa_system, self.tts_engine,
+            on_transcript=self.handle_voice_input,
+            on_answer=self.handle_answer,
+            on_error=self.show_error,
+            speculate=SPECULATE,
+        )
 
         self.is_recording = False
-        self.context_loaded = False
+        self.context_loaded = len(corpus) > 0
         self.final_transcript = ""
-        self.devices = self.converter.get_audio_devices()
-        self.selected_device = tk.StringVar(self)
+        # Filled in by warm_up(); listing devices opens the audio system, which is slow
+        self.devices = []
+        self.selected_device = tk.StringVar(self, value=LOADING_DEVICES)
+        self.selected_recognizer = tk.StringVar(self, value=DEFAULT_RECOGNIZER)
+        self.selected_scope = tk.StringVar(self, value=ALL_DOCUMENTS)
 
         self.create_widgets()
 
+        # Nothing slow happens before the window is drawn; idle callbacks run after the first paint
+        self.master.after_idle(self.warm_up)
+
+    def warm_up(self):
+        """Find audio devices, import the SDKs and connect the services in the background."""
+        def find_devices():
+            self.ui.post(self._set_devices, self.converter.get_audio_devices())
+            try:
+                self.converter.warm_up()
+            except Exception as e:
+                print(f"[DEBUG] Recognizer warm-up failed: {e}")
+
+        threading.Thread(target=find_devices, daemon=True).start()
+        # Connect the shared service channels while the user picks a file
+        default_registry.warm_up()
+        self.tts_engine.warm_up(FIXED_RESPONSES)
+
+    def _set_devices(self, devices):
+        self.devices = devices
+        menu = self.device_menu["menu"]
+        menu.delete(0, "end")
+        for _, name in devices:
+            menu.add_command(label=name, command=tk._setit(self.selected_device, name))
+        self.selected_device.set(devices[0][1] if devices else NO_DEVICES)  # Set default device
+
     def create_widgets(self):
         self.grid(row=0, column=0, sticky="nsew")
         self.grid_rowconfigure(0, weight=1)
@@ -47,10 +108,24 @@ class Application(tk.Frame):
         device_label = tk.Label(right_panel, text="Audio Device:", font=("Arial", 10))
         device_label.pack(pady=(0, 5))
         
-        device_menu = tk.OptionMenu(right_panel, self.selected_device, *[name for _, name in self.devices])
-        device_menu.pack(pady=5)
-        if self.devices:
-            self.selected_device.set(self.devices[0][1]) # Set default device
+        self.device_menu = tk.OptionMenu(right_panel, self.selected_device, LOADING_DEVICES)
+        self.device_menu.pack(pady=5)
+
+        recognizer_label = tk.Label(right_panel, text="Recognizer:", font=("Arial", 10))
+        recognizer_label.pack(pady=(10, 5))
+
+        # Cloud recognition, or an offline model when vosk is installed
+        recognizer_menu = tk.OptionMenu(right_panel, self.selected_recognizer,
+                                        *(available_recognizers() or [DEFAULT_RECOGNIZER]))
+        recognizer_menu.pack(pady=5)
+        self.selected_recognizer.trace_add("write", lambda *args: self.change_recognizer())
+
+        scope_label = tk.Label(right_panel, text="Answer From:", font=("Arial", 10))
+        scope_label.pack(pady=(10, 5))
+
+        self.scope_menu = tk.OptionMenu(right_panel, self.selected_scope, ALL_DOCUMENTS)
+        self.scope_menu.pack(pady=5)
+        self.selected_scope.trace_add("write", lambda *args: self.change_scope())
 
         self.status_label = tk.Label(right_panel, text="Status: Ready", font=("Arial", 10), fg="green")
         self.status_label.pack(pady=10)
@@ -76,12 +151,67 @@ class Application(tk.Frame):
         self.upload_button = tk.Button(button_frame, text="Upload File", command=self.upload_file, font=("Arial", 12))
         self.upload_button.pack(side="left", padx=5)
 
+        self.remove_button = tk.Button(button_frame, text="Remove Document", command=self.remove_document, font=("Arial", 12))
+        self.remove_button.pack(side="left", padx=5)
+
+        self.refresh_documents()
         # Disable record button until context is loaded
-        self.record_button.config(state="disabled")
+        if not self.context_loaded:
+            self.record_button.config(state="disabled")
+
+    def refresh_documents(self):
+        """Rebuild the scope menu from the documents in the corpus."""
+        documents = self.qa_system.corpus.documents()
+        menu = self.scope_menu["menu"]
+        menu.delete(0, "end")
+        for label in [ALL_DOCUMENTS] + [name for _, name in documents]:
+            menu.add_command(label=label, command=tk._setit(self.selected_scope, label))
+        if self.selected_scope.get() not in [name for _, name in documents]:
+            self.selected_scope.set(ALL_DOCUMENTS)
+        self.remove_button.config(state="normal" if documents else "disabled")
+
+    def change_scope(self):
+        name = self.selected_scope.get()
+        doc_ids = [doc_id for doc_id, doc_name in self.qa_system.corpus.documents() if doc_name == name]
+        self.qa_system.set_scope(doc_ids[-1] if doc_ids else None)
+
+    def change_recognizer(self):
+        """Switch recognizer backends; takes effect the next time recording starts."""
+        name = self.selected_recognizer.get()
+        try:
+            self.converter.set_recognizer(name)
+        except Exception as e:
+            messagebox.showerror("Error", f"Cannot use the {name} recognizer: {e}")
+            return
+
+        def warm_up():
+            try:
+                self.converter.warm_up()
+            except Exception as e:
+                self.show_error(f"Cannot use the {name} recognizer: {e}")
+
+        threading.Thread(target=warm_up, daemon=True).start()
+
+    def remove_document(self):
+        """Remove the selected document, or the most recently added one when all are selected."""
+        documents = self.qa_system.corpus.documents()
+        if not documents:
+            return
+        name = self.selected_scope.get()
+        matches = [doc_id for doc_id, doc_name in documents if doc_name == name] or [documents[-1][0]]
+        removed = dict(documents)[matches[-1]]
+        self.qa_system.remove_document(matches[-1])
+        self.refresh_documents()
+        self.update_chat("System", f"Removed {removed}.")
+        if not len(self.qa_system.corpus):
+            self.context_loaded = False
+            if self.is_recording:
+                self.stop_recording()
+            self.record_button.config(state="disabled")
 
     def toggle_recording(self):
         if not self.context_loaded:
-            self.show_error("Please upload a file and wait for processing to finish before recording.")
+            messagebox.showerror("Error", "Please upload a file and wait for processing to finish before recording.")
             return
         if self.is_recording:
             self.stop_recording()
@@ -90,7 +220,7 @@ class Application(tk.Frame):
 
     def start_recording(self):
         if not self.devices:
-            self.show_error("No audio input devices found!")
+            messagebox.showerror("Error", "No audio input devices found!")
             return
             
         self.is_recording = True
@@ -100,26 +230,29 @@ class Application(tk.Frame):
         device_name = self.selected_device.get()
         device_index = [index for index, name in self.devices if name == device_name][0]
         
-        self.transcription_thread = threading.Thread(
-            target=self.converter.start_transcription, 
-            args=(self.handle_voice_input, self.show_error, device_index, self.update_volume)
-        )
-        self.transcription_thread.daemon = True
-        self.transcription_thread.start()
+        self.session.start_listening(device_index, self.update_volume)
 
     def stop_recording(self):
         self.is_recording = False
         self.record_button.config(text="Start Recording", bg="lightblue")
         self.status_label.config(text="Status: Ready", fg="green")
-        self.converter.stop_transcription()
+        self.session.stop_listening()
 
     def handle_voice_input(self, transcript, is_final):
+        # The session engine starts the turn; only the question is shown here
         if is_final and transcript.strip():
             self.update_chat("User", transcript)
-            answer = self.qa_system.answer_question(transcript)
-            self.update_chat("AI", answer)
-            self.logger.log_interaction(transcript, answer)
-            self.tts_engine.speak(answer)
+
+    def handle_answer(self, question, answer, sources, timings, details):
+        self.update_chat("AI", answer)
+        # Citations are shown, not spoken
+        cited = format_sources(sources)
+        if cited:
+            self.update_chat("Sources", cited)
+        # Queued for the logger's writer thread; never waits for the disk
+        self.logger.log_interaction(question, answer, sources=[[name, page] for name, page in sources],
+                                    latency_ms=timings, **details)
+        print(f"[DEBUG] Turn latency (ms): {timings}")
 
     def upload_file(self):
         file_path = filedialog.askopenfilename(
@@ -133,35 +266,60 @@ class Application(tk.Frame):
         self.progress.pack()
         self.progress.start()
         self.status_label.config(text="Status: Processing file...", fg="orange")
-        self.context_loaded = False
 
         def process():
             try:
-                text = self.file_processor.process_file(file_path)
-                self.qa_system.load_context(text)
-                self.context_loaded = True
-                self.update_chat("System", f"Successfully processed {os.path.basename(file_path)}.")
-                self.status_label.config(text="Status: Ready", fg="green")
-                self.record_button.config(state="normal")
+                # Indexing starts on the first pages while later ones are still extracted;
+                # documents seen before come back from the local store
+                document = self.file_processor.load_document(file_path)
+                self.qa_system.load_pages(document.pages, index_dir=document.index_dir,
+                                          doc_id=document.doc_id, name=document.name)
+                self.ui.post(self._upload_finished, file_path, None)
             except Exception as e:
-                self.show_error(f"Failed to process file: {e}")
-                self.status_label.config(text="Status: Ready", fg="green")
-            finally:
-                self.progress.stop()
-                self.progress.pack_forget()
+                self.ui.post(self._upload_finished, file_path, e)
 
         threading.Thread(target=process, daemon=True).start()
 
+    def _upload_finished(self, file_path, error):
+        if error is None:
+            self.context_loaded = True
+            self.refresh_documents()
+            self.update_chat("System", f"Successfully processed {os.path.basename(file_path)}.")
+        else:
+            self.show_error(f"Failed to process file: {error}")
+        self.status_label.config(text="Status: Ready", fg="green")
+        # Documents loaded earlier are still there to ask about
+        if self.context_loaded:
+            self.record_button.config(state="normal")
+        self.progress.stop()
+        self.progress.pack_forget()
+
     def update_chat(self, sender, message):
+        """Append a message to the chat; safe to call from any thread."""
+        self.ui.post_batched("chat", (sender, message))
+
+    def _append_chat(self, messages):
+        # One insert per refresh, however many messages arrived
         self.chat_area.config(state="normal")
-        self.chat_area.insert(tk.END, f"{sender}: {message}\n\n")
+        self.chat_area.insert(tk.END, "".join(f"{sender}: {message}\n\n" for sender, message in messages))
         self.chat_area.config(state="disabled")
         self.chat_area.see(tk.END)
 
     def show_error(self, message):
-        tk.messagebox.showerror("Error", message)
+        """Report an error in the status line and the chat; safe to call from any thread.
+
+        Errors from the audio and answer threads are not shown in a modal dialog, which
+        would hold up recording and playback until dismissed.
+        """
+        self.ui.post(self.status_label.config, {"text": "Status: Error", "fg": "red"})
+        self.update_chat("Error", message)
 
     def update_volume(self, rms):
+        # Barge-in reacts at once on the audio thread; the meter is redrawn at most once per refresh
+        self.barge_in.on_volume(rms)
+        self.ui.post_latest("volume", self._draw_volume, rms)
+
+    def _draw_volume(self, rms):
         normalized_volume = min(rms / 5000, 1.0)
         height = normalized_volume * 200
         self.volume_canvas.coords(self.volume_bar, 0, 200 - height, 50, 200)
@@ -169,6 +327,16 @@ class Application(tk.Frame):
 def main():
     root = tk.Tk()
     app = Application(master=root)
+    default_tracer.start_export(METRICS_PATH)
+
+    def on_close():
+        app.ui.stop()
+        app.session.close()
+        app.logger.close()
+        default_tracer.stop_export()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
     app.mainloop()
 
 if __name__ == '__main__':